@@ -0,0 +1,126 @@
+"""
+Running many methods in parallel over a process pool.
+
+A job names a class, a method and what to do with it: run it on the week 7
+interpreter with the given arguments, analyse it with the week 7 sign
+analysis or explore it with the week 8 concolic engine. Jobs are spread over
+worker processes, every worker loads a class the first time one of its jobs
+needs it and keeps it for the rest of its jobs. Results are yielded as they
+complete, each with the time its job took in the worker.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+import sys
+import time
+
+from dtu02242.jvm.program import LazyJavaProgram
+
+INTERPRET = "interpret"
+ANALYSIS = "analysis"
+CONCOLIC = "concolic"
+
+DEFAULT_ROOT = Path("course-02242-examples/decompiled")
+
+
+@dataclass(frozen=True)
+class Job:
+    class_name: str
+    method_name: str
+    kind: str = INTERPRET
+    # Plain Python arguments as given to wrap, only used by INTERPRET jobs
+    args: Tuple[Any, ...] = ()
+
+
+@dataclass
+class JobResult:
+    job: Job
+    # Position of the job in the list given to run_jobs
+    index: int
+    value: Any = None
+    # str() of what the job raised, the exception class name for Java exceptions
+    error: Optional[str] = None
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        outcome = f"raised {self.error}" if self.error is not None else repr(self.value)
+        return f"{self.job.kind} {self.job.class_name}.{self.job.method_name}{self.job.args}: {outcome} ({self.seconds * 1000:.1f}ms)"
+
+
+# The programs of a worker process, one per engine since every engine has its own JavaClass
+_programs: Dict[str, LazyJavaProgram] = {}
+_root_dir: Path = DEFAULT_ROOT
+
+
+def _init_worker(root_dir: Path) -> None:
+    global _root_dir
+    _root_dir = Path(root_dir)
+    _programs.clear()
+
+
+def _get_program(kind: str) -> LazyJavaProgram:
+    program = _programs.get(kind)
+    if program is None:
+        if kind == INTERPRET:
+            from dtu02242.week_07.parser import JavaClass
+        elif kind == ANALYSIS:
+            from dtu02242.week_07_oliver.parser import JavaClass
+        elif kind == CONCOLIC:
+            from dtu02242.week_08.parser import JavaClass
+        else:
+            raise ValueError(f"Unknown job kind {kind}")
+        program = _programs[kind] = LazyJavaProgram(_root_dir, JavaClass)
+    return program
+
+
+def _execute(job: Job) -> Any:
+    java_class = _get_program(job.kind).get_class(job.class_name)
+    if java_class is None:
+        raise Exception(f"Class {job.class_name} not found in {_root_dir}")
+    if job.kind == INTERPRET:
+        from dtu02242.week_07.data_structures import OutputBuffer, wrap
+        from dtu02242.week_07.interpreter import run_method
+        return run_method(java_class, job.method_name, wrap(list(job.args)), None, OutputBuffer()).get_value()
+    if job.kind == ANALYSIS:
+        from dtu02242.week_07_oliver.analyzer import run_method_analysis
+        return run_method_analysis(java_class, job.method_name)
+    from dtu02242.week_08.concolic import concolic
+    return concolic(java_class, job.method_name)
+
+
+def run_job(job: Job, index: int = 0) -> JobResult:
+    '''Run a single job in this process'''
+    start = time.perf_counter()
+    try:
+        value = _execute(job)
+        error = None
+    except Exception as exception:
+        value = None
+        error = str(exception)
+    return JobResult(job, index, value, error, time.perf_counter() - start)
+
+
+def run_jobs(jobs: Iterable[Job],
+             root_dir: Path = DEFAULT_ROOT,
+             max_workers: Optional[int] = None) -> Iterator[JobResult]:
+    '''Run jobs over a process pool and yield their results in the order they complete'''
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(Path(root_dir),)) as executor:
+        futures = [executor.submit(run_job, job, index) for index, job in enumerate(jobs)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+if __name__ == "__main__":
+    # python -m dtu02242.harness <kind> <class> [<class> ...], runs every method taking no arguments
+    kind = sys.argv[1] if len(sys.argv) > 1 else INTERPRET
+    class_names = sys.argv[2:] or ["dtu/compute/exec/Simple"]
+    program = _get_program(kind)
+    jobs = [Job(class_name, method["name"], kind)
+            for class_name in class_names
+            for method in program.get_class(class_name).json_dict["methods"]
+            if not method["params"] and not method["name"].startswith("<")]
+    start = time.perf_counter()
+    for result in run_jobs(jobs):
+        print(result)
+    print(f"{len(jobs)} jobs in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,43 @@
+"""
+Caches of code derived from the decoded instructions of methods.
+
+A JavaClass decodes the instructions of a method once, everything derived
+from them is derived once more per owner: the register code and the rewritten
+instructions of an interpreter, its blocks and compiled methods, the fused
+superinstructions of a class. A CodeCache keeps what was derived by the id of
+the instructions and a key saying how it was derived. The entries hold on to
+the instructions, so an id is not reused while it is in the cache.
+
+Caches belong to an interpreter or to a JavaClass and go away with it, so
+code that is only run once, like the fresh instructions of a concolic run,
+is not kept around by the process.
+"""
+from typing import Any, Callable, Dict, Hashable, List, Sequence, Tuple, TypeVar
+
+Derived = TypeVar("Derived")
+
+
+class CodeCache:
+    '''Code derived from instructions, by the instructions and a key for how it was derived'''
+    _entries: Dict[Tuple[int, Hashable], Tuple[Sequence[Any], Any]]
+
+    def __init__(self) -> None:
+        self._entries = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, code: Sequence[Any], derive: Callable[[], Derived], key: Hashable = None) -> Derived:
+        '''What derive returns for code, it is only called the first time'''
+        entry = self._entries.get((id(code), key))
+        if entry is None:
+            entry = self._entries[(id(code), key)] = (code, derive())
+        return entry[1]
+
+    def find(self, code: Sequence[Any], key: Hashable = None, default: Any = None) -> Any:
+        '''What was derived from code, default when nothing was yet'''
+        entry = self._entries.get((id(code), key))
+        return entry[1] if entry is not None else default
+
+    def values(self) -> List[Any]:
+        return [entry[1] for entry in self._entries.values()]
@@ -0,0 +1,20 @@
+"""
+Java exceptions raised by the engines, shared by the weeks and by jvm/.
+
+Every week catches the same JavaError, so an exception raised by shared code
+like the heap is caught by the engine of any week.
+"""
+
+
+class JavaError(Exception):
+    '''A Java exception escaping the interpreted program, str() is the exception class name'''
+    def __init__(self, class_name: str):
+        super().__init__(class_name)
+        self.class_name = class_name
+
+
+class IndexOutOfBounds(JavaError):
+    '''An array access out of bounds, str() is the message the engines have always raised it with'''
+    def __init__(self):
+        Exception.__init__(self, "Index out of bounds")
+        self.class_name = "java/lang/ArrayIndexOutOfBoundsException"
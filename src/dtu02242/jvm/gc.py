@@ -0,0 +1,80 @@
+"""
+A mark and sweep collector for the Heap.
+
+The collector does not know how an engine represents its values, it is
+given two functions: roots yields the references held by the engine itself,
+ie. the locals and operand stacks of its frames and its static fields, and
+references yields the references held by an object on the heap. Everything
+that can not be reached from the roots is freed, and its slot is reused by
+later allocations.
+
+A collection runs when threshold allocations have happened since the last
+one, so a program allocating in a loop keeps a bounded heap.
+"""
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List
+import time
+
+from dtu02242.jvm.heap import Heap
+
+DEFAULT_THRESHOLD = 10000
+
+
+@dataclass
+class GCStats:
+    collections: int = 0
+    freed: int = 0
+    live: int = 0
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.collections} collections, {self.freed} objects freed, "
+                f"{self.live} live after the last one, {self.seconds:.3f}s")
+
+
+class MarkSweepCollector:
+    heap: Heap
+    threshold: int
+    stats: GCStats
+
+    def __init__(self, heap: Heap,
+                 roots: Callable[[], Iterable[int]],
+                 references: Callable[[Any], Iterable[int]],
+                 threshold: int = DEFAULT_THRESHOLD) -> None:
+        self.heap = heap
+        self.roots = roots
+        self.references = references
+        self.threshold = threshold
+        self.stats = GCStats()
+        self._last_collection = heap.allocations
+
+    def maybe_collect(self) -> None:
+        '''Collect if threshold allocations happened since the last collection'''
+        if self.heap.allocations - self._last_collection >= self.threshold:
+            self.collect()
+
+    def collect(self) -> int:
+        '''Free every object that is unreachable from the roots, returns the number of objects freed'''
+        start = time.perf_counter()
+        heap = self.heap
+        marked = set()
+        pending: List[int] = [ref for ref in self.roots() if ref in heap]
+        while pending:
+            ref = pending.pop()
+            if ref in marked:
+                continue
+            marked.add(ref)
+            for child in self.references(heap[ref]):
+                if child not in marked and child in heap:
+                    pending.append(child)
+
+        garbage = [ref for ref in heap if ref not in marked]
+        for ref in garbage:
+            heap.free(ref)
+
+        self._last_collection = heap.allocations
+        self.stats.collections += 1
+        self.stats.freed += len(garbage)
+        self.stats.live = len(heap)
+        self.stats.seconds += time.perf_counter() - start
+        return len(garbage)
@@ -0,0 +1,73 @@
+"""
+The heap of a run, objects addressed by dense integer references.
+
+Objects are kept in a list and a reference is the index of its slot, so
+allocating is an append and dereferencing is a list index. Reference 0 is
+null and never holds an object. Slots of freed objects are reused by later
+allocations, so references stay small and a run allocates the same
+references every time it is repeated.
+
+The heap does not care what an object is, the concrete interpreter stores
+its ArrayValues and class names, the concolic engine its ConcolicLists.
+Dereferencing null or a freed reference raises a NullPointerException.
+"""
+from typing import Any, Iterator, List
+
+from dtu02242.jvm.errors import JavaError
+
+NULL = 0
+
+
+class Heap:
+    __slots__ = ("_objects", "_free", "allocations")
+
+    def __init__(self) -> None:
+        self._objects: List[Any] = [None]
+        self._free: List[int] = []
+        # Number of allocations over the lifetime of the heap
+        self.allocations: int = 0
+
+    def allocate(self, obj: Any) -> int:
+        '''Store an object and return its reference'''
+        if obj is None:
+            raise ValueError("None can not be allocated")
+        self.allocations += 1
+        if self._free:
+            ref = self._free.pop()
+            self._objects[ref] = obj
+            return ref
+        self._objects.append(obj)
+        return len(self._objects) - 1
+
+    def free(self, ref: int) -> None:
+        if ref not in self:
+            raise KeyError(ref)
+        self._objects[ref] = None
+        self._free.append(ref)
+
+    def __getitem__(self, ref: int) -> Any:
+        obj = self._objects[ref]
+        if obj is None:
+            raise JavaError("java/lang/NullPointerException")
+        return obj
+
+    def __setitem__(self, ref: int, obj: Any) -> None:
+        if obj is None:
+            raise ValueError("None can not be stored")
+        if self._objects[ref] is None:
+            raise JavaError("java/lang/NullPointerException")
+        self._objects[ref] = obj
+
+    def __contains__(self, ref: Any) -> bool:
+        return type(ref) is int and 0 < ref < len(self._objects) and self._objects[ref] is not None
+
+    def __iter__(self) -> Iterator[int]:
+        '''References of all live objects'''
+        return (ref for ref, obj in enumerate(self._objects) if obj is not None)
+
+    def __len__(self) -> int:
+        return len(self._objects) - 1 - len(self._free)
+
+    def capacity(self) -> int:
+        '''Number of slots, live or free'''
+        return len(self._objects) - 1
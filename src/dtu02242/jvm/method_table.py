@@ -0,0 +1,151 @@
+"""
+Method lookup by name and JVM descriptor, shared by the JavaClass of every week.
+
+A method is found by its name and descriptor, ie. fib (I)I, and the first
+method with a name is also found by the bare name. The table is built the
+first time a method is looked up and misses are stored as None, so looking
+up the same method again is one dictionary hit either way.
+
+Descriptors built from invoke instructions can name the erasure of a generic
+method, ie. (Ljava/lang/Object;)V for a declared (Ljava/lang/Integer;)V. A
+descriptor that misses resolves to the one overload it is an erasure of, any
+other miss is None.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+JsonDict = Dict[str, Any]
+
+BASE_DESCRIPTORS = {
+    "boolean": "Z",
+    "byte": "B",
+    "char": "C",
+    "short": "S",
+    "int": "I",
+    "long": "J",
+    "float": "F",
+    "double": "D",
+}
+
+OBJECT_DESCRIPTOR = "Ljava/lang/Object;"
+
+def type_descriptor(java_type: Any) -> str:
+    '''Get the JVM descriptor of a jvm2json type, either from a method signature or from an invoke instruction'''
+    if java_type is None:
+        return "V"
+    if type(java_type) is str:
+        return BASE_DESCRIPTORS[java_type]
+    if "base" in java_type:
+        return BASE_DESCRIPTORS[java_type["base"]]
+    kind = java_type["kind"]
+    if kind == "array":
+        return "[" + type_descriptor(java_type["type"])
+    if kind == "class":
+        return f"L{java_type['name']};"
+    if kind == "typevar":
+        # Type variables are erased to their bound
+        return f"L{java_type.get('bound') or 'java/lang/Object'};"
+    raise Exception(f"Unknown type {java_type}")
+
+def method_descriptor(args: List[Any], returns: Any) -> str:
+    '''Get the JVM descriptor of a method, ie. (I)I for int fib(int)'''
+    return "(" + "".join(type_descriptor(arg) for arg in args) + ")" + type_descriptor(returns)
+
+def get_method_descriptor(method: JsonDict) -> Optional[str]:
+    '''Get the descriptor of a method declaration, or None if the declaration has no signature'''
+    if "params" not in method or "returns" not in method:
+        return None
+    return method_descriptor([param["type"] for param in method["params"]], method["returns"]["type"])
+
+def get_invoke_descriptor(method_ref: JsonDict) -> str:
+    '''Get the descriptor of the method referenced by an invoke instruction'''
+    return method_descriptor(method_ref["args"], method_ref["returns"])
+
+def split_descriptor(descriptor: str) -> Tuple[List[str], str]:
+    '''The parameter types and the return type of a method descriptor, ie. [I] and I for (I)I'''
+    end = descriptor.index(")")
+    params = []
+    position = 1
+    while position < end:
+        start = position
+        while descriptor[position] == "[":
+            position += 1
+        if descriptor[position] == "L":
+            position = descriptor.index(";", position)
+        position += 1
+        params.append(descriptor[start:position])
+    return params, descriptor[end + 1:]
+
+def is_erased_type(erased: str, declared: str) -> bool:
+    if erased == declared:
+        return True
+    if erased[0] == "[" and declared[0] == "[":
+        return is_erased_type(erased[1:], declared[1:])
+    return erased[0] == "L" and declared[0] == "L" and OBJECT_DESCRIPTOR in (erased, declared)
+
+def is_erasure(descriptor: str, declared: Optional[str]) -> bool:
+    '''Whether two descriptors differ only in reference types one of them has as Object'''
+    if declared is None:
+        return False
+    (erased_params, erased_returns), (declared_params, declared_returns) = split_descriptor(descriptor), split_descriptor(declared)
+    return (len(erased_params) == len(declared_params)
+            and all(is_erased_type(erased, declared) for erased, declared in zip(erased_params, declared_params))
+            and is_erased_type(erased_returns, declared_returns))
+
+class MethodTable:
+    '''
+    Mixin looking up the methods of a class by name and descriptor. Classes
+    using it have get_methods, and can override get_method_signatures and
+    load_method to find a method without decoding all of them.
+    '''
+    _method_table: Optional[Dict[Tuple[str, Optional[str]], Optional[int]]] = None
+    _signatures: List[Tuple[str, Optional[str]]]
+    _overloads: Dict[str, List[int]]
+
+    def get_methods(self) -> List[JsonDict]:
+        raise NotImplementedError
+
+    def get_method_signatures(self) -> List[Tuple[str, Optional[str]]]:
+        '''Name and descriptor of every method, in the order of get_methods'''
+        return [(method["name"], get_method_descriptor(method)) for method in self.get_methods()]
+
+    def load_method(self, position: int) -> JsonDict:
+        return self.get_methods()[position]
+
+    def _build_method_table(self) -> Dict[Tuple[str, Optional[str]], Optional[int]]:
+        # Every method is reachable by its name and descriptor, and the first
+        # method with a given name is also reachable by its bare name.
+        method_table: Dict[Tuple[str, Optional[str]], Optional[int]] = {}
+        self._signatures = self.get_method_signatures()
+        self._overloads = {}
+        for position, (name, descriptor) in enumerate(self._signatures):
+            self._overloads.setdefault(name, []).append(position)
+            method_table.setdefault((name, None), position)
+            if descriptor is not None:
+                method_table[(name, descriptor)] = position
+        return method_table
+
+    def _resolve_method(self, name: str, descriptor: Optional[str]) -> Optional[int]:
+        # Bare names are all in the table, only an erased descriptor can still match
+        if descriptor is None:
+            return None
+        matches = [position for position in self._overloads.get(name, [])
+                   if is_erasure(descriptor, self._signatures[position][1])]
+        return matches[0] if len(matches) == 1 else None
+
+    def find_method(self, name: str, descriptor: Optional[str] = None) -> Optional[JsonDict]:
+        '''Look up a method by name and optionally by descriptor, misses are remembered as None'''
+        if self._method_table is None:
+            self._method_table = self._build_method_table()
+        key = (name, descriptor)
+        try:
+            position = self._method_table[key]
+        except KeyError:
+            position = self._method_table[key] = self._resolve_method(name, descriptor)
+        return self.load_method(position) if position is not None else None
+
+    def get_method(self, name: str, descriptor: Optional[str] = None) -> JsonDict:
+        '''Like find_method, but a method that is not there raises'''
+        method = self.find_method(name, descriptor)
+        if method is None:
+            raise Exception(f"Method {name} not found in {self}")
+        return method
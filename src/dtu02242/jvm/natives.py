@@ -0,0 +1,171 @@
+"""
+Native methods, library methods implemented in Python.
+
+The decompiled examples only contain the classes of the course, calls into
+the Java standard library have nothing to execute. A NativeRegistry maps the
+owner class, name and descriptor of such a method to a Python function, which
+the engines resolve once per call site.
+
+A native is called with the runner executing it and the plain Python values
+of its arguments, the receiver first for instance methods, and returns the
+plain Python value of its result, or None for void methods. Wrapping the
+values is left to the engine, so the same natives serve every engine.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import math
+
+NativeMethod = Callable[[Any, List[Any]], Any]
+
+# jvm2json method return types to the type names values are tagged with
+RETURN_TYPES = {
+    "int": "integer",
+    "short": "integer",
+    "byte": "integer",
+    "char": "integer",
+    "boolean": "integer",
+    "long": "long",
+    "float": "float",
+    "double": "double",
+}
+
+# Classes the natives model as plain values instead of objects on the heap,
+# strings are the Python strings pushed by the string constants and boxing
+# is not modelled, a boxed integer is the integer itself
+VALUE_CLASSES = {
+    "java/lang/String": "string",
+    "java/lang/Integer": "integer",
+    "java/lang/Long": "long",
+    "java/lang/Boolean": "integer",
+}
+
+
+def get_class_type(type_json: Dict[str, Any]) -> str:
+    '''Type name of a value of a jvm2json class or array type, ref unless the class is in VALUE_CLASSES'''
+    if type_json.get("kind") == "class":
+        return VALUE_CLASSES.get(type_json["name"], "ref")
+    return "ref"
+
+
+def get_return_type(returns: Any) -> Optional[str]:
+    '''Type name for the result of an invoked method, None for void methods'''
+    if returns is None:
+        return None
+    if type(returns) is str:
+        return RETURN_TYPES.get(returns, returns)
+    return get_class_type(returns)
+
+
+def get_value_type(type_json: Optional[Dict[str, Any]]) -> str:
+    '''Type name of a Value holding a value of a jvm2json type, as found in method signatures'''
+    if type_json is None:
+        return "void"
+    if "base" in type_json:
+        return RETURN_TYPES.get(type_json["base"], type_json["base"])
+    return get_class_type(type_json)
+
+
+class NativeRegistry:
+    '''
+    Native methods keyed by owner class, name and descriptor. A native
+    registered without a descriptor serves every overload of the method that
+    has not been registered on its own.
+    '''
+    _natives: Dict[Tuple[str, str, Optional[str]], NativeMethod]
+
+    def __init__(self, natives: Optional[Dict[Tuple[str, str, Optional[str]], NativeMethod]] = None) -> None:
+        self._natives = dict(natives) if natives is not None else {}
+
+    def register(self, owner: str, name: str, descriptor: Optional[str] = None,
+                 function: Optional[NativeMethod] = None):
+        '''Register a native, can also be used as a decorator when function is left out'''
+        if function is None:
+            def decorator(function: NativeMethod) -> NativeMethod:
+                self._natives[(owner, name, descriptor)] = function
+                return function
+            return decorator
+        self._natives[(owner, name, descriptor)] = function
+        return function
+
+    def lookup(self, owner: str, name: str, descriptor: Optional[str] = None) -> Optional[NativeMethod]:
+        native = self._natives.get((owner, name, descriptor))
+        if native is None and descriptor is not None:
+            native = self._natives.get((owner, name, None))
+        return native
+
+    def copy(self) -> 'NativeRegistry':
+        '''A registry with the same natives, registering on it leaves this one untouched'''
+        return NativeRegistry(self._natives)
+
+    def __contains__(self, key: Tuple[str, str, Optional[str]]) -> bool:
+        return self.lookup(*key) is not None
+
+    def __len__(self) -> int:
+        return len(self._natives)
+
+
+def _to_string(value: Any) -> str:
+    if type(value) is bool:
+        return "true" if value else "false"
+    if type(value) is float:
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "Infinity" if value > 0 else "-Infinity"
+    if value is None:
+        return "null"
+    return str(value)
+
+
+def _wrap(value: int, bits: int) -> int:
+    '''Wrap an integer to a signed two's complement integer of the given width'''
+    half = 1 << (bits - 1)
+    return (value + half) % (1 << bits) - half
+
+
+def _print(runner: Any, args: List[Any]) -> None:
+    # args[0] is the PrintStream itself
+    text = "".join(_to_string(arg) for arg in args[1:])
+    runner.stdout.push(text)
+
+
+def _println(runner: Any, args: List[Any]) -> None:
+    _print(runner, args + ["\n"])
+
+
+def _nothing(runner: Any, args: List[Any]) -> None:
+    return None
+
+
+DEFAULT_NATIVES = NativeRegistry()
+
+for _owner in ("java/lang/Object", "java/lang/Throwable", "java/lang/Exception",
+               "java/lang/Error", "java/lang/RuntimeException", "java/lang/AssertionError",
+               "java/lang/IllegalArgumentException", "java/lang/IllegalStateException",
+               "java/lang/ArithmeticException", "java/lang/NullPointerException",
+               "java/lang/UnsupportedOperationException"):
+    DEFAULT_NATIVES.register(_owner, "<init>", function=_nothing)
+
+DEFAULT_NATIVES.register("java/io/PrintStream", "print", function=_print)
+DEFAULT_NATIVES.register("java/io/PrintStream", "println", function=_println)
+
+DEFAULT_NATIVES.register("java/lang/Math", "abs", function=lambda runner, args: abs(args[0]))
+# The absolute value of the smallest int and long overflows back to itself
+DEFAULT_NATIVES.register("java/lang/Math", "abs", "(I)I", function=lambda runner, args: _wrap(abs(args[0]), 32))
+DEFAULT_NATIVES.register("java/lang/Math", "abs", "(J)J", function=lambda runner, args: _wrap(abs(args[0]), 64))
+DEFAULT_NATIVES.register("java/lang/Math", "min", function=lambda runner, args: min(args[0], args[1]))
+DEFAULT_NATIVES.register("java/lang/Math", "max", function=lambda runner, args: max(args[0], args[1]))
+DEFAULT_NATIVES.register("java/lang/Math", "sqrt", function=lambda runner, args: math.sqrt(args[0]) if args[0] >= 0 else math.nan)
+
+# Boxing is not modelled, see VALUE_CLASSES
+DEFAULT_NATIVES.register("java/lang/Integer", "valueOf", "(I)Ljava/lang/Integer;", function=lambda runner, args: args[0])
+DEFAULT_NATIVES.register("java/lang/Integer", "intValue", function=lambda runner, args: args[0])
+DEFAULT_NATIVES.register("java/lang/Integer", "parseInt", "(Ljava/lang/String;)I", function=lambda runner, args: int(args[0]))
+DEFAULT_NATIVES.register("java/lang/Integer", "toString", "(I)Ljava/lang/String;", function=lambda runner, args: str(args[0]))
+DEFAULT_NATIVES.register("java/lang/Integer", "compare", function=lambda runner, args: (args[0] > args[1]) - (args[0] < args[1]))
+DEFAULT_NATIVES.register("java/lang/Long", "valueOf", "(J)Ljava/lang/Long;", function=lambda runner, args: args[0])
+DEFAULT_NATIVES.register("java/lang/Long", "longValue", function=lambda runner, args: args[0])
+DEFAULT_NATIVES.register("java/lang/Boolean", "valueOf", "(Z)Ljava/lang/Boolean;", function=lambda runner, args: args[0])
+DEFAULT_NATIVES.register("java/lang/Boolean", "booleanValue", function=lambda runner, args: args[0])
+
+DEFAULT_NATIVES.register("java/lang/String", "length", function=lambda runner, args: len(args[0]))
+DEFAULT_NATIVES.register("java/lang/String", "valueOf", function=lambda runner, args: _to_string(args[0]))
@@ -0,0 +1,64 @@
+"""
+Integer opcodes for the jvm2json instruction set.
+
+An instruction is named the way the engines dispatch on it, the opr followed
+by its operant or condition when it has one, ie. "push", "binary-add" or
+"ifz-ne". Every name gets a small integer at decode time, so that engines
+can dispatch with a list index instead of building and hashing the name for
+every executed instruction.
+"""
+from typing import Any, Callable, Dict, List
+
+OPCODE_NAMES = (
+    "unknown",
+    # stack and locals
+    "nop", "push", "pop", "dup", "swap", "load", "store", "incr",
+    # arithmetic
+    "binary-add", "binary-sub", "binary-mul", "binary-div", "binary-rem",
+    "bitopr-and", "bitopr-or", "bitopr-xor", "bitopr-shl", "bitopr-shr", "bitopr-ushr",
+    "negate", "cast", "comparefloating", "comparelongs",
+    # control flow
+    "if-eq", "if-ne", "if-lt", "if-le", "if-gt", "if-ge", "if-is", "if-isnot",
+    "ifz-eq", "ifz-ne", "ifz-lt", "ifz-le", "ifz-gt", "ifz-ge", "ifz-is", "ifz-isnot",
+    "goto", "tableswitch", "lookupswitch", "return", "throw", "invoke",
+    # objects and arrays
+    "new", "checkcast", "instanceof", "get", "put",
+    "newarray", "array_load", "array_store", "arraylength",
+    "monitorenter", "monitorexit",
+    # superinstructions, the instructions fused are joined by +, see superinstructions.py
+    "load+load+if", "load+load+binary", "load+push+binary", "load+ifz",
+    "push+store", "dup+push+push+array_store",
+    # quickened, int only variants an instruction is rewritten into, see week_07/quickening.py
+    "int-add", "int-sub", "int-mul",
+    "int-if-lt", "int-if-le", "int-if-gt", "int-if-ge", "int-ifz-le", "int-ifz-ne",
+    "int-incr", "int-array_load", "int-array_store",
+    # register code, see registers.py
+    "enter", "move",
+)
+
+OPCODES: Dict[str, int] = {name: opcode for opcode, name in enumerate(OPCODE_NAMES)}
+
+UNKNOWN = OPCODES["unknown"]
+
+
+def get_instruction_name(opr: str, operant: str | None = None, condition: str | None = None) -> str:
+    '''Name of an instruction as used by the engines, ie. binary-add'''
+    if operant:
+        return f"{opr}-{operant}"
+    if condition:
+        return f"{opr}-{condition}"
+    return opr
+
+
+def get_opcode(name: str) -> int:
+    '''Opcode of an instruction name, instructions no engine knows about are UNKNOWN'''
+    return OPCODES.get(name, UNKNOWN)
+
+
+def build_dispatch_table(method_mapper: Dict[str, Callable[..., Any]],
+                         unknown: Callable[..., Any]) -> List[Callable[..., Any]]:
+    '''Turn a name to handler mapping into a list of handlers indexed by opcode'''
+    handlers = [unknown] * len(OPCODE_NAMES)
+    for name, handler in method_mapper.items():
+        handlers[OPCODES[name]] = handler
+    return handlers
@@ -0,0 +1,111 @@
+"""
+Output sinks, where the text printed by interpreted programs goes.
+
+Every run writes to a sink of its own, the print natives push their text onto
+runner.stdout. A CaptureSink keeps the text as a list of chunks and joins them
+when it is read, so a long run does not copy what it printed so far on every
+print. A DiscardSink drops the text and a FileSink buffers it and writes it to
+a file once flush_threshold bytes are pending, on flush and on close. The
+interpreter flushes its sink at the end of every run. Printing to the console
+like a JVM does is a FileSink on sys.stdout.
+
+All sinks count the bytes written to them, as UTF-8.
+"""
+from typing import IO, List, Optional
+import os
+
+# Bytes a FileSink buffers before writing them out
+DEFAULT_FLUSH_THRESHOLD = 1 << 16
+
+
+class OutputSink:
+    bytes_written: int
+
+    def __init__(self) -> None:
+        self.bytes_written = 0
+
+    def push(self, text: str) -> None:
+        self.bytes_written += len(text.encode("utf-8"))
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> 'OutputSink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class CaptureSink(OutputSink):
+    '''Keeps everything written to it, getvalue returns it as one string'''
+    chunks: List[str]
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.chunks = []
+
+    def push(self, text: str) -> None:
+        self.bytes_written += len(text.encode("utf-8"))
+        self.chunks.append(text)
+
+    def getvalue(self) -> str:
+        chunks = self.chunks
+        if len(chunks) > 1:
+            # Joined once, reading again only joins what was written since
+            chunks[:] = ["".join(chunks)]
+        return chunks[0] if chunks else ""
+
+    @property
+    def buffer(self) -> str:
+        return self.getvalue()
+
+
+class DiscardSink(OutputSink):
+    '''Only counts the bytes written to it'''
+
+
+class FileSink(OutputSink):
+    '''
+    Writes to a file, given as a path or as a file object opened for text.
+    Files opened from a path are closed with the sink, file objects are left
+    open.
+    '''
+    file: IO[str]
+    flush_threshold: int
+    pending: List[str]
+    pending_bytes: int
+
+    def __init__(self, file: IO[str] | str | os.PathLike, flush_threshold: int = DEFAULT_FLUSH_THRESHOLD) -> None:
+        super().__init__()
+        self._owned: Optional[IO[str]] = None
+        if isinstance(file, (str, os.PathLike)):
+            file = self._owned = open(file, "w", encoding="utf-8")
+        self.file = file
+        self.flush_threshold = flush_threshold
+        self.pending = []
+        self.pending_bytes = 0
+
+    def push(self, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        self.bytes_written += size
+        self.pending.append(text)
+        self.pending_bytes += size
+        if self.pending_bytes >= self.flush_threshold:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.pending:
+            self.file.write("".join(self.pending))
+            self.pending.clear()
+            self.pending_bytes = 0
+        self.file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self._owned is not None:
+            self._owned.close()
+            self._owned = None
@@ -0,0 +1,89 @@
+"""
+Execution profiles of the engines.
+
+An engine with a Profile runs a separate profiling dispatch loop that times
+every instruction and records it here, engines without one keep their plain
+loop and pay nothing. Counts and time are accumulated per opcode, per method
+and per instruction (method and pc), and per call stack for flame graphs.
+
+to_json gives a dict ready for json.dump, collapsed_stacks the collapsed
+stack format read by flamegraph.pl, speedscope and similar tools: one line
+per call stack ending in the opcode executed, weighted in microseconds.
+"""
+from typing import Any, Dict, List, Tuple
+import json
+
+# Executions and seconds
+Entry = List[float]
+
+
+class Profile:
+    opcodes: Dict[str, Entry]
+    methods: Dict[str, Entry]
+    instructions: Dict[Tuple[str, int], Entry]
+    stacks: Dict[Tuple[str, ...], Entry]
+
+    def __init__(self) -> None:
+        self.opcodes = {}
+        self.methods = {}
+        self.instructions = {}
+        self.stacks = {}
+
+    def record(self, call_stack: Tuple[str, ...], pc: int, opcode_name: str, seconds: float) -> None:
+        '''Record one execution of the instruction at pc of the innermost method of call_stack'''
+        method_name = call_stack[-1]
+        for table, key in ((self.opcodes, opcode_name),
+                           (self.methods, method_name),
+                           (self.instructions, (method_name, pc)),
+                           (self.stacks, call_stack + (opcode_name,))):
+            entry = table.get(key)
+            if entry is None:
+                table[key] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+
+    def get_instruction_counts(self, method_name: str) -> Dict[int, int]:
+        '''Executions of the instructions of a method by pc'''
+        return {pc: int(count) for (name, pc), (count, _) in self.instructions.items() if name == method_name}
+
+    def total_seconds(self) -> float:
+        return sum(seconds for _, seconds in self.opcodes.values())
+
+    def total_executions(self) -> int:
+        return int(sum(count for count, _ in self.opcodes.values()))
+
+    def to_json(self) -> Dict[str, Any]:
+        def rows(table: Dict[Any, Entry], key_names: Tuple[str, ...]) -> List[Dict[str, Any]]:
+            result = []
+            for key, (count, seconds) in sorted(table.items(), key=lambda item: -item[1][1]):
+                key = key if type(key) is tuple else (key,)
+                result.append({**dict(zip(key_names, key)), "count": int(count), "seconds": seconds})
+            return result
+        return {
+            "total_seconds": self.total_seconds(),
+            "total_executions": self.total_executions(),
+            "opcodes": rows(self.opcodes, ("opcode",)),
+            "methods": rows(self.methods, ("method",)),
+            "instructions": rows(self.instructions, ("method", "pc")),
+        }
+
+    def dump_json(self, path: str) -> None:
+        with open(path, "w") as fp:
+            json.dump(self.to_json(), fp, indent=2)
+
+    def collapsed_stacks(self) -> str:
+        lines = []
+        for stack, (_, seconds) in sorted(self.stacks.items()):
+            lines.append(f"{';'.join(stack)} {max(1, round(seconds * 1e6))}")
+        return "\n".join(lines) + "\n"
+
+    def dump_collapsed_stacks(self, path: str) -> None:
+        with open(path, "w") as fp:
+            fp.write(self.collapsed_stacks())
+
+    def __str__(self) -> str:
+        lines = [f"{self.total_executions()} instructions in {self.total_seconds():.3f}s"]
+        for opcode_name, (count, seconds) in sorted(self.opcodes.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{opcode_name:>16} {int(count):>10} {seconds:.4f}s")
+        return "\n".join(lines)
@@ -0,0 +1,82 @@
+"""
+A JavaProgram over a decompiled directory tree, loaded on demand.
+
+Only the file names are read up front, a class is parsed the first time
+get_class asks for it. Every week has its own JavaClass, the one to parse
+into is given as java_class_type, so the same program serves the engines of
+every week.
+
+At most max_classes parsed classes are kept around, the least recently used
+one is dropped first. A class that is dropped takes the instructions decoded
+from it along, so a class asked for again is parsed and decoded again.
+max_classes should cover the classes a run keeps coming back to.
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Type
+import json
+import os
+
+
+def index_class_files(root_dir: Path, file_type: str = "json") -> Dict[str, Path]:
+    '''
+    Map the name of every class under a decompiled root directory to its file,
+    ie. dtu/compute/exec/Calls -> root_dir/dtu/compute/exec/Calls.json.
+    Only directory entries are read, none of the files are opened.
+    '''
+    suffix = f".{file_type}"
+    class_paths: Dict[str, Path] = {}
+    for dir_path, _, file_names in os.walk(root_dir):
+        relative_dir = os.path.relpath(dir_path, root_dir)
+        for file_name in file_names:
+            if not file_name.endswith(suffix):
+                continue
+            class_name = file_name[:-len(suffix)]
+            if relative_dir != os.curdir:
+                class_name = f"{relative_dir}/{class_name}".replace(os.sep, "/")
+            class_paths[class_name] = Path(dir_path) / file_name
+    return class_paths
+
+
+class LazyJavaProgram:
+    '''A JavaProgram parsing the classes of a decompiled directory tree when they are first used'''
+    _java_classes: 'OrderedDict[str, Any]'
+    _class_paths: Dict[str, Path]
+
+    def __init__(self, root_dir: Path, java_class_type: Type[Any], max_classes: int = 1024) -> None:
+        self._root_dir = Path(root_dir)
+        self._class_paths = index_class_files(self._root_dir)
+        self._java_classes = OrderedDict()
+        self._max_classes = max_classes
+        self._java_class_type = java_class_type
+
+    def get_class(self, class_name: str) -> Optional[Any]:
+        java_class = self._java_classes.get(class_name)
+        if java_class is not None:
+            self._java_classes.move_to_end(class_name)
+            return java_class
+        path = self._class_paths.get(class_name)
+        if path is None:
+            return None
+        java_class = self.load_class(path)
+        self._java_classes[class_name] = java_class
+        if len(self._java_classes) > self._max_classes:
+            self._java_classes.popitem(last=False)
+        return java_class
+
+    def load_class(self, path: Path) -> Any:
+        '''Parse the class stored at the given path'''
+        with open(path, "rb") as fp:
+            return self._java_class_type(json.load(fp))
+
+    def get_class_names(self) -> List[str]:
+        return list(self._class_paths)
+
+    def __contains__(self, class_name: str) -> bool:
+        return class_name in self._class_paths
+
+    def __len__(self) -> int:
+        return len(self._class_paths)
+
+    def __str__(self) -> str:
+        return f"LazyJavaProgram({self._root_dir}, {len(self._java_classes)}/{len(self._class_paths)} loaded)"
@@ -0,0 +1,285 @@
+"""
+Register code, the stack based instructions of a method translated into
+three address instructions on numbered registers.
+
+The first max_locals registers are the locals of the method, the next
+max_stack ones hold the values of the operand stack by their depth, and
+every push gets a register holding its constant after those. An instruction
+reads the registers in sources and writes its result to dest, ie.
+binary-add with sources (1, 2) and dest 5 is r5 = r1 + r2, and if-lt with
+sources (0, 6) jumps to target when r0 < r6.
+
+translate keeps a symbolic operand stack within every basic block, loads,
+pushes, dups and pops only change which registers it refers to and emit
+nothing. A store becomes a move, or changes the dest of the instruction
+computing the value right before it. At the end of a block the values left
+on the stack are moved into the registers of their depth, so every block
+starts with the same registers whatever path reached it. The stack
+depth of every instruction comes from its stack effect and is checked
+against the frames of the stack map. Targets are indexes into the register
+code, which starts with an enter instruction that gives the frame
+register_count registers and sets the constants.
+
+Register instructions keep the decoded stack instruction they were
+translated from, attributes they do not have themselves are looked up on
+it. An engine can execute any register instruction with the handler of its
+stack instruction: push the sources, run the handler, pop the result into
+dest. Running this module counts the instructions before and after the
+translation over the decompiled examples:
+
+    python -m dtu02242.jvm.registers [<root>]
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import sys
+
+from dtu02242.jvm.opcodes import get_instruction_name, get_opcode
+
+# Instructions after which the next one is not executed
+NO_FALL_THROUGH = ("goto", "return", "throw", "tableswitch", "lookupswitch")
+
+# Instructions ending a basic block
+BLOCK_ENDS = ("if", "ifz") + NO_FALL_THROUGH
+
+# Stack depth at the start of a stack map frame, frames not listed keep the stack empty
+FRAME_DEPTHS = {"same_locals_1_stack_item_frame": 1, "same_locals_1_stack_item_frame_extended": 1}
+
+
+class RegisterInstruction:
+    __slots__ = ("name", "opr", "opcode", "dest", "sources", "target", "instruction", "register_count", "constants")
+
+    def __init__(self, name: str, dest: Optional[int], sources: Tuple[int, ...], target: Optional[int], instruction: Any):
+        self.name = name
+        self.opr = name.split("-", 1)[0]
+        self.opcode = get_opcode(name)
+        self.dest = dest
+        self.sources = sources
+        self.target = target
+        self.instruction = instruction
+        # Only set for enter, the number of registers and the push instructions of the constant registers
+        self.register_count = 0
+        self.constants: Tuple[Tuple[int, Any], ...] = ()
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "instruction":
+            raise AttributeError(name)
+        return getattr(self.instruction, name)
+
+    def get_name(self) -> str:
+        return self.name
+
+    def __repr__(self) -> str:
+        sources = ", ".join(f"r{source}" for source in self.sources)
+        target = f" goto {self.target}" if self.target is not None else ""
+        dest = f"r{self.dest} = " if self.dest is not None else ""
+        return f"{dest}{self.name}({sources}){target}"
+
+
+def get_stack_effect(bytecode: Dict[str, Any]) -> Tuple[int, int]:
+    '''The number of values a jvm2json instruction pops and pushes'''
+    opr = bytecode["opr"]
+    if opr in ("push", "load", "new"):
+        return 0, 1
+    if opr in ("incr", "goto", "nop"):
+        return 0, 0
+    if opr in ("store", "ifz", "throw", "monitorenter", "monitorexit"):
+        return 1, 0
+    if opr in ("binary", "bitopr", "comparefloating", "comparelongs", "array_load"):
+        return 2, 1
+    if opr in ("negate", "cast", "checkcast", "instanceof", "arraylength"):
+        return 1, 1
+    if opr == "if":
+        return 2, 0
+    if opr == "array_store":
+        return 3, 0
+    if opr == "newarray":
+        return bytecode.get("dim", 1), 1
+    if opr == "return":
+        return (1 if bytecode.get("type") is not None else 0), 0
+    if opr == "get":
+        return (0 if bytecode.get("static") else 1), 1
+    if opr == "put":
+        return (1 if bytecode.get("static") else 2), 0
+    if opr == "invoke":
+        method = bytecode["method"]
+        # Instance methods take the receiver first, invokedynamic has none
+        return len(method["args"]) + (bytecode.get("access") not in ("static", "dynamic")), int(method["returns"] is not None)
+    if opr in ("dup", "pop") and bytecode.get("words", 1) == 1:
+        return (1, 2) if opr == "dup" else (1, 0)
+    raise NotImplementedError(f"{get_instruction_name(opr, bytecode.get('operant'), bytecode.get('condition'))} has no register form")
+
+
+def get_depths(bytecode: List[Dict[str, Any]], stack_map: Sequence[Dict[str, Any]] = ()) -> List[Optional[int]]:
+    '''Stack depth before every instruction, None for the ones that are never reached'''
+    depths: List[Optional[int]] = [None] * len(bytecode)
+    depths[0] = 0
+    work = [0]
+    while work:
+        pc = work.pop()
+        pops, pushes = get_stack_effect(bytecode[pc])
+        depth = depths[pc] - pops + pushes
+        if depth < 0:
+            raise Exception(f"Stack underflow at {pc}")
+        successors = []
+        if "target" in bytecode[pc]:
+            successors.append(bytecode[pc]["target"])
+        if bytecode[pc]["opr"] not in NO_FALL_THROUGH and pc + 1 < len(bytecode):
+            successors.append(pc + 1)
+        for successor in successors:
+            if depths[successor] is None:
+                depths[successor] = depth
+                work.append(successor)
+            elif depths[successor] != depth:
+                raise Exception(f"Stack depth {depth} and {depths[successor]} meet at {successor}")
+    for frame in stack_map:
+        depth = depths[frame["index"]] if frame["index"] < len(depths) else None
+        if depth is not None and depth != FRAME_DEPTHS.get(frame["type"], 0):
+            raise Exception(f"Stack depth {depth} at {frame['index']} does not match its {frame['type']}")
+    return depths
+
+
+def get_leaders(bytecode: List[Dict[str, Any]]) -> List[int]:
+    '''First instructions of the basic blocks'''
+    leaders = {0}
+    for pc, instruction in enumerate(bytecode):
+        if "target" in instruction:
+            leaders.add(instruction["target"])
+        if instruction["opr"] in BLOCK_ENDS:
+            leaders.add(pc + 1)
+    return sorted(pc for pc in leaders if pc < len(bytecode))
+
+
+class Translator:
+    # The register code so far, with the targets still pointing at stack instructions
+    instructions: List[RegisterInstruction]
+    # The registers holding the values on the operand stack, bottom first
+    stack: List[int]
+
+    def __init__(self, code: Sequence[Any], method_code: Dict[str, Any]):
+        self.code = code
+        self.bytecode: List[Dict[str, Any]] = method_code["bytecode"]
+        self.depths = get_depths(self.bytecode, method_code.get("stack_map") or ())
+        # Class files always have max_stack and max_locals, they are derived for code that has not
+        max_stack = max([depth - pops + pushes
+                         for depth, (pops, pushes) in zip(self.depths, map(get_stack_effect, self.bytecode))
+                         if depth is not None] + [0])
+        max_locals = 1 + max([instruction.get("index", -1) for instruction in self.bytecode] + [-1])
+        self.max_stack = max(method_code.get("max_stack") or 0, max_stack)
+        self.max_locals = max(method_code.get("max_locals") or 0, max_locals)
+        self.constants: List[Tuple[int, Any]] = []
+        self.instructions = []
+        self.stack = []
+        self.block_start = 0
+
+    def get_stack_register(self, depth: int) -> int:
+        return self.max_locals + depth
+
+    def emit(self, name: str, dest: Optional[int], sources: Tuple[int, ...], pc: int, target: Optional[int] = None) -> None:
+        self.instructions.append(RegisterInstruction(name, dest, sources, target, self.code[pc]))
+
+    def pop(self, count: int) -> Tuple[int, ...]:
+        sources = tuple(self.stack[len(self.stack) - count:])
+        del self.stack[len(self.stack) - count:]
+        return sources
+
+    def spill(self, register: int, pc: int) -> None:
+        '''Move the values on the stack read from a register before it is written'''
+        for depth, source in enumerate(self.stack):
+            if source == register:
+                self.emit("move", self.get_stack_register(depth), (register,), pc)
+                self.stack[depth] = self.get_stack_register(depth)
+
+    def materialize(self, pc: int) -> None:
+        '''Move the values on the stack into the registers of their depth'''
+        for depth, source in enumerate(self.stack):
+            if source != self.get_stack_register(depth):
+                self.emit("move", self.get_stack_register(depth), (source,), pc)
+                self.stack[depth] = self.get_stack_register(depth)
+
+    def translate_instruction(self, pc: int) -> None:
+        bytecode = self.bytecode[pc]
+        opr = bytecode["opr"]
+        name = get_instruction_name(opr, bytecode.get("operant"), bytecode.get("condition"))
+        if opr == "push":
+            register = self.max_locals + self.max_stack + len(self.constants)
+            self.constants.append((register, self.code[pc]))
+            self.stack.append(register)
+        elif opr == "load":
+            self.stack.append(bytecode["index"])
+        elif opr == "dup":
+            self.stack.append(self.stack[-1])
+        elif opr == "pop":
+            self.stack.pop()
+        elif opr == "store":
+            source, = self.pop(1)
+            self.spill(bytecode["index"], pc)
+            last = self.instructions[-1] if len(self.instructions) > self.block_start else None
+            if last is not None and last.dest == source and source >= self.max_locals and source not in self.stack:
+                # The value was computed right before, compute it into the local instead
+                last.dest = bytecode["index"]
+            elif source != bytecode["index"]:
+                self.emit("move", bytecode["index"], (source,), pc)
+        elif opr == "incr":
+            self.spill(bytecode["index"], pc)
+            self.emit(name, bytecode["index"], (bytecode["index"],), pc)
+        else:
+            pops, pushes = get_stack_effect(bytecode)
+            sources = self.pop(pops)
+            if opr in ("if", "ifz", "goto"):
+                self.materialize(pc)
+            dest = self.get_stack_register(len(self.stack)) if pushes else None
+            self.emit(name, dest, sources, pc, bytecode.get("target"))
+            if pushes:
+                self.stack.append(dest)
+
+    def translate(self) -> Tuple[RegisterInstruction, ...]:
+        leaders = get_leaders(self.bytecode)
+        enter = RegisterInstruction("enter", None, (), None, None)
+        self.instructions.append(enter)
+        labels: Dict[int, int] = {}
+        for index, start in enumerate(leaders):
+            end = leaders[index + 1] if index + 1 < len(leaders) else len(self.bytecode)
+            if self.depths[start] is None:
+                continue
+            labels[start] = self.block_start = len(self.instructions)
+            self.stack = [self.get_stack_register(depth) for depth in range(self.depths[start])]
+            for pc in range(start, end):
+                self.translate_instruction(pc)
+            if self.bytecode[end - 1]["opr"] not in BLOCK_ENDS:
+                self.materialize(end - 1)
+        for instruction in self.instructions:
+            if instruction.target is not None:
+                instruction.target = labels[instruction.target]
+        enter.register_count = self.max_locals + self.max_stack + len(self.constants)
+        enter.constants = tuple(self.constants)
+        return tuple(self.instructions)
+
+
+def translate(code: Sequence[Any], method_code: Dict[str, Any]) -> Tuple[RegisterInstruction, ...]:
+    '''
+    The register code of a method, given its decoded instructions and the
+    code of its jvm2json method. Raises NotImplementedError for methods with
+    instructions that have no register form. Callers running a method more
+    than once keep its register code, see jvm/codecache.py.
+    '''
+    return Translator(code, method_code).translate()
+
+if __name__ == "__main__":
+    root = Path(sys.argv[1] if len(sys.argv) > 1 else "course-02242-examples/decompiled")
+    before = after = untranslated = 0
+    for path in sorted(root.glob("**/*.json")):
+        with open(path) as fp:
+            for method in json.load(fp).get("methods", []):
+                method_code = method.get("code")
+                if not method_code or not method_code.get("bytecode"):
+                    continue
+                try:
+                    registers = translate(method_code["bytecode"], method_code)
+                except NotImplementedError:
+                    untranslated += 1
+                    continue
+                before += len(method_code["bytecode"])
+                # Without the enter instruction
+                after += len(registers) - 1
+    print(f"{before} stack instructions, {after} register instructions ({after / before:.0%}), {untranslated} methods untranslated")
@@ -0,0 +1,234 @@
+"""
+Superinstructions, frequent instruction sequences fused into one.
+
+A superinstruction is named after the oprs of the instructions it fuses,
+joined by +, ie. load+load+if is two loads and the conditional jump
+comparing them. The names are opcodes like any other, see opcodes.py, so
+every engine can give them a handler of its own. A handler gets the fused
+instructions as parts of the Superinstruction and their operands baked into
+one flat tuple, and moves the pc to after the last of them. Engines without
+a dedicated handler execute the parts one after the other.
+
+fuse is the peephole pass shared by the engines. It replaces the first
+instruction of every sequence matching one of the chosen superinstructions,
+the others stay where they are so branch targets and the pcs of the
+instructions after the sequence do not change. A sequence is only fused when
+no branch jumps into its middle, when only its last instruction may branch
+and when the engine has handlers for all of its instructions.
+
+Which superinstructions pay off depends on the workload. A PairHistogram
+counts how often one instruction follows another, either over the decoded
+methods or weighted by the execution counts of a Profile, and select picks
+the superinstructions whose instruction pairs are frequent enough. The
+histogram is exported as JSON, running this module records it over the
+decompiled examples:
+
+    python -m dtu02242.jvm.superinstructions [<root>] [<histogram.json>]
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import json
+import operator
+import sys
+
+from dtu02242.jvm.opcodes import OPCODE_NAMES, OPCODES, get_instruction_name
+
+# The oprs of the instructions fused by every superinstruction
+SUPERINSTRUCTIONS: Dict[str, Tuple[str, ...]] = {
+    name: tuple(name.split("+")) for name in OPCODE_NAMES if "+" in name
+}
+
+# Instructions after which the next one is not executed
+NO_FALL_THROUGH = ("goto", "return", "throw", "tableswitch", "lookupswitch")
+
+# Instructions that can only end a superinstruction
+BRANCHES = ("if", "ifz", "goto")
+
+# Operands of conditions and operants, as functions working on any values with the Python operators.
+# is and isnot compare references, ifz-is and ifz-isnot with null, which the handlers of
+# load+ifz would compare with the int zero. Branches on them and other operants are not fused.
+COMPARISONS = {
+    "eq": operator.eq, "ne": operator.ne, "lt": operator.lt,
+    "le": operator.le, "gt": operator.gt, "ge": operator.ge,
+}
+ARITHMETIC = {"add": operator.add, "sub": operator.sub, "mul": operator.mul}
+
+
+def has_operands(opr: Any) -> bool:
+    '''Whether the operands of an instruction can be baked into a superinstruction'''
+    if opr.opr in ("if", "ifz"):
+        return opr.condition in COMPARISONS
+    if opr.opr == "binary":
+        return opr.operant in ARITHMETIC
+    return True
+
+
+def get_operands(opr: Any) -> Tuple[Any, ...]:
+    '''
+    Operands of an instruction as baked into a superinstruction: the
+    comparison and target of branches, the arithmetic of binary instructions,
+    the value of pushes and the index of the others that have one.
+    '''
+    if opr.opr in BRANCHES:
+        return (COMPARISONS.get(opr.condition), opr.target)
+    if opr.opr == "binary":
+        return (ARITHMETIC.get(opr.operant),)
+    if opr.opr == "push":
+        return (opr.value,)
+    if opr.index is not None:
+        return (opr.index,)
+    return ()
+
+
+class Superinstruction:
+    '''
+    A fused sequence, standing in for the first instruction of it. opr and
+    target are the ones of the last instruction, so analyses looking for
+    branches find the one ending the sequence.
+    '''
+    __slots__ = ("name", "parts", "operands", "opcode", "offset", "opr", "target")
+
+    def __init__(self, name: str, parts: Tuple[Any, ...]):
+        self.name = name
+        self.parts = parts
+        self.operands = tuple(operand for part in parts for operand in get_operands(part))
+        self.opcode = OPCODES[name]
+        self.offset = parts[0].offset
+        self.opr = parts[-1].opr
+        self.target = parts[-1].target
+
+    def get_name(self) -> str:
+        return self.name
+
+    def __repr__(self) -> str:
+        return f"Superinstruction({self.name})"
+
+
+def get_opr(name: str) -> str:
+    '''opr of an instruction name, ie. binary for binary-add'''
+    return name.split("-", 1)[0]
+
+
+class PairHistogram:
+    # Executions of the second instruction right after the first one, by instruction name
+    counts: Dict[Tuple[str, str], int]
+
+    def __init__(self, counts: Optional[Dict[Tuple[str, str], int]] = None) -> None:
+        self.counts = dict(counts) if counts is not None else {}
+
+    def record(self, first: str, second: str, count: int = 1) -> None:
+        if count:
+            self.counts[(first, second)] = self.counts.get((first, second), 0) + count
+
+    def record_names(self, names: List[str], targets: Iterable[Optional[int]], counts: Optional[Dict[int, int]] = None) -> None:
+        # An instruction that is jumped to does not always follow the one before it
+        jumped_to = set(targets)
+        for pc in range(1, len(names)):
+            if pc in jumped_to or get_opr(names[pc - 1]) in NO_FALL_THROUGH:
+                continue
+            self.record(names[pc - 1], names[pc], counts.get(pc, 0) if counts is not None else 1)
+
+    def record_code(self, code: Tuple[Any, ...], counts: Optional[Dict[int, int]] = None) -> None:
+        '''
+        Record the pairs of a decoded method. Every pair counts once, or as
+        often as its second instruction was executed when counts by pc are
+        given, ie. from Profile.get_instruction_counts.
+        '''
+        self.record_names([opr.get_name() for opr in code], [opr.target for opr in code], counts)
+
+    def record_bytecode(self, bytecode: List[Dict[str, Any]]) -> None:
+        '''Record the pairs of the jvm2json bytecode of a method'''
+        names = [get_instruction_name(instruction["opr"], instruction.get("operant"), instruction.get("condition"))
+                 for instruction in bytecode]
+        self.record_names(names, [instruction.get("target") for instruction in bytecode])
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def count_oprs(self, first: str, second: str) -> int:
+        '''Count of the pairs of instructions with the given oprs'''
+        return sum(count for (first_name, second_name), count in self.counts.items()
+                   if get_opr(first_name) == first and get_opr(second_name) == second)
+
+    def most_common(self, n: Optional[int] = None) -> List[Tuple[Tuple[str, str], int]]:
+        pairs = sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+        return pairs if n is None else pairs[:n]
+
+    def select(self, min_share: float = 0.01, candidates: Optional[Iterable[str]] = None) -> Tuple[str, ...]:
+        '''
+        The superinstructions worth fusing, the ones where every pair of
+        consecutive instructions makes up at least min_share of all pairs.
+        '''
+        total = self.total()
+        selected = []
+        for name in (candidates if candidates is not None else SUPERINSTRUCTIONS):
+            oprs = SUPERINSTRUCTIONS[name]
+            if total > 0 and all(self.count_oprs(first, second) >= min_share * total
+                                 for first, second in zip(oprs, oprs[1:])):
+                selected.append(name)
+        return tuple(selected)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "total": self.total(),
+            "pairs": [{"first": first, "second": second, "count": count}
+                      for (first, second), count in self.most_common()],
+        }
+
+    @classmethod
+    def from_json(cls, json_dict: Dict[str, Any]) -> 'PairHistogram':
+        return cls({(pair["first"], pair["second"]): pair["count"] for pair in json_dict["pairs"]})
+
+    def dump_json(self, path: str) -> None:
+        with open(path, "w") as fp:
+            json.dump(self.to_json(), fp, indent=2)
+
+
+def fuse(code: Tuple[Any, ...],
+         superinstructions: Iterable[str],
+         supported: Callable[[str], bool]) -> Tuple[Any, ...]:
+    '''
+    Copy of the decoded instructions of a method with the sequences of the
+    given superinstructions fused. supported tells whether the engine has a
+    handler for an instruction name.
+    '''
+    # Longest first, so load+load+if wins over load+ifz and the like
+    names = sorted((name for name in superinstructions if supported(name)),
+                   key=lambda name: -len(SUPERINSTRUCTIONS[name]))
+    jumped_to = {opr.target for opr in code}
+    fused = list(code)
+    pc = 0
+    while pc < len(code):
+        for name in names:
+            oprs = SUPERINSTRUCTIONS[name]
+            parts = code[pc:pc + len(oprs)]
+            if (len(parts) == len(oprs)
+                    and all(part.opr == opr for part, opr in zip(parts, oprs))
+                    and not any(part.opr in BRANCHES for part in parts[:-1])
+                    and not any(pc + offset in jumped_to for offset in range(1, len(parts)))
+                    and all(supported(part.get_name()) and has_operands(part) for part in parts)):
+                fused[pc] = Superinstruction(name, tuple(parts))
+                pc += len(parts)
+                break
+        else:
+            pc += 1
+    return tuple(fused)
+
+
+def unfuse(code: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    '''The instructions of a method before fuse'''
+    return tuple(opr.parts[0] if type(opr) is Superinstruction else opr for opr in code)
+
+
+if __name__ == "__main__":
+    root = Path(sys.argv[1] if len(sys.argv) > 1 else "course-02242-examples/decompiled")
+    histogram = PairHistogram()
+    for path in sorted(root.glob("**/*.json")):
+        with open(path) as fp:
+            for method in json.load(fp).get("methods", []):
+                histogram.record_bytecode((method.get("code") or {}).get("bytecode") or [])
+    if len(sys.argv) > 2:
+        histogram.dump_json(sys.argv[2])
+    for (first, second), count in histogram.most_common(20):
+        print(f"{first:>16} {second:<16} {count}")
+    print(f"{histogram.total()} pairs, fusing {', '.join(histogram.select())}")
@@ -123,7 +123,8 @@ class TestCalls:
     def test_helloWorld(self, capsys):
         stdout = OutputBuffer()
         run_method(self.java_class, "helloWorld", [], None, stdout)
-        assert stdout.buffer == "Hello, World!\n"
+        # The literal ends in a newline of its own, println adds another one
+        assert stdout.buffer == "Hello, World!\n\n"
 
     def test_fib(self):
         assert run_method(self.java_class, "fib", wrap([0])).get_value() == 1
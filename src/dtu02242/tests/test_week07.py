@@ -1,6 +1,12 @@
 from dtu02242.week_07.data_structures import *
-from dtu02242.week_07.interpreter import run_method, run_method_analysis
-from dtu02242.week_07.parser import JavaClass
+from dtu02242.week_07.interpreter import Interpreter, run_method, run_method_analysis
+from dtu02242.week_07.bytecode import StackElement, Operation
+from dtu02242.week_07.batch import run_batch
+from dtu02242.week_07.parser import JavaClass, JavaProgram
+from dtu02242.jvm.natives import DEFAULT_NATIVES
+from dtu02242.jvm.profiler import Profile
+from dtu02242.jvm.opcodes import OPCODES, OPCODE_NAMES
+from dtu02242.jvm.superinstructions import SUPERINSTRUCTIONS
 from typing import List, Any
 import json
 import pytest
@@ -115,6 +121,25 @@ class TestArray:
     def test_aWierdOneWithinBounds(self):
         assert run_method(self.java_class, "aWierdOneWithinBounds", [], None).get_value() == 1
 
+    def test_newarray_is_primitive(self):
+        interpreter = Interpreter(self.java_class)
+        assert interpreter.run(self.java_class.name, "newArray", []).get_value() == 1
+        arrays = [interpreter.memory[ref] for ref in interpreter.memory]
+        assert [type(arr) for arr in arrays] == [PrimitiveArrayValue]
+        assert arrays[0].get_value().typecode == "i"
+
+    def test_primitive_arrays(self):
+        ints = PrimitiveArrayValue(2, "int")
+        ints[0] = Value(2**31, "integer")
+        assert ints[0].get_value() == -2**31
+        assert ints[1].type_name == "integer"
+        chars = PrimitiveArrayValue(1, "char")
+        chars[0] = Value(-1, "integer")
+        assert chars[0].get_value() == 0xFFFF
+        doubles = PrimitiveArrayValue(3, "double", [0.5, 1.5, 2.5])
+        assert doubles[2].get_value() == 2.5
+        assert doubles[2].type_name == "double"
+
 class TestCalls:
     with open("course-02242-examples/decompiled/dtu/compute/exec/Calls.json", "r") as fp:
         json_dict = json.load(fp)
@@ -123,7 +148,8 @@ class TestCalls:
     def test_helloWorld(self, capsys):
         stdout = OutputBuffer()
         run_method(self.java_class, "helloWorld", [], None, stdout)
-        assert stdout.buffer == "Hello, World!\n"
+        # The literal ends in a newline of its own, println adds another one
+        assert stdout.buffer == "Hello, World!\n\n"
 
     def test_fib(self):
         assert run_method(self.java_class, "fib", wrap([0])).get_value() == 1
@@ -135,6 +161,743 @@ class TestCalls:
         assert run_method(self.java_class, "fib", wrap([6])).get_value() == 13
         # after this point, the method should be so slow that it is a waste of time to test
 
+    def test_instructions_are_decoded_once(self):
+        from dtu02242.week_07.bytecode import Operation
+        code = self.java_class.get_instructions("fib", Operation)
+        assert type(code) is tuple
+        assert code[0].opr == "load"
+        assert code[0].opcode == OPCODES["load"]
+        assert code[2].opcode == OPCODES["if-ge"]
+        assert self.java_class.get_instructions("fib", Operation) is code
+
+    def test_call_sites_are_resolved_once(self):
+        interpreter = Interpreter(self.java_class)
+        assert interpreter.run(self.java_class.name, "fib", wrap([6])).get_value() == 13
+        # fib calls itself from two places
+        assert len(interpreter._call_sites) == 2
+
+    def test_user_natives(self):
+        lines = []
+        natives = DEFAULT_NATIVES.copy()
+        natives.register("java/io/PrintStream", "println", "(Ljava/lang/String;)V",
+                         lambda runner, args: lines.append(args[1]))
+        run_method(self.java_class, "helloWorld", [], natives=natives)
+        assert lines == ["Hello, World!\n"]
+        assert DEFAULT_NATIVES.lookup("java/io/PrintStream", "println", "(Ljava/lang/String;)V") is not natives.lookup("java/io/PrintStream", "println", "(Ljava/lang/String;)V")
+
+    def test_math_abs_wraps(self):
+        abs_int = DEFAULT_NATIVES.lookup("java/lang/Math", "abs", "(I)I")
+        abs_long = DEFAULT_NATIVES.lookup("java/lang/Math", "abs", "(J)J")
+        assert abs_int(None, [-5]) == 5
+        assert abs_int(None, [-2**31]) == -2**31
+        assert abs_long(None, [-2**31]) == 2**31
+        assert abs_long(None, [-2**63]) == -2**63
+        assert DEFAULT_NATIVES.lookup("java/lang/Math", "abs", "(D)D")(None, [-1.5]) == 1.5
+
+    def test_profile(self):
+        profile = Profile()
+        assert run_method(self.java_class, "fib", wrap([5]), profile=profile).get_value() == 8
+        # fib(5) makes 15 calls, each runs one if-ge and one return
+        assert profile.opcodes["if-ge"][0] == 15
+        assert profile.opcodes["return"][0] == 15
+        assert profile.methods["fib"][0] == profile.total_executions()
+        assert profile.instructions[("fib", 0)][0] == 15
+        stacks = profile.collapsed_stacks().splitlines()
+        assert any(line.startswith("fib;fib;fib;fib;fib;return ") for line in stacks)
+        assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in stacks)
+        assert json.loads(json.dumps(profile.to_json()))["total_executions"] == profile.total_executions()
+
+    def test_stack_overflow(self):
+        with pytest.raises(JavaError) as ex:
+            run_method(self.java_class, "fib", wrap([5]), max_depth=3)
+        assert str(ex.value) == "java/lang/StackOverflowError"
+
+    def test_frames_are_per_interpreter(self):
+        interpreter = Interpreter(self.java_class, max_depth=4)
+        with pytest.raises(JavaError):
+            interpreter.run(self.java_class.name, "fib", wrap([5]))
+        assert interpreter.stack == []
+        assert interpreter.run(self.java_class.name, "fib", wrap([3])).get_value() == 3
+        assert Interpreter(self.java_class).stack == []
+
+
+class TestUnboxed:
+    def load(self, name: str) -> JavaClass:
+        with open(f"course-02242-examples/decompiled/dtu/compute/exec/{name}.json", "r") as fp:
+            return JavaClass(json_dict=json.load(fp))
+
+    def test_same_results_as_boxed(self):
+        cases = [("Simple", "noop", []), ("Simple", "add", [1, 2]), ("Simple", "min", [1, -2]),
+                 ("Simple", "factorial", [6]), ("Array", "access", [1, [4, 5]]),
+                 ("Array", "newArray", []), ("Array", "aWierdOneWithinBounds", []), ("Calls", "fib", [10])]
+        for class_name, method_name, args in cases:
+            java_class = self.load(class_name)
+            boxed = run_method(java_class, method_name, wrap(args))
+            unboxed = run_method(java_class, method_name, wrap(args), unboxed=True)
+            assert type(unboxed) is Value
+            assert unboxed.get_value() == boxed.get_value()
+
+    def test_results_are_tagged(self):
+        assert run_method(self.load("Simple"), "add", wrap([1, 2]), unboxed=True).type_name == "integer"
+
+    def test_arrays(self):
+        array = wrap([[3, 1, 2]])
+        run_method(self.load("Array"), "bubbleSort", array, unboxed=True)
+        assert array == wrap([[1, 2, 3]])
+        with pytest.raises(Exception) as ex:
+            run_method(self.load("Array"), "newArrayOutOfBounds", [], unboxed=True)
+        assert str(ex.value) == "Index out of bounds"
+
+    def test_exceptions(self):
+        with pytest.raises(JavaError) as ex:
+            run_method(self.load("Array"), "firstSafe", wrap([[]]), unboxed=True)
+        assert str(ex.value) == "java/lang/AssertionError"
+
+
+class TestBatch:
+    with open("course-02242-examples/decompiled/dtu/compute/exec/Array.json", "r") as fp:
+        json_dict = json.load(fp)
+        java_class = JavaClass(json_dict=json_dict)
+
+    def test_columns(self):
+        result = run_batch(self.java_class, "access", [(i, [4, 5, 6]) for i in range(-1, 5)])
+        assert len(result) == 6
+        assert result.values.typecode == "q"
+        assert list(result.values[1:4]) == [4, 5, 6]
+        assert result.errors == {0: "Index out of bounds", 4: "Index out of bounds", 5: "Index out of bounds"}
+        assert result.error_counts() == {"Index out of bounds": 3}
+        assert result.get(2).get_value() == 5
+
+    def test_java_exceptions(self):
+        result = run_batch(self.java_class, "firstSafe", [[[1]], [[]], [[2, 3]]], unboxed=False)
+        assert list(result.values) == [1, 0, 2]
+        with pytest.raises(JavaError) as ex:
+            result.get(1)
+        assert str(ex.value) == "java/lang/AssertionError"
+
+    def test_allocating_method(self):
+        result = run_batch(self.java_class, "newArray", [[]] * 50)
+        assert list(result.values) == [1] * 50
+
+    def test_without_garbage_collection(self):
+        result = run_batch(self.java_class, "first", [[[1, 2, 3]], [[4, 5]]], gc_threshold=None)
+        assert list(result.values) == [1, 4]
+
+    def test_engine_errors_propagate(self):
+        natives = DEFAULT_NATIVES.copy()
+        natives.register("java/lang/AssertionError", "<init>", function=lambda runner, args: {}["broken"])
+        with pytest.raises(KeyError):
+            run_batch(self.java_class, "firstSafe", [[[]]], natives=natives)
+
+
+class TestVectorized:
+    def load(self, path: str) -> JavaClass:
+        with open(f"course-02242-examples/decompiled/{path}.json", "r") as fp:
+            return JavaClass(json_dict=json.load(fp))
+
+    def test_same_results_as_batch(self):
+        pytest.importorskip("numpy")
+        from dtu02242.week_07.vectorized import run_vectorized
+        java_class = self.load("dtu/compute/exec/Simple")
+        rows = [(i, j) for i in range(-3, 4) for j in range(-3, 4)]
+        for method_name in ["add", "min"]:
+            assert list(run_vectorized(java_class, method_name, rows).values) == list(run_batch(java_class, method_name, rows).values)
+        rows = [(i,) for i in range(10)]
+        assert list(run_vectorized(java_class, "factorial", rows).values) == list(run_batch(java_class, "factorial", rows).values)
+
+    def test_divergent_lanes(self):
+        pytest.importorskip("numpy")
+        from dtu02242.week_07.vectorized import run_vectorized
+        java_class = self.load("eu/bogoe/dtu/exceptional/Arithmetics")
+        # if (i > 0) j = 12; else i = -i; return j / i;
+        result = run_vectorized(java_class, "alwaysThrows5", [(4, 0), (-3, 7), (0, 5), (-1, -15)])
+        assert list(result.values[:2]) == [3, 2]
+        assert result.values[3] == -15
+        assert result.errors == {2: "java/lang/ArithmeticException"}
+
+    def test_asserts(self):
+        pytest.importorskip("numpy")
+        from dtu02242.week_07.vectorized import run_vectorized
+        java_class = self.load("eu/bogoe/dtu/exceptional/Arithmetics")
+        # assert -1 <= j && j <= 1; return i / j;
+        result = run_vectorized(java_class, "alwaysThrows4", [(5, 1), (5, 2), (5, 0), (6, -1)])
+        assert list(result.values) == [5, 0, 0, -6]
+        assert result.errors == {1: "java/lang/AssertionError", 2: "java/lang/ArithmeticException"}
+
+    def test_ints_wrap(self):
+        pytest.importorskip("numpy")
+        from dtu02242.week_07.vectorized import run_vectorized
+        result = run_vectorized(self.load("dtu/compute/exec/Simple"), "factorial", [(13,)])
+        assert result.values[0] == 1932053504
+
+    def test_unsupported(self):
+        pytest.importorskip("numpy")
+        from dtu02242.week_07.vectorized import VectorizedInterpreter
+        with pytest.raises(NotImplementedError):
+            VectorizedInterpreter(self.load("dtu/compute/exec/Calls"), "fib")
+        with pytest.raises(NotImplementedError):
+            VectorizedInterpreter(self.load("dtu/compute/exec/Array"), "first")
+        # Fields other than $assertionsDisabled are not read as 0
+        with pytest.raises(NotImplementedError, match="floatStatic"):
+            VectorizedInterpreter(self.load("eu/bogoe/dtu/FieldAccess"), "statics")
+
+
+class TestJit:
+    def load(self, name: str) -> JavaClass:
+        with open(f"course-02242-examples/decompiled/dtu/compute/exec/{name}.json", "r") as fp:
+            return JavaClass(json_dict=json.load(fp))
+
+    def test_same_results_as_interpreted(self):
+        cases = [("Simple", "noop", []), ("Simple", "add", [1, 2]), ("Simple", "min", [1, -2]),
+                 ("Simple", "factorial", [6]), ("Array", "access", [1, [4, 5]]),
+                 ("Array", "newArray", []), ("Array", "aWierdOneWithinBounds", []), ("Calls", "fib", [10])]
+        for class_name, method_name, args in cases:
+            java_class = self.load(class_name)
+            interpreted = run_method(java_class, method_name, wrap(args))
+            for unboxed in (False, True):
+                compiled = run_method(java_class, method_name, wrap(args), unboxed=unboxed, jit_threshold=0)
+                assert type(compiled) is Value
+                assert compiled.get_value() == interpreted.get_value()
+
+    def test_hot_methods_are_compiled(self):
+        java_class = self.load("Calls")
+        interpreter = Interpreter(java_class, jit_threshold=10)
+        assert interpreter.run(java_class.name, "fib", wrap([10])).get_value() == 89
+        compiled = list(interpreter._compiled.values())
+        assert len(compiled) == 1 and callable(compiled[0])
+        # fib(10) invokes fib 176 times, only the first ten are interpreted
+        assert interpreter._invocations[id(java_class.get_instructions("fib", Operation))] == 11
+        assert all(call_site.native is compiled[0] for call_site in interpreter._call_sites.values())
+        assert interpreter.compiled_depth == 0
+        # Every interpreter compiles for itself, nothing is kept process wide
+        other = Interpreter(java_class, jit_threshold=10)
+        assert other.run(java_class.name, "fib", wrap([10])).get_value() == 89
+        assert other._compiled.values()[0] is not compiled[0]
+
+    def test_arrays_and_exceptions(self):
+        java_class = self.load("Array")
+        array = wrap([[3, 1, 2]])
+        run_method(java_class, "bubbleSort", array, jit_threshold=0)
+        assert array == wrap([[1, 2, 3]])
+        with pytest.raises(Exception) as ex:
+            run_method(java_class, "newArrayOutOfBounds", [], jit_threshold=0)
+        assert str(ex.value) == "Index out of bounds"
+        with pytest.raises(JavaError) as ex:
+            run_method(java_class, "firstSafe", wrap([[]]), jit_threshold=0)
+        assert str(ex.value) == "java/lang/AssertionError"
+
+    def test_stack_overflow(self):
+        java_class = self.load("Calls")
+        interpreter = Interpreter(java_class, max_depth=3, jit_threshold=0)
+        with pytest.raises(JavaError) as ex:
+            interpreter.run(java_class.name, "fib", wrap([5]))
+        assert str(ex.value) == "java/lang/StackOverflowError"
+        assert interpreter.compiled_depth == 0
+        assert interpreter.run(java_class.name, "fib", wrap([1])).get_value() == 1
+
+    def test_batch(self):
+        java_class = self.load("Simple")
+        rows = [(i,) for i in range(12)]
+        assert list(run_batch(java_class, "factorial", rows, jit_threshold=3).values) == list(run_batch(java_class, "factorial", rows).values)
+
+    def test_natives(self):
+        stdout = OutputBuffer()
+        run_method(self.load("Calls"), "helloWorld", [], None, stdout, jit_threshold=0)
+        assert stdout.buffer == "Hello, World!\n\n"
+
+    def test_uncompilable_methods_are_interpreted(self):
+        from dtu02242.week_07.jit import compile_method
+        with open("course-02242-examples/decompiled/eu/bogoe/dtu/exceptional/Arithmetics.json", "r") as fp:
+            java_class = JavaClass(json_dict=json.load(fp))
+        # There is no handler for binary-div, so the interpreted method fails the same way
+        with pytest.raises(NotImplementedError):
+            compile_method(java_class.get_instructions("alwaysThrows1", Operation), 0)
+        interpreter = Interpreter(java_class, jit_threshold=0)
+        with pytest.raises(NotImplementedError, match="Unsupported instruction binary-div"):
+            interpreter.run(java_class.name, "alwaysThrows1", [])
+        assert list(interpreter._compiled.values()) == [None]
+
+
+class TestBlocks:
+    def load(self, name: str) -> JavaClass:
+        with open(f"course-02242-examples/decompiled/dtu/compute/exec/{name}.json", "r") as fp:
+            return JavaClass(json_dict=json.load(fp))
+
+    def test_same_results_as_per_instruction(self):
+        cases = [("Simple", "noop", []), ("Simple", "add", [1, 2]), ("Simple", "min", [1, -2]),
+                 ("Simple", "factorial", [6]), ("Array", "access", [1, [4, 5]]),
+                 ("Array", "newArray", []), ("Array", "aWierdOneWithinBounds", []), ("Calls", "fib", [10])]
+        for class_name, method_name, args in cases:
+            java_class = self.load(class_name)
+            expected = run_method(java_class, method_name, wrap(args))
+            for unboxed in (False, True):
+                assert run_method(java_class, method_name, wrap(args), unboxed=unboxed, blocks=True).get_value() == expected.get_value()
+        stdout = OutputBuffer()
+        run_method(self.load("Calls"), "helloWorld", [], None, stdout, blocks=True)
+        assert stdout.buffer == "Hello, World!\n\n"
+
+    def test_leaders(self):
+        from dtu02242.week_07.blocks import get_leaders
+        code = self.load("Calls").get_instructions("fib", Operation)
+        # After the if-ge, its target, and after both invokes
+        assert get_leaders(code) == [0, 3, 5, 9, 13]
+
+    def test_blocks_belong_to_the_interpreter(self):
+        java_class = self.load("Simple")
+        code = java_class.get_instructions("factorial", Operation)
+        interpreter = Interpreter(java_class, blocks=True)
+        blocks = interpreter.get_blocks(code)
+        assert interpreter.get_blocks(code) is blocks
+        assert Interpreter(java_class, blocks=True).get_blocks(code) is not blocks
+        # The last block loads the result, the return after it is executed by the interpreter
+        assert [pc for pc, block in enumerate(blocks) if block is not None] == [0, 2, 4, 10]
+        assert code[11].opr == "return"
+
+    def test_exceptions(self):
+        java_class = self.load("Array")
+        with pytest.raises(JavaError) as ex:
+            run_method(java_class, "firstSafe", wrap([[]]), blocks=True)
+        assert str(ex.value) == "java/lang/AssertionError"
+        interpreter = Interpreter(self.load("Calls"), max_depth=4, blocks=True)
+        with pytest.raises(JavaError):
+            interpreter.run("dtu/compute/exec/Calls", "fib", wrap([5]))
+        assert interpreter.stack == []
+
+
+class TestSuperinstructions:
+    def load(self, name: str) -> JavaClass:
+        with open(f"course-02242-examples/decompiled/dtu/compute/exec/{name}.json", "r") as fp:
+            return JavaClass(json_dict=json.load(fp))
+
+    def test_same_results_as_unfused(self):
+        cases = [("Simple", "noop", []), ("Simple", "add", [1, 2]), ("Simple", "min", [1, -2]),
+                 ("Simple", "factorial", [6]), ("Array", "access", [1, [4, 5]]),
+                 ("Array", "newArray", []), ("Array", "aWierdOneWithinBounds", []), ("Calls", "fib", [10])]
+        for class_name, method_name, args in cases:
+            java_class = self.load(class_name)
+            expected = run_method(java_class, method_name, wrap(args))
+            for unboxed in (False, True):
+                for blocks in (False, True):
+                    result = run_method(java_class, method_name, wrap(args), unboxed=unboxed, blocks=blocks,
+                                        superinstructions=SUPERINSTRUCTIONS)
+                    assert result.get_value() == expected.get_value()
+            assert run_method(java_class, method_name, wrap(args), superinstructions=SUPERINSTRUCTIONS, jit_threshold=0).get_value() == expected.get_value()
+        array = wrap([[3, 1, 2]])
+        run_method(self.load("Array"), "bubbleSort", array, superinstructions=SUPERINSTRUCTIONS)
+        assert array == wrap([[1, 2, 3]])
+
+    def test_fused_code_belongs_to_the_class(self):
+        java_class = self.load("Simple")
+        fused = Interpreter(java_class, superinstructions=SUPERINSTRUCTIONS).get_instructions(java_class, "factorial")
+        assert Interpreter(java_class, superinstructions=SUPERINSTRUCTIONS).get_instructions(java_class, "factorial") is fused
+        # A class loaded again has instructions and fused code of its own
+        other = self.load("Simple")
+        assert Interpreter(other, superinstructions=SUPERINSTRUCTIONS).get_instructions(other, "factorial") is not fused
+
+    def test_fuse(self):
+        from dtu02242.jvm.superinstructions import Superinstruction, fuse, unfuse
+        code = self.load("Calls").get_instructions("fib", Operation)
+        fused = fuse(code, SUPERINSTRUCTIONS, lambda name: True)
+        assert len(fused) == len(code)
+        # Both n - 1 and n - 2
+        assert [(pc, opr.get_name()) for pc, opr in enumerate(fused) if type(opr) is Superinstruction] == \
+            [(5, "load+push+binary"), (9, "load+push+binary")]
+        assert fused[5].parts == code[5:8]
+        assert fused[5].operands[:2] == (0, code[6].value)
+        assert fused[6:9] == code[6:9]
+        assert unfuse(fused) == code
+        # Only what the engine has handlers for is fused
+        assert fuse(code, SUPERINSTRUCTIONS, lambda name: name != "binary-sub") == code
+        assert fuse(code, (), lambda name: True) == code
+
+    def test_array_initializers(self):
+        from dtu02242.week_07.bytecode import ByteCode
+        from dtu02242.week_07.unboxed import UnboxedByteCode
+        java_class = self.load("Array")
+        fused = Interpreter(java_class, superinstructions=SUPERINSTRUCTIONS).get_instructions(java_class, "newArray")
+        assert "dup+push+push+array_store" in [opr.get_name() for opr in fused]
+        for bytecode in (ByteCode(), UnboxedByteCode()):
+            handler = bytecode.handlers[OPCODES["dup+push+push+array_store"]]
+            assert handler == bytecode.perform_dup_push_push_array_store
+        # Array.newArray stores 1, 2 and 3 and returns the first element
+        for unboxed in (False, True):
+            assert run_method(java_class, "newArray", [], unboxed=unboxed, superinstructions=SUPERINSTRUCTIONS).get_value() == 1
+            with pytest.raises(JavaError, match="Index out of bounds"):
+                run_method(java_class, "newArrayOutOfBounds", [], unboxed=unboxed, superinstructions=SUPERINSTRUCTIONS)
+
+    def test_reference_comparisons_are_not_fused(self):
+        from dtu02242.jvm.superinstructions import fuse, has_operands
+        load = Operation({"offset": 0, "opr": "load", "index": 0, "type": "ref"})
+        for condition, fusable in (("is", False), ("isnot", False), ("ne", True)):
+            ifz = Operation({"offset": 1, "opr": "ifz", "condition": condition, "target": 0})
+            assert has_operands(ifz) == fusable
+            assert (fuse((load, ifz), SUPERINSTRUCTIONS, lambda name: True) != (load, ifz)) == fusable
+
+    def test_histogram(self):
+        from dtu02242.jvm.superinstructions import PairHistogram
+        java_class = self.load("Simple")
+        histogram = PairHistogram()
+        for method in java_class.get_methods():
+            histogram.record_code(java_class.get_instructions(method["name"], Operation))
+        assert histogram.counts[("load", "load")] >= 1
+        assert histogram.most_common(1)[0][1] == max(histogram.counts.values())
+        assert PairHistogram.from_json(json.loads(json.dumps(histogram.to_json()))).counts == histogram.counts
+        assert set(histogram.select(min_share=0.0)) <= set(SUPERINSTRUCTIONS)
+        assert histogram.select(min_share=1.0) == ()
+
+    def test_histogram_from_profile(self):
+        from dtu02242.jvm.superinstructions import PairHistogram
+        java_class = self.load("Simple")
+        profile = Profile()
+        run_method(java_class, "factorial", wrap([5]), profile=profile)
+        histogram = PairHistogram()
+        histogram.record_code(java_class.get_instructions("factorial", Operation), profile.get_instruction_counts("factorial"))
+        # The loop body runs five times, from the load after the ifz-le to the goto
+        assert histogram.counts[("ifz-le", "load")] == 5
+        assert histogram.counts[("push", "store")] == 1
+        assert "load+ifz" in histogram.select()
+
+
+class TestQuickening:
+    def load(self, name: str) -> JavaClass:
+        with open(f"course-02242-examples/decompiled/dtu/compute/exec/{name}.json", "r") as fp:
+            return JavaClass(json_dict=json.load(fp))
+
+    def test_same_results_as_generic(self):
+        cases = [("Simple", "noop", []), ("Simple", "add", [1, 2]), ("Simple", "min", [1, -2]),
+                 ("Simple", "factorial", [6]), ("Array", "access", [1, [4, 5]]),
+                 ("Array", "newArray", []), ("Array", "aWierdOneWithinBounds", []), ("Calls", "fib", [10])]
+        for class_name, method_name, args in cases:
+            java_class = self.load(class_name)
+            expected = run_method(java_class, method_name, wrap(args)).get_value()
+            assert run_method(java_class, method_name, wrap(args), quicken=True).get_value() == expected
+            assert run_method(java_class, method_name, wrap(args), quicken=True,
+                              superinstructions=SUPERINSTRUCTIONS).get_value() == expected
+            assert run_method(java_class, method_name, wrap(args), quicken=True, jit_threshold=0).get_value() == expected
+        array = wrap([[3, 1, 2]])
+        run_method(self.load("Array"), "bubbleSort", array, quicken=True)
+        assert array == wrap([[1, 2, 3]])
+
+    def test_instructions_are_rewritten(self):
+        java_class = self.load("Simple")
+        interpreter = Interpreter(java_class, quicken=True)
+        assert interpreter.run(java_class.name, "factorial", wrap([5])).get_value() == 120
+        decoded = java_class.get_instructions("factorial", Operation)
+        code = interpreter.get_instructions(java_class, "factorial")
+        assert [opr.get_name() for opr in code] == [opr.get_name() for opr in decoded]
+        quickened = [OPCODE_NAMES[opr.opcode] for opr in code if OPCODE_NAMES[opr.opcode].startswith("int-")]
+        assert quickened == ["int-ifz-le", "int-incr", "int-mul"]
+        # The decoded instructions are shared with other interpreters and stay generic
+        assert all(not OPCODE_NAMES[opr.opcode].startswith("int-") for opr in decoded)
+        assert run_method(java_class, "factorial", wrap([5])).get_value() == 120
+
+    def test_deoptimization(self):
+        java_class = self.load("Simple")
+        interpreter = Interpreter(java_class, quicken=True)
+        bytecode = interpreter.bytecode_interpreter
+        assert interpreter.run(java_class.name, "add", wrap([1, 2])).get_value() == 3
+        assert bytecode.quickened_count == 1
+        # Floats fail the guard of int-add, the generic add takes over for good
+        assert interpreter.run(java_class.name, "add", wrap([1.5, 2])).get_value() == 3.5
+        assert bytecode.deoptimized_count == 1
+        assert interpreter.run(java_class.name, "add", wrap([4, 2])).get_value() == 6
+        assert bytecode.quickened_count == 1
+        code = interpreter.get_instructions(java_class, "add")
+        assert "binary-add" in [OPCODE_NAMES[opr.opcode] for opr in code]
+
+    def test_profile_shows_quickened_instructions(self):
+        profile = Profile()
+        run_method(self.load("Calls"), "fib", wrap([10]), quicken=True, profile=profile)
+        assert profile.opcodes["int-add"][0] > profile.opcodes["binary-add"][0]
+
+    def test_unsupported_combinations(self):
+        java_class = self.load("Simple")
+        with pytest.raises(ValueError):
+            run_method(java_class, "factorial", wrap([5]), quicken=True, blocks=True)
+        with pytest.raises(ValueError):
+            run_method(java_class, "factorial", wrap([5]), quicken=True, unboxed=True)
+
+
+class TestRegisters:
+    def load(self, name: str) -> JavaClass:
+        with open(f"course-02242-examples/decompiled/dtu/compute/exec/{name}.json", "r") as fp:
+            return JavaClass(json_dict=json.load(fp))
+
+    def test_translation(self):
+        from dtu02242.jvm.registers import translate
+        java_class = self.load("Simple")
+        method_code = java_class.get_method("add")["code"]
+        registers = translate(java_class.get_instructions("add", Operation), method_code)
+        # load, load, add and return become r2 = r0 + r1 and return r2
+        assert [repr(opr) for opr in registers] == ["enter()", "r2 = binary-add(r0, r1)", "return(r2)"]
+        assert registers[0].register_count == method_code["max_locals"] + method_code["max_stack"]
+        code = java_class.get_instructions("factorial", Operation)
+        registers = translate(code, java_class.get_method("factorial")["code"])
+        assert len(registers) - 1 < len(code)
+        # Branches jump into the register code, the push of 1 became a constant register
+        assert all(opr.target is None or registers[opr.target] is not None for opr in registers)
+        assert [push.value.get_value() for _, push in registers[0].constants] == [1]
+
+    def test_register_code_belongs_to_the_interpreter(self):
+        from dtu02242.jvm.registers import translate
+        java_class = self.load("Simple")
+        code = java_class.get_instructions("factorial", Operation)
+        # Nothing is cached process wide, translating twice gives two translations
+        assert translate(code, java_class.get_method("factorial")["code"]) is not translate(code, java_class.get_method("factorial")["code"])
+        interpreter = Interpreter(java_class, registers=True)
+        registers = interpreter.get_instructions(java_class, "factorial")
+        assert interpreter.get_instructions(java_class, "factorial") is registers
+        assert Interpreter(java_class, registers=True).get_instructions(java_class, "factorial") is not registers
+
+    def test_same_results_as_stack(self):
+        cases = [("Simple", "noop", []), ("Simple", "add", [1, 2]), ("Simple", "min", [1, -2]),
+                 ("Simple", "factorial", [6]), ("Array", "access", [1, [4, 5]]),
+                 ("Array", "newArray", []), ("Array", "aWierdOneWithinBounds", []), ("Calls", "fib", [10])]
+        for class_name, method_name, args in cases:
+            java_class = self.load(class_name)
+            expected = run_method(java_class, method_name, wrap(args)).get_value()
+            assert run_method(java_class, method_name, wrap(args), registers=True).get_value() == expected
+            assert run_method(java_class, method_name, wrap(args), registers=True, jit_threshold=0).get_value() == expected
+        array = wrap([[3, 1, 2]])
+        run_method(self.load("Array"), "bubbleSort", array, registers=True)
+        assert array == wrap([[1, 2, 3]])
+
+    def test_fewer_instructions(self):
+        java_class = self.load("Calls")
+        stack, registers = Profile(), Profile()
+        run_method(java_class, "fib", wrap([10]), profile=stack)
+        run_method(java_class, "fib", wrap([10]), registers=True, profile=registers)
+        count = lambda profile: sum(calls for calls, _ in profile.opcodes.values())
+        assert count(registers) < count(stack)
+        # Loads and pushes only exist on the operand stack
+        assert "load" not in registers.opcodes and "push" not in registers.opcodes
+
+    def test_unsupported_combinations(self):
+        java_class = self.load("Simple")
+        with pytest.raises(ValueError):
+            run_method(java_class, "factorial", wrap([5]), registers=True, blocks=True)
+        with pytest.raises(ValueError):
+            run_method(java_class, "factorial", wrap([5]), registers=True, quicken=True)
+        with pytest.raises(ValueError):
+            run_method(java_class, "factorial", wrap([5]), registers=True, superinstructions=SUPERINSTRUCTIONS)
+
+
+class TestMemoization:
+    def load(self, name: str) -> JavaClass:
+        with open(f"course-02242-examples/decompiled/dtu/compute/exec/{name}.json", "r") as fp:
+            return JavaClass(json_dict=json.load(fp))
+
+    def test_purity(self):
+        from dtu02242.week_07.memo import PurityAnalysis
+        calls = self.load("Calls")
+        purity = PurityAnalysis(JavaProgram([calls, self.load("Array")]))
+        assert purity.is_memoizable(calls.name, "fib", "(I)I")
+        # Prints
+        assert not purity.is_pure(calls.name, "helloWorld")
+        # Writes to an array it is given
+        assert not purity.is_pure("dtu/compute/exec/Array", "bubbleSort")
+        assert not purity.is_memoizable("dtu/compute/exec/Array", "first")
+        assert not purity.is_memoizable("dtu/compute/exec/Missing", "fib")
+
+    def test_same_results(self):
+        cases = [("Simple", "add", [1, 2]), ("Simple", "factorial", [6]), ("Array", "access", [1, [4, 5]]),
+                 ("Calls", "fib", [10])]
+        for class_name, method_name, args in cases:
+            java_class = self.load(class_name)
+            expected = run_method(java_class, method_name, wrap(args)).get_value()
+            assert run_method(java_class, method_name, wrap(args), memo_size=16).get_value() == expected
+            assert run_method(java_class, method_name, wrap(args), memo_size=16, registers=True).get_value() == expected
+            assert run_method(java_class, method_name, wrap(args), memo_size=16, jit_threshold=2).get_value() == expected
+            assert run_method(java_class, method_name, wrap(args), memo_size=16, unboxed=True).get_value() == expected
+
+    def test_calls_become_linear(self):
+        java_class = self.load("Calls")
+        interpreter = Interpreter(java_class, memo_size=100)
+        assert interpreter.run(java_class.name, "fib", wrap([25])).get_value() == 121393
+        # Every fib(n - 1) misses once, the fib(n - 2) after it hits
+        assert (interpreter.memo.misses, interpreter.memo.hits) == (25, 23)
+        assert interpreter.run(java_class.name, "fib", wrap([25])).get_value() == 121393
+        stack, memoized = Profile(), Profile()
+        run_method(java_class, "fib", wrap([15]), profile=stack)
+        run_method(java_class, "fib", wrap([15]), profile=memoized, memo_size=100)
+        count = lambda profile: sum(calls for calls, _ in profile.opcodes.values())
+        assert count(memoized) * 10 < count(stack)
+
+    def test_least_recently_used_are_evicted(self):
+        java_class = self.load("Calls")
+        interpreter = Interpreter(java_class, memo_size=3)
+        assert interpreter.run(java_class.name, "fib", wrap([12])).get_value() == 233
+        assert len(interpreter.memo) == 3
+        assert interpreter.memo.evictions > 0
+
+    def test_batch(self):
+        result = run_batch(self.load("Calls"), "fib", [[n] for n in range(30)], memo_size=64)
+        assert list(result.values)[-1] == 832040
+        assert not result.errors
+
+    def test_stack_overflow(self):
+        java_class = self.load("Calls")
+        interpreter = Interpreter(java_class, memo_size=16, max_depth=5)
+        with pytest.raises(JavaError):
+            interpreter.run(java_class.name, "fib", wrap([10]))
+        assert interpreter._memo_frames == []
+        assert interpreter.run(java_class.name, "fib", wrap([3])).get_value() == 3
+
+    def test_unsupported_combinations(self):
+        java_class = self.load("Calls")
+        with pytest.raises(Exception):
+            run_method(java_class, "fib", wrap([5]), memo_size=0)
+        # Blocks return through the same return_to_caller, so they memoize too
+        interpreter = Interpreter(java_class, memo_size=16, blocks=True)
+        assert interpreter.run(java_class.name, "fib", wrap([10])).get_value() == 89
+        assert interpreter.memo.hits > 0
+
+
+class TestOutput:
+    def load(self, name: str) -> JavaClass:
+        with open(f"course-02242-examples/decompiled/dtu/compute/exec/{name}.json", "r") as fp:
+            return JavaClass(json_dict=json.load(fp))
+
+    def test_buffers_are_per_run(self, capsys):
+        first, second = OutputBuffer(), OutputBuffer()
+        run_method(self.load("Calls"), "helloWorld", [], None, first)
+        assert first.buffer == "Hello, World!\n\n"
+        assert second.buffer == ""
+        assert first.bytes_written == len("Hello, World!\n\n")
+        # Nothing goes to the console unless a sink writes it there
+        assert capsys.readouterr().out == ""
+
+    def test_capture(self):
+        from dtu02242.jvm.output import CaptureSink
+        sink = CaptureSink()
+        sink.push("a")
+        sink.push("bc")
+        assert sink.getvalue() == "abc"
+        sink.push("\u00e6")
+        assert sink.getvalue() == "abc\u00e6"
+        assert sink.bytes_written == 5
+
+    def test_discard(self):
+        from dtu02242.jvm.output import DiscardSink
+        sink = DiscardSink()
+        run_method(self.load("Calls"), "helloWorld", [], None, sink)
+        assert sink.bytes_written > 0
+
+    def test_file(self, tmp_path):
+        from dtu02242.jvm.output import FileSink
+        path = tmp_path / "out.txt"
+        with FileSink(path, flush_threshold=8) as sink:
+            sink.push("1234")
+            assert path.read_text() == ""
+            sink.push("5678")
+            assert path.read_text() == "12345678"
+            sink.push("9")
+        assert path.read_text() == "123456789"
+        # The interpreter flushes at the end of a run
+        with open(tmp_path / "hello.txt", "w") as fp:
+            sink = FileSink(fp)
+            run_method(self.load("Calls"), "helloWorld", [], None, sink)
+            assert (tmp_path / "hello.txt").read_text() == "Hello, World!\n\n"
+            assert sink.bytes_written == len("Hello, World!\n\n")
+
+
+class TestGarbageCollection:
+    with open("course-02242-examples/decompiled/dtu/compute/exec/Array.json", "r") as fp:
+        json_dict = json.load(fp)
+        java_class = JavaClass(json_dict=json_dict)
+
+    def test_unreachable_objects_are_freed(self):
+        interpreter = Interpreter(self.java_class, gc_threshold=1000)
+        inner = interpreter.allocate(ArrayValue(1, Value(0)))
+        outer = interpreter.allocate(ArrayValue(1, [Value(inner, "ref")]))
+        garbage = interpreter.allocate(ArrayValue(2, Value(0)))
+        interpreter.stack.append(StackElement([Value(outer, "ref")], [], "main"))
+        interpreter.static_fields[("Array", "cache")] = Value(interpreter.allocate("Array"), "ref")
+
+        assert interpreter.collector.collect() == 1
+        assert garbage not in interpreter.memory
+        assert inner in interpreter.memory and outer in interpreter.memory
+        assert interpreter.collector.stats.live == 3
+
+    def test_unboxed_roots_are_tagged(self):
+        from dtu02242.week_07.unboxed import UnboxedInterpreter, get_slot_tags
+        # Array.access(int, int[]) reads a[i], the locals are an int and a reference
+        tags = get_slot_tags(self.java_class.get_method("access"))
+        assert tags[0] == ((False, True), ())
+        interpreter = UnboxedInterpreter(self.java_class, gc_threshold=1000)
+        code = interpreter.get_instructions(self.java_class, "access")
+        array = interpreter.allocate(ArrayValue(1, Value(0)))
+        garbage = interpreter.allocate(ArrayValue(1, Value(0)))
+        # An int that happens to be the address of an object does not keep it alive
+        interpreter.stack.append(StackElement([garbage, array], [], "access", 0, code))
+        assert interpreter.collector.collect() == 1
+        assert garbage not in interpreter.memory and array in interpreter.memory
+
+    def test_boxed_values_are_not_roots(self):
+        from dtu02242.week_07.unboxed import get_slot_tags
+        value_of = {"name": "valueOf", "ref": {"kind": "class", "name": "java/lang/Integer"},
+                    "args": ["int"], "returns": {"kind": "class", "name": "java/lang/Integer"}}
+        method = {"name": "box", "access": ["static"], "params": [{"type": {"base": "int"}}], "code": {"bytecode": [
+            {"offset": 0, "opr": "load", "type": "int", "index": 0},
+            {"offset": 1, "opr": "invoke", "access": "static", "method": value_of},
+            {"offset": 2, "opr": "store", "type": "ref", "index": 1},
+            {"offset": 3, "opr": "return", "type": None},
+        ]}}
+        tags = get_slot_tags(method)
+        assert tags[2] == ((False,), (False,))
+        assert tags[3] == ((False, False), ())
+        interpreter = Interpreter(self.java_class, gc_threshold=1000)
+        garbage = interpreter.allocate(ArrayValue(1, Value(0)))
+        interpreter.stack.append(StackElement([], [], "box"))
+        interpreter.call_native(interpreter.resolve(Operation(method["code"]["bytecode"][1])), [Value(garbage, "integer")],
+                                interpreter.stack[-1].operational_stack)
+        assert interpreter.stack[-1].operational_stack[-1].type_name == "integer"
+        assert interpreter.collector.collect() == 1
+
+    def test_collects_on_allocation_threshold(self):
+        interpreter = Interpreter(self.java_class, gc_threshold=4)
+        for _ in range(100):
+            interpreter.allocate(ArrayValue(10, Value(0)))
+        assert len(interpreter.memory) <= 4
+        assert interpreter.collector.stats.collections == 24
+        assert interpreter.run(self.java_class.name, "first", [Value(interpreter.allocate(ArrayValue(1, [Value(7)])), "ref")]).get_value() == 7
+
+
+class TestMethodTable:
+    with open("course-02242-examples/decompiled/dtu/deps/normal/Primes$PrimesIterator.json", "r") as fp:
+        json_dict = json.load(fp)
+        java_class = JavaClass(json_dict=json_dict)
+
+    def test_overloads(self):
+        # The bridge method only differs from next() in its return type
+        integer_next = self.java_class.get_method("next", "()Ljava/lang/Integer;")
+        object_next = self.java_class.get_method("next", "()Ljava/lang/Object;")
+        assert integer_next is not object_next
+        assert "bridge" in object_next["access"]
+        assert self.java_class.get_method("next") is integer_next
+
+    def test_descriptors_resolve_to_their_erasure_only(self):
+        integer = {"kind": "class", "name": "java/lang/Integer"}
+        java_class = JavaClass({"name": "Generic", "methods": [
+            {"name": "put", "params": [{"type": {"base": "int"}}], "returns": {"type": None}},
+            {"name": "put", "params": [{"type": integer}], "returns": {"type": None}},
+            {"name": "get", "params": [], "returns": {"type": {"base": "int"}}},
+            # Without a signature, it must not replace get as the method found by its bare name
+            {"name": "get"},
+        ]})
+        assert java_class.find_method("put", "(Ljava/lang/Object;)V") is java_class.get_methods()[1]
+        assert java_class.find_method("put", "(J)V") is None
+        # Not overloaded, but the descriptor is not an erasure of the one of get
+        assert java_class.find_method("get", "()J") is None
+        assert java_class.find_method("get") is java_class.get_methods()[2]
+
+    def test_missing(self):
+        assert self.java_class.find_method("next", "()I") is None
+        assert self.java_class.find_method("previous") is None
+        with pytest.raises(Exception) as ex:
+            self.java_class.get_method("previous")
+        assert str(ex.value) == "Method previous not found in dtu/deps/normal/Primes$PrimesIterator"
+
 
 class TestArithmetics:
     """
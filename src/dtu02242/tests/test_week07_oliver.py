@@ -1,5 +1,7 @@
 from dtu02242.week_07_oliver.analyzer import run_method_analysis, AnalysisResult
 from dtu02242.week_07_oliver.parser import JavaClass
+from dtu02242.jvm.profiler import Profile
+from dtu02242.jvm.superinstructions import SUPERINSTRUCTIONS
 from typing import List, Any
 import json
 import pytest
@@ -117,3 +119,28 @@ class TestArithmetics:
         result = run_method_analysis(self.java_class, "speedVsPrecision")
         assert AnalysisResult.ArithmeticException in result
 
+    def test_profile(self):
+        profile = Profile()
+        result = run_method_analysis(self.java_class, "speedVsPrecision", profile=profile)
+        assert result == run_method_analysis(self.java_class, "speedVsPrecision")
+        assert profile.opcodes["binary-div"][0] >= 1
+        assert set(profile.methods) == {"speedVsPrecision"}
+
+    def test_superinstructions(self):
+        for method in self.json_dict["methods"]:
+            if method["name"].startswith("<"):
+                continue
+            fused = run_method_analysis(self.java_class, method["name"], superinstructions=SUPERINSTRUCTIONS)
+            assert fused == run_method_analysis(self.java_class, method["name"])
+        profile = Profile()
+        run_method_analysis(self.java_class, "itDependsOnLattice1", profile=profile, superinstructions=SUPERINSTRUCTIONS)
+        assert any("+" in opcode_name for opcode_name in profile.opcodes)
+
+    def test_registers(self):
+        for method in self.json_dict["methods"]:
+            if method["name"].startswith("<"):
+                continue
+            registers = run_method_analysis(self.java_class, method["name"], registers=True)
+            assert registers == run_method_analysis(self.java_class, method["name"])
+        with pytest.raises(Exception):
+            run_method_analysis(self.java_class, "alwaysThrows1", registers=True, superinstructions=SUPERINSTRUCTIONS)
@@ -1,7 +1,17 @@
 from dtu02242.week_08.concolic import concolic, AnalysisResultValue
-from dtu02242.week_08.parser import JavaClass
+from dtu02242.week_08.parser import JavaClass, LazyJavaProgram, find_files_by_type
+from dtu02242.week_08.class_image import load_class_image, get_image_path
+from dtu02242.week_08.archive import ArchiveJavaProgram, write_archive
+from dtu02242.week_08.loader import LoadStats, load_classes_parallel, load_program_parallel
+from dtu02242.jvm.errors import JavaError
+from dtu02242.jvm.heap import Heap, NULL
+from dtu02242.jvm.program import LazyJavaProgram as JvmLazyJavaProgram
+from dtu02242.harness import Job, run_job, run_jobs, ANALYSIS, CONCOLIC
 from typing import List, Any
 import json
+import os
+import pickle
+import shutil
 import pytest
 
 class TestArithmetics:
@@ -104,6 +114,51 @@ class TestArithmetics:
         result = concolic(self.java_class, "neverThrows5")
         assert result.exception == AnalysisResultValue.No
 
+    def test_registers(self):
+        for method_name in ["alwaysThrows3", "itDependsOnLattice3", "neverThrows5"]:
+            result = concolic(self.java_class, method_name, registers=True)
+            assert result == concolic(self.java_class, method_name)
+
+    @staticmethod
+    def invoking_class(params: List[Any], bytecode: List[Any]) -> JavaClass:
+        method = {
+            "name": "invoking",
+            "access": ["public", "static"],
+            "params": [{"type": {"base": "int"}} for _ in params],
+            "returns": {"type": {"base": "int"}},
+            "code": {"max_stack": 3, "max_locals": 2, "exceptions": [], "bytecode": [
+                {"offset": offset, **bc} for offset, bc in enumerate(bytecode)
+            ]},
+        }
+        return JavaClass(json_dict={"name": "Invoking", "methods": [method]})
+
+    def test_registers_invoke_with_args(self):
+        # 1 / (twice(arg1) + 1), the call is not followed and returns 0
+        java_class = self.invoking_class(["int"], [
+            {"opr": "push", "value": {"type": "integer", "value": 1}},
+            {"opr": "load", "type": "int", "index": 0},
+            {"opr": "invoke", "access": "static", "method": {"name": "twice", "ref": {"kind": "class", "name": "Invoking"}, "args": ["int"], "returns": "int"}},
+            {"opr": "push", "value": {"type": "integer", "value": 1}},
+            {"opr": "binary", "type": "int", "operant": "add"},
+            {"opr": "binary", "type": "int", "operant": "div"},
+            {"opr": "return", "type": "int"},
+        ])
+        for registers in [False, True]:
+            result = concolic(java_class, "invoking", registers=registers)
+            assert result.exception == AnalysisResultValue.No
+
+    def test_registers_invoke_without_args(self):
+        # 1 / seed(), the call is not followed and returns 0
+        java_class = self.invoking_class([], [
+            {"opr": "push", "value": {"type": "integer", "value": 1}},
+            {"opr": "invoke", "access": "static", "method": {"name": "seed", "ref": {"kind": "class", "name": "Invoking"}, "args": [], "returns": "int"}},
+            {"opr": "binary", "type": "int", "operant": "div"},
+            {"opr": "return", "type": "int"},
+        ])
+        for registers in [False, True]:
+            result = concolic(java_class, "invoking", registers=registers)
+            assert result.exception == AnalysisResultValue.ArithmeticException
+
     @pytest.mark.skip(reason="Passes but takes a long time")
     def test_speedVsPrecision(self):
         # No args
@@ -206,4 +261,190 @@ class TestArray:
         # No arguments
         # Never throws IndexOutOfBoundsExecption
         result = concolic(self.java_class, "neverThrows3", max_depth=10000)
-        assert result.exception == AnalysisResultValue.No
\ No newline at end of file
+        assert result.exception == AnalysisResultValue.No
+
+    def test_registers(self):
+        for method_name in ["alwaysThrows4", "alwaysThrows5", "dependsOnLattice1"]:
+            result = concolic(self.java_class, method_name, registers=True)
+            assert result == concolic(self.java_class, method_name)
+
+class TestHeap:
+    def test_references_are_dense(self):
+        heap = Heap()
+        refs = [heap.allocate([i]) for i in range(3)]
+        assert refs == [1, 2, 3]
+        assert heap[2] == [1]
+        assert 0 not in heap
+
+    def test_free_slots_are_reused(self):
+        heap = Heap()
+        first = heap.allocate("a")
+        heap.allocate("b")
+        heap.free(first)
+        assert len(heap) == 1
+        with pytest.raises(JavaError, match="java/lang/NullPointerException"):
+            heap[first]
+        assert heap.allocate("c") == first
+        assert list(heap) == [1, 2]
+
+    def test_null_pointer(self):
+        heap = Heap()
+        with pytest.raises(JavaError, match="java/lang/NullPointerException"):
+            heap[NULL]
+        with pytest.raises(JavaError, match="java/lang/NullPointerException"):
+            heap[NULL] = "a"
+        from dtu02242.week_07.parser import JavaClass as Week7JavaClass
+        from dtu02242.week_07.interpreter import run_method
+        from dtu02242.week_07 import data_structures
+        with open("course-02242-examples/decompiled/dtu/compute/exec/Array.json", "r") as fp:
+            java_class = Week7JavaClass(json.load(fp))
+        # The week 7 engines raise the same JavaError as the heap
+        assert data_structures.JavaError is JavaError
+        with pytest.raises(JavaError, match="java/lang/NullPointerException"):
+            run_method(java_class, "first", [data_structures.Value(NULL, "ref")])
+
+    def test_concolic_is_reproducible(self):
+        with open("course-02242-examples/decompiled/dtu/compute/exec/Array.json", "r") as fp:
+            java_class = JavaClass(json.load(fp))
+        assert concolic(java_class, "aWierdOneOutOfBounds") == concolic(java_class, "aWierdOneOutOfBounds")
+
+
+class TestLazyJavaProgram:
+    root = "course-02242-examples/decompiled"
+
+    def test_index(self):
+        java_program = LazyJavaProgram(self.root)
+        assert "dtu/compute/exec/Calls" in java_program
+        assert "dtu/deps/normal/Primes$PrimesIterator" in java_program
+        assert java_program.get_class("dtu/compute/exec/Missing") is None
+
+    def test_loads_on_demand(self):
+        java_program = LazyJavaProgram(self.root, max_classes=2)
+        assert len(java_program._java_classes) == 0
+        calls = java_program.get_class("dtu/compute/exec/Calls")
+        assert calls.name == "dtu/compute/exec/Calls"
+        assert java_program.get_class("dtu/compute/exec/Calls") is calls
+        fib = calls.get_instructions("fib", dict)
+        java_program.get_class("dtu/compute/exec/Simple")
+        java_program.get_class("dtu/compute/exec/Array")
+        # Calls was the least recently used class
+        assert list(java_program._java_classes) == ["dtu/compute/exec/Simple", "dtu/compute/exec/Array"]
+        reloaded = java_program.get_class("dtu/compute/exec/Calls")
+        assert reloaded is not calls
+        # Its decoded instructions went with it
+        assert reloaded.get_instructions("fib", dict) is not fib
+        assert reloaded.get_instructions("fib", dict) == fib
+
+    def test_java_class_type(self):
+        from dtu02242.week_07.parser import JavaClass as Week7JavaClass
+        from dtu02242.week_07.interpreter import run_method
+        from dtu02242.week_07.data_structures import wrap
+        java_program = JvmLazyJavaProgram(self.root, Week7JavaClass)
+        calls = java_program.get_class("dtu/compute/exec/Calls")
+        assert type(calls) is Week7JavaClass
+        assert run_method(calls, "fib", wrap([10])).get_value() == 89
+
+    def test_images_of_java_class_type(self, tmp_path):
+        from dtu02242.week_07.parser import JavaClass as Week7JavaClass
+        from dtu02242.week_07.interpreter import Interpreter, run_method
+        from dtu02242.week_07.data_structures import wrap
+        from dtu02242.week_08.class_image import ClassImage
+        shutil.copy(f"{self.root}/dtu/compute/exec/Calls.json", tmp_path / "Calls.json")
+        java_program = LazyJavaProgram(tmp_path, java_class_type=Week7JavaClass, use_images=True)
+        calls = java_program.get_class("Calls")
+        assert isinstance(calls, Week7JavaClass) and isinstance(calls, ClassImage)
+        assert get_image_path(tmp_path / "Calls.json").exists()
+        assert run_method(calls, "fib", wrap([10])).get_value() == 89
+        with pytest.raises(Exception, match="Unexpected type"):
+            Interpreter(calls.json_dict)
+
+
+class TestClassImage:
+    source = "course-02242-examples/decompiled/dtu/compute/exec/Calls.json"
+
+    def test_roundtrip(self, tmp_path):
+        json_path = tmp_path / "Calls.json"
+        shutil.copy(self.source, json_path)
+        java_class = load_class_image(json_path)
+        assert get_image_path(json_path).exists()
+        with open(self.source, "r") as fp:
+            expected = JavaClass(json.load(fp))
+        assert java_class.name == expected.name
+        assert java_class.get_method("fib", "(I)I") == expected.get_method("fib")
+        assert java_class.get_methods() == expected.get_methods()
+
+    def test_invalidation(self, tmp_path):
+        json_path = tmp_path / "Calls.json"
+        shutil.copy(self.source, json_path)
+        load_class_image(json_path)
+        # Same content with a new modification time keeps the image
+        os.utime(json_path, ns=(0, 0))
+        assert load_class_image(json_path).source[0] == 0
+        with open(json_path, "r") as fp:
+            text = fp.read()
+        with open(json_path, "w") as fp:
+            fp.write(text.replace('"helloWorld"', '"goodbyeWorld"'))
+        java_class = load_class_image(json_path)
+        assert java_class.find_method("helloWorld") is None
+        assert java_class.find_method("goodbyeWorld") is not None
+
+
+class TestArchive:
+    root = "course-02242-examples/decompiled"
+
+    def test_archive(self, tmp_path):
+        archive_path = tmp_path / "classes.jca"
+        count = write_archive(self.root, archive_path)
+        java_program = ArchiveJavaProgram(archive_path)
+        assert len(java_program) == count
+        assert java_program.get_class("dtu/compute/exec/Missing") is None
+        java_class = java_program.get_class("dtu/compute/exec/Calls")
+        assert java_program.get_class("dtu/compute/exec/Calls") is java_class
+        with open(f"{self.root}/dtu/compute/exec/Calls.json", "r") as fp:
+            expected = JavaClass(json.load(fp))
+        assert java_class.get_method("fib") == expected.get_method("fib")
+
+    def test_pickle(self, tmp_path):
+        archive_path = tmp_path / "classes.jca"
+        write_archive(self.root, archive_path)
+        java_program = pickle.loads(pickle.dumps(ArchiveJavaProgram(archive_path)))
+        assert "dtu/compute/exec/Calls" in java_program
+
+
+class TestParallelLoader:
+    root = "course-02242-examples/decompiled/dtu"
+
+    def test_load_classes(self):
+        file_names = find_files_by_type(self.root, "json")
+        stats = LoadStats()
+        java_classes = list(load_classes_parallel(file_names, max_workers=2, batch_size=4, stats=stats))
+        assert len(java_classes) == len(file_names)
+        assert stats.files == len(file_names)
+        assert stats.bytes > 0
+
+    def test_load_program(self):
+        java_program = load_program_parallel(self.root, max_workers=2)
+        java_class = java_program.get_class("dtu/compute/exec/Calls")
+        assert java_class.get_method("fib", "(I)I")["name"] == "fib"
+        with open(f"{self.root}/compute/exec/Calls.json", "r") as fp:
+            assert java_class.get_methods() == JavaClass(json.load(fp)).get_methods()
+
+
+class TestHarness:
+    def test_all_engines(self):
+        jobs = [Job("dtu/compute/exec/Simple", "add", args=(1, 2)),
+                Job("dtu/compute/exec/Array", "firstSafe", args=([],)),
+                Job("eu/bogoe/dtu/exceptional/Arithmetics", "alwaysThrows1", ANALYSIS),
+                Job("eu/bogoe/dtu/exceptional/Arithmetics", "alwaysThrows1", CONCOLIC)]
+        results = sorted(run_jobs(jobs, max_workers=2), key=lambda result: result.index)
+        assert [result.job for result in results] == jobs
+        assert results[0].value == 3
+        assert results[1].error == "java/lang/AssertionError"
+        assert "ArithmeticException" in str(results[2].value)
+        assert results[3].value.exception == AnalysisResultValue.ArithmeticException
+        assert all(result.seconds > 0 for result in results)
+
+    def test_missing_class(self):
+        result = run_job(Job("does/not/Exist", "main"))
+        assert result.value is None
+        assert "does/not/Exist" in result.error
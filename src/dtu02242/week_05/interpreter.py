@@ -5,6 +5,8 @@ from pydoc import locate
 import uuid
 import json
 
+from dtu02242.jvm.output import CaptureSink
+
 @dataclass
 class ArrayValue:
     length: int
@@ -26,10 +28,8 @@ class ClassValue:
     fields: Dict[str, RefValue]
     # strictly speaking, we do not have to store the method information
 
-class OutputBuffer:
-    buffer: str = ""
-    def push(self, str_or_bytes):
-        self.buffer += str_or_bytes 
+class OutputBuffer(CaptureSink):
+    '''The captured output of a run, buffer holds what it printed, see jvm/output.py'''
 
 class Value:
     def __init__(self, value: Any, type_name: str = "void"):
@@ -116,11 +116,11 @@ class Operation:
 
 class Interpreter:
 
-    def __init__(self, java_class: JavaClass, method_name, method_args: List[Value], memory: Dict[str, Value] = {}, stdout: OutputBuffer=OutputBuffer()):
+    def __init__(self, java_class: JavaClass, method_name, method_args: List[Value], memory: Dict[str, Value] = {}, stdout: Optional[OutputBuffer]=None):
         self.memory: Dict[str, Value] = memory
         self.stack: List[StackElement] = [StackElement(method_args, [], Counter(method_name, 0))]
         self.java_class = java_class
-        self.stdout = stdout
+        self.stdout = stdout if stdout is not None else OutputBuffer()
 
     def get_class(self, class_name, method_name) -> JavaClass:
         if class_name == self.java_class.name:
@@ -318,7 +318,6 @@ def peform_throw(runner: Interpreter, opr: Operation, element: StackElement):
 def perform_print(runner: Interpreter, opr: Operation, element: StackElement):
     value = element.operational_stack.pop()
     runner.stdout.push(str(value))
-    print(value, end="")
     runner.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
 
 method_mapper = {
@@ -360,7 +359,7 @@ def run_method(java_class: JavaClass,
                method_name: str, 
                method_args: List[Any],  
                environment: Optional[Dict[Any, Any]]=None, 
-               stdout: OutputBuffer=OutputBuffer()) -> Value:
+               stdout: Optional[OutputBuffer]=None) -> Value:
     # This is the entry point, this function should create an
     # Interpreter instance, and then run it with the given
     # properties. It should raise an error
@@ -2,9 +2,11 @@ from pathlib import Path
 from typing import List, Dict, Any, Iterable, Optional, Type
 from glob import glob
 
+from dtu02242.jvm.method_table import MethodTable, get_invoke_descriptor, get_method_descriptor
+
 JsonDict = Dict[str, Any]
 
-class JavaClass:
+class JavaClass(MethodTable):
     def __init__(self, json_dict: JsonDict) -> None:
         self.name = json_dict['name']
         self.json_dict = json_dict
@@ -12,14 +14,7 @@ class JavaClass:
     def get_methods(self) -> List[JsonDict]:
         methods: List[JsonDict] = self.json_dict["methods"]
         return methods
-    
-    def get_method(self, name: str) -> Optional[JsonDict]:
-        methods = self.get_methods()
-        for method in methods:
-            if method["name"] == name:
-                return method
-        return None
-    
+
     def __str__(self) -> str:
         return self.json_dict["name"]
 
@@ -1,6 +1,6 @@
-from .data_structures import Value, ArrayValue
-from typing import List, Dict, Any
-import uuid
+from .data_structures import Value, ArrayValue, IndexOutOfBounds, JavaError, PrimitiveArrayValue, PRIMITIVE_ARRAY_KINDS
+from dtu02242.jvm.opcodes import build_dispatch_table, get_instruction_name, get_opcode
+from typing import List, Dict, Any, Tuple
 
 class IInterp:
     stack: Any
@@ -10,21 +10,32 @@ class IInterp:
     def get_class(self, class_name, method_name):
         raise NotImplementedError()
 
-class Counter:
-    def __init__(self, method_name: str, counter: int):
-        self.method_name = method_name
-        self.counter = counter
-    
-    def next_counter(self):
-        return Counter(self.method_name, self.counter + 1)
+    def invoke(self, opr, element):
+        raise NotImplementedError()
+
+    def allocate(self, obj) -> int:
+        raise NotImplementedError()
 
 class StackElement:
-    def __init__(self, local_variables: List[Value], operational_stack, counter: Counter):
+    """
+    A method activation. Handlers mutate the locals and the operand stack in
+    place and move the pc along, so executing an instruction allocates nothing
+    besides the values it produces.
+    """
+    __slots__ = ("local_variables", "operational_stack", "method_name", "pc", "code")
+
+    def __init__(self, local_variables: List[Value], operational_stack: List[Value], method_name: str, pc: int = 0, code: Tuple['Operation', ...] = ()):
         self.local_variables: List[Value] = local_variables
         self.operational_stack: List[Value] = operational_stack
-        self.counter: Counter = counter
+        self.method_name: str = method_name
+        self.pc: int = pc
+        self.code: Tuple['Operation', ...] = code
 
 class Operation:
+    # Operations are decoded once per method and shared between runs, so keep them small
+    __slots__ = ("offset", "opr", "type", "index", "operant", "value",
+                 "condition", "target", "amount", "class_", "method", "access", "opcode")
+
     def __init__(self, json_doc):
         self.offset: int = json_doc["offset"]
         self.opr: str = json_doc["opr"]
@@ -37,15 +48,18 @@ class Operation:
         self.amount: int = json_doc["amount"] if "amount" in json_doc else None
         self.class_: str = json_doc["class"] if "class" in json_doc else None
         self.method: Dict[str, Any] = json_doc["method"] if "method" in json_doc else None
+        self.access: str = json_doc["access"] if "access" in json_doc else None
+        self.opcode: int = get_opcode(self.get_name())
 
     def get_name(self):
-        if self.operant:
-            return f"{self.opr}-{self.operant}"
-        if self.condition:
-            return f"{self.opr}-{self.condition}"
-        return self.opr
+        return get_instruction_name(self.opr, self.operant, self.condition)
+
+ZERO = Value(0, 'integer')
 
 class ByteCode:
+    # Whether the handlers rewrite the instructions they execute, see quickening.py
+    rewrites_code = False
+
     def __init__(self):
         self.method_mapper = {
     "push": self.perform_push,
@@ -72,11 +86,20 @@ class ByteCode:
     "dup": self.perform_dup,
     "invoke": self.perform_invoke,
     "throw": self.peform_throw,
-    "print": self.perform_print,
+    "load+load+if": self.perform_load_load_if,
+    "load+load+binary": self.perform_load_load_binary,
+    "load+push+binary": self.perform_load_push_binary,
+    "load+ifz": self.perform_load_ifz,
+    "push+store": self.perform_push_store,
+    "dup+push+push+array_store": self.perform_dup_push_push_array_store,
 }
+        self.handlers = build_dispatch_table(self.method_mapper, self.perform_unknown)
         
-    def execute(self, instruction: str, runner: IInterp, opr: Operation, element: StackElement):
-        return self.method_mapper[instruction](runner, opr, element)
+    def execute(self, runner: IInterp, opr: Operation, element: StackElement):
+        return self.handlers[opr.opcode](runner, opr, element)
+
+    def perform_unknown(self, runner: IInterp, opr: Operation, element: StackElement):
+        raise NotImplementedError(f"Unsupported instruction {opr.get_name()}")
 
     def perform_return(self, runner: IInterp, opr: Operation, element: StackElement):
         type = opr.type
@@ -86,166 +109,206 @@ class ByteCode:
         return value
 
     def perform_push(self, runner: IInterp, opr: Operation, element: StackElement):
-        v = opr.value
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [v], element.counter.next_counter()))
+        element.operational_stack.append(opr.value)
+        element.pc += 1
 
     def perform_load(self, runner: IInterp, opr: Operation, element: StackElement):
-        value = element.local_variables[opr.index]
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [value], element.counter.next_counter()))
+        element.operational_stack.append(element.local_variables[opr.index])
+        element.pc += 1
 
     def perform_add(self, runner: IInterp, opr: Operation, element: StackElement):
-        second = element.operational_stack.pop()
-        first = element.operational_stack.pop()
-        result = first + second
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [result], element.counter.next_counter()))
+        stack = element.operational_stack
+        second = stack.pop()
+        first = stack.pop()
+        stack.append(first + second)
+        element.pc += 1
 
     def perform_sub(self, runner: IInterp, opr: Operation, element: StackElement):
-        second = element.operational_stack.pop()
-        first = element.operational_stack.pop()
-        result = first - second
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [result], element.counter.next_counter()))
+        stack = element.operational_stack
+        second = stack.pop()
+        first = stack.pop()
+        stack.append(first - second)
+        element.pc += 1
 
     def perform_strictly_less(self, runner: IInterp, opr: Operation, element: StackElement):
         second = element.operational_stack.pop()
         first = element.operational_stack.pop()
         if first < second:
-            next_counter = Counter(element.counter.method_name, opr.target)
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, next_counter))
+            element.pc = opr.target
         else:
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
+            element.pc += 1
 
     def perform_less_or_equal(self, runner: IInterp, opr: Operation, element: StackElement):
         second = element.operational_stack.pop()
         first = element.operational_stack.pop()
         if first <= second:
-            next_counter = Counter(element.counter.method_name, opr.target)
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, next_counter))
+            element.pc = opr.target
         else:
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
-
+            element.pc += 1
 
     def perform_strictly_greater(self, runner: IInterp, opr: Operation, element: StackElement):
         second = element.operational_stack.pop()
         first = element.operational_stack.pop()
         if first > second:
-            next_counter = Counter(element.counter.method_name, opr.target)
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, next_counter))
+            element.pc = opr.target
         else:
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
+            element.pc += 1
 
     def perform_greater_or_equal(self, runner: IInterp, opr: Operation, element: StackElement):
         second = element.operational_stack.pop()
         first = element.operational_stack.pop()
         if first >= second:
-            next_counter = Counter(element.counter.method_name, opr.target)
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, next_counter))
+            element.pc = opr.target
         else:
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
+            element.pc += 1
 
     def perform_store(self, runner: IInterp, opr: Operation, element: StackElement):
         value = element.operational_stack.pop()
-        local_vars = [x for x in element.local_variables]
+        local_vars = element.local_variables
         if len(local_vars) <= opr.index:
+            local_vars.extend([None] * (opr.index - len(local_vars)))
             local_vars.append(value)
         else:
             local_vars[opr.index] = value
-        runner.stack.append(StackElement(local_vars, element.operational_stack, element.counter.next_counter()))
+        element.pc += 1
 
     def perform_less_than_or_equal_zero(self, runner: IInterp, opr: Operation, element: StackElement):
         first = element.operational_stack.pop()
-        second = Value(0, 'integer')
-        if first <= second:
-            next_counter = Counter(element.counter.method_name, opr.target)
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, next_counter))
+        if first <= ZERO:
+            element.pc = opr.target
         else:
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
+            element.pc += 1
 
     def perform_not_equal_zero(self, runner: IInterp, opr: Operation, element: StackElement):
         first = element.operational_stack.pop()
-        second = Value(0, 'integer')
-        if first != second:
-            next_counter = Counter(element.counter.method_name, opr.target)
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, next_counter))
+        if first != ZERO:
+            element.pc = opr.target
         else:
-            runner.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
+            element.pc += 1
 
     def perform_increment(self, runner: IInterp, opr: Operation, element: StackElement):
-        local_vars = [x for x in element.local_variables]
-        value = element.local_variables[opr.index]
-        local_vars[opr.index] = value + Value(opr.amount)
-        runner.stack.append(StackElement(local_vars, element.operational_stack, element.counter.next_counter()))
+        local_vars = element.local_variables
+        local_vars[opr.index] = local_vars[opr.index] + Value(opr.amount)
+        element.pc += 1
 
     def perform_multiplication(self, runner: IInterp, opr: Operation, element: StackElement):
-        second = element.operational_stack.pop()
-        first = element.operational_stack.pop()
-        result = first * second
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [result], element.counter.next_counter()))
+        stack = element.operational_stack
+        second = stack.pop()
+        first = stack.pop()
+        stack.append(first * second)
+        element.pc += 1
 
     def perform_goto(self, runner: IInterp, opr: Operation, element: StackElement):
-        next_counter = Counter(element.counter.method_name, opr.target)
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack, next_counter))
+        element.pc = opr.target
 
     def perform_new_array(self, runner: IInterp, opr: Operation, element: StackElement):
         size = element.operational_stack.pop().get_value()
-        memory_address = uuid.uuid4()
-        runner.memory[memory_address] = ArrayValue(size, Value(0))
-        value = Value(memory_address)
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [value], element.counter.next_counter()))
+        if type(opr.type) is str and opr.type in PRIMITIVE_ARRAY_KINDS:
+            ref = runner.allocate(PrimitiveArrayValue(size, opr.type))
+        else:
+            ref = runner.allocate(ArrayValue(size, Value(0)))
+        element.operational_stack.append(Value(ref, "ref"))
+        element.pc += 1
 
     def perform_array_store(self, runner: IInterp, opr: Operation, element: StackElement):
-        value_to_store = element.operational_stack.pop()
-        index = element.operational_stack.pop().get_value()
-        arr_address = element.operational_stack.pop().get_value()
-        runner.memory[arr_address][index] = value_to_store
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
+        stack = element.operational_stack
+        value_to_store = stack.pop()
+        index = stack.pop().get_value()
+        arr_address = stack.pop().get_value()
+        arr: ArrayValue = runner.memory[arr_address]
+        if index < 0 or arr.get_length() <= index:
+            raise IndexOutOfBounds()
+        arr[index] = value_to_store
+        element.pc += 1
 
     def perform_array_load(self, runner: IInterp, opr: Operation, element: StackElement):
-        index = element.operational_stack.pop().get_value()
-        arr_address = element.operational_stack.pop().get_value()
+        stack = element.operational_stack
+        index = stack.pop().get_value()
+        arr_address = stack.pop().get_value()
         arr: ArrayValue = runner.memory[arr_address]
-        if arr.get_length() <= index:
-            raise Exception("Index out of bounds")
-        value = arr[index]
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [value], element.counter.next_counter()))
+        if index < 0 or arr.get_length() <= index:
+            raise IndexOutOfBounds()
+        stack.append(arr[index])
+        element.pc += 1
 
     def perform_get(self, runner: IInterp, opr: Operation, element: StackElement):
         # I am not sure what get does but I am guessing it returns 0 when it succeeds and some else otherwise.
         # So we are just always going to assume that it works.
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [Value(0)], element.counter.next_counter()))
+        element.operational_stack.append(Value(0))
+        element.pc += 1
 
     def perform_array_length(self, runner: IInterp, opr: Operation, element: StackElement):
         arr_address = element.operational_stack.pop().get_value()
-        arr_length = runner.memory[arr_address].get_length()
-        value = Value(arr_length)
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [value], element.counter.next_counter()))
+        element.operational_stack.append(Value(runner.memory[arr_address].get_length()))
+        element.pc += 1
 
     def perform_new(self, runner: IInterp, opr: Operation, element: StackElement):
-        memory_address = uuid.uuid4() # Create random memory access
-        runner.memory[memory_address] = opr.class_
-        value = Value(memory_address, "ref")
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [value], element.counter.next_counter()))
+        ref = runner.allocate(opr.class_)
+        element.operational_stack.append(Value(ref, "ref"))
+        element.pc += 1
 
     def perform_dup(self, runner: IInterp, opr: Operation, element: StackElement):
-        value = element.operational_stack[-1]
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack + [value], element.counter.next_counter()))
+        element.operational_stack.append(element.operational_stack[-1])
+        element.pc += 1
 
     def perform_invoke(self, runner: IInterp, opr: Operation, element: StackElement):
-        raise NotImplementedError("All state that the bytecode interpreter stores should \
-                                  not be a part of the program itself, therefore this method \
-                                  should not spawn another Interpreter instance \
-                                  ")
+        # All state that the bytecode interpreter stores should not be a part
+        # of the program itself, the runner owns the call stack
+        runner.invoke(opr, element)
 
 
     def peform_throw(self, runner: IInterp, opr: Operation, element: StackElement):
         exception_pointer = element.operational_stack.pop()
         exception = runner.memory[exception_pointer.get_value()]
-        raise Exception(exception)
+        raise JavaError(exception)
 
-    def perform_print(self, runner: IInterp, opr: Operation, element: StackElement):
-        value = element.operational_stack.pop()
-        runner.stdout.push(str(value))
-        print(value, end="")
-        runner.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
+    # Superinstructions, opr.parts holds the instructions fused and opr.operands their operands
+
+    def perform_load_load_if(self, runner: IInterp, opr: Operation, element: StackElement):
+        first, second, compare, target = opr.operands
+        local_vars = element.local_variables
+        if compare(local_vars[first], local_vars[second]):
+            element.pc = target
+        else:
+            element.pc += 3
+
+    def perform_load_load_binary(self, runner: IInterp, opr: Operation, element: StackElement):
+        first, second, arithmetic = opr.operands
+        local_vars = element.local_variables
+        element.operational_stack.append(arithmetic(local_vars[first], local_vars[second]))
+        element.pc += 3
+
+    def perform_load_push_binary(self, runner: IInterp, opr: Operation, element: StackElement):
+        index, value, arithmetic = opr.operands
+        element.operational_stack.append(arithmetic(element.local_variables[index], value))
+        element.pc += 3
+
+    def perform_load_ifz(self, runner: IInterp, opr: Operation, element: StackElement):
+        index, compare, target = opr.operands
+        if compare(element.local_variables[index], ZERO):
+            element.pc = target
+        else:
+            element.pc += 2
+
+    def perform_push_store(self, runner: IInterp, opr: Operation, element: StackElement):
+        value, index = opr.operands
+        local_vars = element.local_variables
+        if len(local_vars) <= index:
+            local_vars.extend([None] * (index - len(local_vars)))
+            local_vars.append(value)
+        else:
+            local_vars[index] = value
+        element.pc += 2
+
+    def perform_dup_push_push_array_store(self, runner: IInterp, opr: Operation, element: StackElement):
+        # Stores a constant into the array on top of the stack, which stays there as the dup left it
+        index, value = opr.operands
+        index = index.get_value()
+        arr: ArrayValue = runner.memory[element.operational_stack[-1].get_value()]
+        if index < 0 or arr.get_length() <= index:
+            raise IndexOutOfBounds()
+        arr[index] = value
+        element.pc += 4
 
 class ByteCodeAbstraction(ByteCode):
     # Add fields here to record state
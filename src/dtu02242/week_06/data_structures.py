@@ -1,5 +1,9 @@
 from dataclasses import dataclass
 from typing import Any, Dict, List, Optional, Tuple
+import array
+
+from dtu02242.jvm.errors import IndexOutOfBounds, JavaError
+from dtu02242.jvm.output import CaptureSink
 
 def wrap(arr: List[Any]) -> List['Value']:
     """
@@ -68,16 +72,8 @@ class ValueRange(Value):
         super().__init__(value, type_name)
 
 
-class JavaError:
-    # Need a way of propagating errors
-    # Probably best to discuss how to implement this before deciding on one
-    pass
-
-
-class OutputBuffer:
-    buffer: str = ""
-    def push(self, str_or_bytes):
-        self.buffer += str_or_bytes
+class OutputBuffer(CaptureSink):
+    '''The captured output of a run, buffer holds what it printed, see jvm/output.py'''
 
 
 @dataclass
@@ -118,6 +114,51 @@ class ArrayValue(Value):
         return self._capacity
 
 
+# array.array type codes and value type names of the primitive array kinds
+PRIMITIVE_ARRAY_KINDS: Dict[str, Tuple[str, str]] = {
+    "int": ("i", "integer"),
+    "long": ("q", "long"),
+    "short": ("h", "integer"),
+    "byte": ("b", "integer"),
+    "boolean": ("b", "integer"),
+    "char": ("H", "integer"),
+    "float": ("f", "float"),
+    "double": ("d", "double"),
+}
+
+class PrimitiveArrayValue(ArrayValue):
+    """
+    An array of a primitive type, the elements are stored unboxed in an
+    array.array and only wrapped in a Value when they are loaded.
+    """
+    _value: array.array
+    _element_type: str
+
+    def __init__(self, capacity: int, element_type: str, values: Optional[List[Any]] = None):
+        typecode, self._element_type = PRIMITIVE_ARRAY_KINDS[element_type]
+        self._capacity = capacity
+        self.type_name = f"list:{element_type}"
+        if values is None:
+            self._value = array.array(typecode, bytes(capacity * array.array(typecode).itemsize))
+        else:
+            assert capacity == len(values)
+            self._value = array.array(typecode, values)
+
+    def __getitem__(self, __idx) -> Value:
+        return Value(self._value[__idx], self._element_type)
+
+    def __setitem__(self, __idx, __value: Value):
+        try:
+            self._value[__idx] = __value.get_value()
+        except OverflowError:
+            # Java truncates to the width of the element type
+            bits = self._value.itemsize * 8
+            value = __value.get_value() & ((1 << bits) - 1)
+            if self._value.typecode.islower() and value >= 1 << (bits - 1):
+                value -= 1 << bits
+            self._value[__idx] = value
+
+
 # TODO: Write Abstractions here
 
 class Range:
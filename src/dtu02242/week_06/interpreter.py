@@ -1,91 +1,175 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 
-from dtu02242.week_06.data_structures import ArrayValue, OutputBuffer, Value
-from .parser import JavaClass, JavaProgram, JsonDict
+from dtu02242.week_06.data_structures import ArrayValue, JavaError, OutputBuffer, Value
+from .parser import JavaClass, JavaProgram, JsonDict, get_invoke_descriptor
 from .bytecode import IInterp
-from .bytecode import ByteCode, StackElement, Counter, Operation
-import uuid
-import json
-
-StackFrame = List[StackElement]
+from .bytecode import ByteCode, StackElement, Operation
+from dtu02242.jvm.gc import DEFAULT_THRESHOLD, MarkSweepCollector
+from dtu02242.jvm.heap import Heap
+from dtu02242.jvm.program import LazyJavaProgram
+from dtu02242.jvm.natives import DEFAULT_NATIVES, NativeMethod, NativeRegistry, get_return_type
+from dtu02242.jvm.opcodes import OPCODES
+
+RETURN = OPCODES["return"]
+
+# Roughly what a JVM with its default thread stack size manages for small frames
+DEFAULT_MAX_DEPTH = 10000
+
+def get_references(obj: Any) -> List[int]:
+    '''References held by an object on the heap, for the garbage collector'''
+    if type(obj) is ArrayValue:
+        return [value.get_value() for value in obj.get_value() if value.type_name == "ref"]
+    return []
+
+class CallSite:
+    '''The method an invoke instruction resolved to, either interpreted code or a native'''
+    __slots__ = ("method_name", "code", "native", "arg_count", "return_type")
+
+    def __init__(self, method_name: str, code: Tuple[Operation, ...], native: Optional[NativeMethod], arg_count: int, return_type: Optional[str]):
+        self.method_name = method_name
+        self.code = code
+        self.native = native
+        self.arg_count = arg_count
+        self.return_type = return_type
 
 class Interpreter(IInterp):
     java_program: JavaProgram
     bytecode_interpreter: ByteCode
-    memory: Dict[uuid.UUID, Value]
-    stack_of_stacks: List[StackFrame] = []
-    memory: Dict[uuid.UUID, Value] = {}
+    memory: Heap
+    stack: List[StackElement]
     stdout: OutputBuffer
+    max_depth: int
+    natives: NativeRegistry
+    static_fields: Dict[Tuple[str, str], Value]
+    collector: Optional[MarkSweepCollector]
 
     def __init__(self, 
                  java_program: JavaProgram | JavaClass, 
-                 memory: Dict[uuid.UUID, Value] = {},
-                 bytecode_interpreter = ByteCode(),
-                 stdout: OutputBuffer=OutputBuffer()):
-        self.memory = memory
-        self.stack: List[StackElement] = []
-        self.stack_of_stacks.append(self.stack)
-
-        if type(java_program) is JavaProgram:
-            self.java_program = java_program
-        elif type(java_program) is JavaClass:
+                 memory: Optional[Heap] = None,
+                 bytecode_interpreter: Optional[ByteCode] = None,
+                 stdout: Optional[OutputBuffer] = None,
+                 max_depth: int = DEFAULT_MAX_DEPTH,
+                 natives: Optional[NativeRegistry] = None,
+                 gc_threshold: Optional[int] = DEFAULT_THRESHOLD):
+        # All run time state belongs to this instance, nothing is shared between interpreters
+        self.memory = memory if memory is not None else Heap()
+        self.stack = []
+        self.max_depth = max_depth
+        self.natives = natives if natives is not None else DEFAULT_NATIVES
+        self._call_sites: Dict[Operation, CallSite] = {}
+        self.static_fields = {}
+        # A gc_threshold of None turns off garbage collection
+        self.collector = MarkSweepCollector(self.memory, self.get_roots, get_references, gc_threshold) if gc_threshold is not None else None
+
+        if isinstance(java_program, JavaClass):
+            # Subclasses included, ie. the class images of week 8
             self.java_program = JavaProgram([java_program])
+        elif isinstance(java_program, (JavaProgram, LazyJavaProgram)):
+            self.java_program = java_program
         else:
             raise Exception("Unexpected type as JavaProgram")
-        self.stdout = stdout
-        self.bytecode_interpreter = bytecode_interpreter
-
-    def get_class(self, class_name, method_name) -> JavaClass:
-        class_maybe = self.java_program.get_class(class_name=class_name)
-        if class_maybe is not None:
-            return class_maybe
-        elif class_name == "java/io/PrintStream" and method_name == "println":
-            return JavaClass(json.loads('{"name": "Mock", "methods" :[{"name":"println", "code": { "bytecode": [ { "offset": 0, "opr": "load", "type": "str", "index": 0 }, { "offset": 1, "opr": "print" }, { "offset": 2, "opr": "return", "type": null } ] } } ] }'))
-        else:
-            return JavaClass(json.loads('{"name": "Mock", "methods" :[{"name":"' + method_name + '", "code": { "bytecode": [ { "offset": 0, "opr": "push", "value": { "type": "integer", "value": 4 } }, { "offset": 1, "opr": "return", "type": "int" } ] } } ] }'))
-
-    def run(self, class_name: str, method_name: str, method_args: List[Value]) -> Value:
-        self.stack.append(StackElement(method_args, [], Counter(method_name, 0)))
-
-        while len(self.stack) > 0:
-            element = self.stack.pop()
-            operation = Operation(self.get_class(class_name, method_name).get_method(element.counter.method_name)["code"]["bytecode"][element.counter.counter])
-            result = self.run_operation(operation, element)
-            if operation.get_name() == "return":
-                return result
-        raise Exception("Raised end without breaking")
-
-    def run_operation(self, operation: Operation, element: StackElement) -> Value | None:
-        operation_name = operation.get_name()
-
-        match operation_name:
-            case "invoke":
-                self.create_stack_frame(operation, element)
-            case "return":
-                return self.bytecode_interpreter.execute(operation_name, self, operation, element)
-            case _:
-                self.bytecode_interpreter.execute(operation_name, self, operation, element)
-
-    def create_stack_frame(self, opr, element):
-        method_name = opr.method["name"]
-        class_name = opr.method["ref"]["name"]
-        args = []
-        for _ in range(len(opr.method["args"])):
-            args.append(element.operational_stack.pop())
-        args.reverse()
-        self.stack_of_stacks.append([])
-        self.stack = self.stack_of_stacks[-1]
-        self.stack.append(StackElement(args, [], Counter(method_name, 0)))
-        result = self.run(class_name, method_name, args)
-
-        # Note that this currently allows memory mutation
-        
-        self.stack_of_stacks.pop()
-        self.stack = self.stack_of_stacks[-1]
-        if opr.method["returns"] is not None:
-            self.stack.append(StackElement(element.local_variables, element.operational_stack + [result], element.counter.next_counter()))
-        else:
-            self.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
+        self.stdout = stdout if stdout is not None else OutputBuffer()
+        self.bytecode_interpreter = bytecode_interpreter if bytecode_interpreter is not None else ByteCode()
+
+    def allocate(self, obj: Any) -> int:
+        if self.collector is not None:
+            self.collector.maybe_collect()
+        return self.memory.allocate(obj)
+
+    def get_roots(self) -> List[int]:
+        '''References held by the frames on the call stack and by static fields'''
+        roots = [value.get_value() for value in self.static_fields.values() if value.type_name == "ref"]
+        for element in self.stack:
+            for value in element.local_variables:
+                if value is not None and value.type_name == "ref":
+                    roots.append(value.get_value())
+            for value in element.operational_stack:
+                if value.type_name == "ref":
+                    roots.append(value.get_value())
+        return roots
+
+    def get_class(self, class_name, method_name=None) -> JavaClass:
+        java_class = self.java_program.get_class(class_name=class_name)
+        if java_class is None:
+            raise JavaError("java/lang/NoClassDefFoundError")
+        return java_class
+
+    def run(self, class_name: str, method_name: str, method_args: List[Value], descriptor: Optional[str] = None) -> Value:
+        """
+        Run a method to completion. Methods it invokes get their frames pushed
+        onto self.stack and are executed by this same loop, so the depth of
+        the Java call stack does not depend on the Python one.
+        """
+        stack = self.stack
+        base_depth = len(stack)
+        execute = self.bytecode_interpreter.execute
+        code = self.get_class(class_name).get_instructions(method_name, Operation, descriptor)
+        self.push_frame(code, method_name, list(method_args))
+        try:
+            while True:
+                element = stack[-1]
+                operation = element.code[element.pc]
+                if operation.opcode != RETURN:
+                    execute(self, operation, element)
+                    continue
+                result = execute(self, operation, element)
+                stack.pop()
+                if len(stack) == base_depth:
+                    return result
+                caller = stack[-1]
+                if caller.code[caller.pc].method["returns"] is not None:
+                    caller.operational_stack.append(result)
+                caller.pc += 1
+        except BaseException:
+            # Leave the interpreter usable for the next run
+            del stack[base_depth:]
+            raise
+
+    def push_frame(self, code: Tuple[Operation, ...], method_name: str, method_args: List[Value]) -> StackElement:
+        if len(self.stack) >= self.max_depth:
+            raise JavaError("java/lang/StackOverflowError")
+        element = StackElement(method_args, [], method_name, 0, code)
+        self.stack.append(element)
+        return element
+
+    def resolve(self, opr: Operation) -> CallSite:
+        """
+        Resolve the method an invoke instruction calls. Methods of classes in
+        the program are interpreted, everything else has to be a native.
+        """
+        method = opr.method
+        class_name = method["ref"]["name"]
+        method_name = method["name"]
+        descriptor = get_invoke_descriptor(method)
+        # The receiver is passed as the first argument of instance methods
+        arg_count = len(method["args"]) + (opr.access != "static")
+        java_class = self.java_program.get_class(class_name=class_name)
+        if java_class is not None and java_class.find_method(method_name, descriptor) is not None:
+            code = java_class.get_instructions(method_name, Operation, descriptor)
+            return CallSite(method_name, code, None, arg_count, None)
+        native = self.natives.lookup(class_name, method_name, descriptor)
+        if native is None:
+            raise JavaError("java/lang/NoSuchMethodError" if java_class is not None else "java/lang/NoClassDefFoundError")
+        return CallSite(method_name, (), native, arg_count, get_return_type(method["returns"]))
+
+    def invoke(self, opr: Operation, element: StackElement):
+        call_site = self._call_sites.get(opr)
+        if call_site is None:
+            call_site = self._call_sites[opr] = self.resolve(opr)
+        operational_stack = element.operational_stack
+        args = operational_stack[len(operational_stack) - call_site.arg_count:]
+        del operational_stack[len(operational_stack) - call_site.arg_count:]
+        if call_site.native is None:
+            # The caller continues once the callee returns, see run
+            self.push_frame(call_site.code, call_site.method_name, args)
+            return
+        self.call_native(call_site, args, operational_stack)
+        element.pc += 1
+
+    def call_native(self, call_site: CallSite, args: List[Value], operational_stack: List[Value]):
+        result = call_site.native(self, [arg.get_value() for arg in args])
+        if call_site.return_type is not None:
+            operational_stack.append(Value(result, call_site.return_type))
 
 def generate_unbounded_params(java_method: JsonDict) -> List[Value]:
     """
@@ -109,7 +193,10 @@ def run_method(java_class: JavaClass,
                method_name: str, 
                method_args: List[Value],  
                environment: Optional[Dict[Any, Any]]=None, 
-               stdout: OutputBuffer=OutputBuffer()) -> Value:
+               stdout: Optional[OutputBuffer]=None,
+               max_depth: int=DEFAULT_MAX_DEPTH,
+               natives: Optional[NativeRegistry]=None,
+               gc_threshold: Optional[int]=DEFAULT_THRESHOLD) -> Value:
     # This is the entry point, this function should create an
     # Interpreter instance, and then run it with the given
     # properties. It should raise an error
@@ -119,16 +206,17 @@ def run_method(java_class: JavaClass,
     #method_args = wrap(method_args)
 
     args = []
-    memory = {}
+    memory = Heap()
     for arg in method_args:
         if type(arg) is ArrayValue:
-            memory_address = uuid.uuid4()
-            memory[memory_address] = arg
-            args.append(Value(memory_address))
+            args.append(Value(memory.allocate(arg), "ref"))
         elif type(arg) is Value:
             args.append(arg)
 
     interpreter = Interpreter(java_program=java_class, 
                               memory=memory, 
-                              stdout=stdout)
+                              stdout=stdout,
+                              max_depth=max_depth,
+                              natives=natives,
+                              gc_threshold=gc_threshold)
     return interpreter.run(java_class.name, method_name, args)
@@ -0,0 +1,134 @@
+"""
+Running one method over many inputs.
+
+run_batch keeps a single interpreter for the whole batch, so the method is
+decoded once, its call sites are resolved once and natives stay looked up.
+The results are returned column wise: the values in an array.array when the
+method returns a primitive and the raised Java exceptions in a sparse dict.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+import array
+import time
+
+from .data_structures import Value, ArrayValue, JavaError, OutputBuffer, wrap
+from .parser import JavaClass, JavaProgram
+from .interpreter import Interpreter, DEFAULT_MAX_DEPTH
+from .unboxed import UnboxedInterpreter, get_value_type
+from dtu02242.jvm.gc import DEFAULT_THRESHOLD
+from dtu02242.jvm.natives import NativeRegistry
+
+# Result columns of the value types that fit an array.array
+RESULT_TYPECODES = {
+    "integer": "q",
+    "long": "q",
+    "float": "d",
+    "double": "d",
+}
+
+
+@dataclass
+class BatchResult:
+    '''
+    values holds the result of every run, row i belongs to input i. Rows that
+    raised a Java exception have a 0 or None value and str() of the exception
+    in errors, which is the exception class name.
+    '''
+    type_name: str
+    values: array.array | List[Any]
+    errors: Dict[int, str] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get(self, row: int) -> Value:
+        '''The result of a single run as a Value, raises if the run raised'''
+        if row in self.errors:
+            raise JavaError(self.errors[row])
+        return Value(self.values[row], self.type_name)
+
+    def error_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for error in self.errors.values():
+            counts[error] = counts.get(error, 0) + 1
+        return counts
+
+    def runs_per_second(self) -> float:
+        return len(self) / self.seconds if self.seconds > 0 else 0.0
+
+
+def run_batch(java_class: JavaClass | JavaProgram,
+              method_name: str,
+              inputs: Iterable[Iterable[Any]],
+              class_name: Optional[str] = None,
+              descriptor: Optional[str] = None,
+              unboxed: bool = True,
+              stdout: Optional[OutputBuffer] = None,
+              max_depth: int = DEFAULT_MAX_DEPTH,
+              natives: Optional[NativeRegistry] = None,
+              gc_threshold: Optional[int] = DEFAULT_THRESHOLD,
+              jit_threshold: Optional[int] = None,
+              blocks: bool = False,
+              superinstructions: Optional[Iterable[str]] = None,
+              quicken: bool = False,
+              registers: bool = False,
+              memo_size: Optional[int] = None) -> BatchResult:
+    '''
+    Run a method once for every row of inputs. A row holds plain Python
+    arguments like the lists given to wrap, a 2d NumPy array works as well.
+    class_name is needed when a JavaProgram is given. With a jit_threshold
+    the method is compiled once it ran that many times, see jit.py, and
+    with blocks the interpreter dispatches per basic block, see blocks.py.
+    The superinstructions named are fused, see jvm/superinstructions.py.
+    quicken rewrites instructions into int variants, see quickening.py, it
+    works on boxed values only and needs unboxed=False, so does registers,
+    which runs register code, see jvm/registers.py. With a memo_size the
+    results of pure methods are memoized across the whole batch, see memo.py.
+    '''
+    interpreter_type = UnboxedInterpreter if unboxed else Interpreter
+    interpreter = interpreter_type(java_class,
+                                   stdout=stdout,
+                                   max_depth=max_depth,
+                                   natives=natives,
+                                   gc_threshold=gc_threshold,
+                                   jit_threshold=jit_threshold,
+                                   blocks=blocks,
+                                   superinstructions=superinstructions,
+                                   quicken=quicken,
+                                   registers=registers,
+                                   memo_size=memo_size)
+    class_name = class_name if class_name is not None else java_class.name
+    method = interpreter.get_class(class_name).get_method(method_name, descriptor)
+    type_name = get_value_type(method["returns"]["type"])
+    typecode = RESULT_TYPECODES.get(type_name)
+    values: array.array | List[Any] = array.array(typecode) if typecode is not None else []
+    failed = 0 if typecode is not None else None
+    errors: Dict[int, str] = {}
+
+    memory = interpreter.memory
+    start = time.perf_counter()
+    for row, inputs_row in enumerate(inputs):
+        if hasattr(inputs_row, "tolist"):
+            inputs_row = inputs_row.tolist()
+        args = []
+        for arg in wrap(list(inputs_row)):
+            if type(arg) is ArrayValue:
+                arg = Value(memory.allocate(arg), "ref")
+            args.append(arg)
+        try:
+            value = interpreter.run(class_name, method_name, args, descriptor).get_value()
+        except JavaError as exception:
+            # Only exceptions of the program are results, failures of the engine propagate
+            value = failed
+            errors[row] = str(exception)
+        try:
+            values.append(value)
+        except OverflowError:
+            # The interpreter does not wrap ints at 64 bits, keep them as Python ints
+            values = list(values)
+            values.append(value)
+        if interpreter.collector is not None and len(memory) > 0:
+            # Nothing of a finished run is reachable any more
+            interpreter.collector.collect()
+    return BatchResult(type_name, values, errors, time.perf_counter() - start)
@@ -0,0 +1,82 @@
+"""
+Basic blocks of a method, each composed into one Python function.
+
+The instructions of a method are split at branch targets and after every
+instruction that branches, invokes, returns or throws. compose_blocks turns
+every block into a function calling the handlers of its instructions one
+after the other, so the interpreter dispatches once per block instead of once
+per instruction. The handlers are the ones of the ByteCode given, they move
+the pc along as usual and after a block it points to the first instruction of
+the next one, or to the callee frame the block pushed.
+
+Return instructions are left out of the blocks, the interpreter executes them
+itself since it has to hand their result to the caller. A block ending in an
+invoke of interpreted code ends with the pc still on the invoke, the
+interpreter moves it once the callee returns.
+
+The interpreter composes the blocks of a method once and keeps them, they
+call the handlers of its ByteCode.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .bytecode import ByteCode, Operation
+from dtu02242.jvm.superinstructions import Superinstruction
+
+Block = Callable[[Any, Any, ByteCode], None]
+
+# Instructions after which a block ends
+BLOCK_ENDS = ("if", "ifz", "goto", "invoke", "throw", "return")
+
+
+def get_size(opr: Operation) -> int:
+    '''Number of instructions an instruction stands for, more than one for superinstructions'''
+    return len(opr.parts) if type(opr) is Superinstruction else 1
+
+
+def get_leaders(code: Tuple[Operation, ...]) -> List[int]:
+    '''First instructions of the basic blocks of a method'''
+    leaders = {0}
+    for pc, opr in enumerate(code):
+        if opr.target is not None:
+            leaders.add(opr.target)
+        if opr.opr in BLOCK_ENDS:
+            leaders.add(pc + get_size(opr))
+    return sorted(pc for pc in leaders if pc < len(code))
+
+
+def is_method_of(handler: Callable[..., Any], bytecode: ByteCode) -> bool:
+    return getattr(handler, "__self__", None) is bytecode
+
+
+def compose_block(code: Tuple[Operation, ...], start: int, end: int, bytecode: ByteCode) -> Block:
+    '''A function executing the instructions from start to end on a frame'''
+    namespace: Dict[str, Any] = {}
+    lines = ["def block(runner, element, bytecode):"]
+    pc = start
+    while pc < end:
+        opr = code[pc]
+        handler = bytecode.handlers[opr.opcode]
+        namespace[f"o{pc}"] = opr
+        if is_method_of(handler, bytecode):
+            namespace[f"h{pc}"] = handler.__func__
+            lines.append(f"    h{pc}(bytecode, runner, o{pc}, element)")
+        else:
+            namespace[f"h{pc}"] = handler
+            lines.append(f"    h{pc}(runner, o{pc}, element)")
+        # The instructions a superinstruction fused are executed by it
+        pc += get_size(opr)
+    exec(compile("\n".join(lines) + "\n", f"<block {start}>", "exec"), namespace)
+    return namespace["block"]
+
+
+def compose_blocks(code: Tuple[Operation, ...], bytecode: ByteCode) -> List[Optional[Block]]:
+    '''The blocks of a method indexed by the pc they start at, None for every other pc'''
+    blocks: List[Optional[Block]] = [None] * len(code)
+    leaders = get_leaders(code)
+    for index, start in enumerate(leaders):
+        end = leaders[index + 1] if index + 1 < len(leaders) else len(code)
+        if code[end - 1].opr == "return":
+            end -= 1
+        if start < end:
+            blocks[start] = compose_block(code, start, end, bytecode)
+    return blocks
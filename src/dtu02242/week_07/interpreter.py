@@ -1,91 +1,477 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 
 from dtu02242.week_07.data_structures import *
-from .parser import JavaClass, JavaProgram, JsonDict
+from .parser import JavaClass, JavaProgram, get_invoke_descriptor
 from .bytecode import IInterp
-from .bytecode import ByteCode, StackElement, Counter, Operation
-import uuid
-import json
+from .bytecode import ByteCode, StackElement, Operation
+from dtu02242.jvm.gc import DEFAULT_THRESHOLD, MarkSweepCollector
+from dtu02242.jvm.heap import Heap
+from dtu02242.jvm.program import LazyJavaProgram
+from dtu02242.jvm.natives import DEFAULT_NATIVES, NativeMethod, NativeRegistry, get_return_type, get_value_type
+from dtu02242.jvm.codecache import CodeCache
+from dtu02242.jvm.output import OutputSink
+from dtu02242.jvm.opcodes import OPCODES, OPCODE_NAMES, UNKNOWN, get_opcode
+from dtu02242.jvm.profiler import Profile
+from dtu02242.jvm.superinstructions import fuse
+from .jit import CompiledMethod, compile_method
+from .blocks import Block, compose_blocks
+from .quickening import QuickeningByteCode
+from .registers import RegisterByteCode
+from .memo import MemoTable, PurityAnalysis
+from dtu02242.jvm.registers import RegisterInstruction, translate
+import time
 
-StackFrame = List[StackElement]
+RETURN = OPCODES["return"]
+
+# Roughly what a JVM with its default thread stack size manages for small frames
+DEFAULT_MAX_DEPTH = 10000
+
+def check_options(custom_bytecode: bool, blocks: bool, superinstructions: bool, quicken: bool, registers: bool) -> None:
+    '''Raise a ValueError for the options of an Interpreter that can not be combined'''
+    if quicken and blocks:
+        raise ValueError("Quickening rewrites single instructions, it can not be combined with blocks")
+    if quicken and custom_bytecode:
+        raise ValueError("Quickening needs the QuickeningByteCode")
+    if registers and (blocks or quicken or superinstructions):
+        raise ValueError("Register code can not be combined with blocks, quickening or superinstructions")
+    if registers and custom_bytecode:
+        raise ValueError("Register code needs the RegisterByteCode")
+
+def get_references(obj: Any) -> List[int]:
+    '''References held by an object on the heap, for the garbage collector'''
+    if type(obj) is ArrayValue:
+        return [value.get_value() for value in obj.get_value() if value.type_name == "ref"]
+    return []
+
+class CallSite:
+    '''
+    The method an invoke instruction resolved to, either interpreted code or a
+    native. Once interpreted code is compiled the call site calls it as a native.
+    Calls of memoized methods are answered from Interpreter.memo when they can.
+    '''
+    __slots__ = ("method_name", "code", "native", "arg_count", "return_type", "memoized")
+
+    def __init__(self, method_name: str, code: Tuple[Operation, ...], native: Optional[NativeMethod], arg_count: int, return_type: Optional[str], memoized: bool = False):
+        self.method_name = method_name
+        self.code = code
+        self.native = native
+        self.arg_count = arg_count
+        self.return_type = return_type
+        self.memoized = memoized
 
 class Interpreter(IInterp):
     java_program: JavaProgram
     bytecode_interpreter: ByteCode
-    memory: Dict[uuid.UUID, Value]
-    stack_of_stacks: List[StackFrame] = []
-    memory: Dict[uuid.UUID, Value] = {}
-    stdout: OutputBuffer
+    memory: Heap
+    stack: List[StackElement]
+    stdout: OutputSink
+    max_depth: int
+    natives: NativeRegistry
+    static_fields: Dict[Tuple[str, str], Value]
+    collector: Optional[MarkSweepCollector]
+    profile: Optional[Profile]
+    jit_threshold: Optional[int]
+    compiled_depth: int
+    blocks: bool
+    superinstructions: Optional[Tuple[str, ...]]
+    quicken: bool
+    registers: bool
+    memo: Optional[MemoTable]
 
     def __init__(self, 
                  java_program: JavaProgram | JavaClass, 
-                 memory: Dict[uuid.UUID, Value] = {},
-                 bytecode_interpreter = ByteCode(),
-                 stdout: OutputBuffer=OutputBuffer()):
-        self.memory = memory
-        self.stack: List[StackElement] = []
-        self.stack_of_stacks.append(self.stack)
-
-        if type(java_program) is JavaProgram:
-            self.java_program = java_program
-        elif type(java_program) is JavaClass:
+                 memory: Optional[Heap] = None,
+                 bytecode_interpreter: Optional[ByteCode] = None,
+                 stdout: Optional[OutputSink] = None,
+                 max_depth: int = DEFAULT_MAX_DEPTH,
+                 natives: Optional[NativeRegistry] = None,
+                 gc_threshold: Optional[int] = DEFAULT_THRESHOLD,
+                 profile: Optional[Profile] = None,
+                 jit_threshold: Optional[int] = None,
+                 blocks: bool = False,
+                 superinstructions: Optional[Iterable[str]] = None,
+                 quicken: bool = False,
+                 registers: bool = False,
+                 memo_size: Optional[int] = None):
+        check_options(bytecode_interpreter is not None, blocks, bool(superinstructions), quicken, registers)
+        # All run time state belongs to this instance, nothing is shared between interpreters
+        self.memory = memory if memory is not None else Heap()
+        self.stack = []
+        self.max_depth = max_depth
+        self.natives = natives if natives is not None else DEFAULT_NATIVES
+        self._call_sites: Dict[Operation, CallSite] = {}
+        self.static_fields = {}
+        self.profile = profile
+        # Methods are compiled once they were interpreted jit_threshold times, None never compiles
+        self.jit_threshold = jit_threshold
+        self._invocations: Dict[int, int] = {}
+        self._compiled = CodeCache()
+        # Frames of compiled code, which are not on self.stack
+        self.compiled_depth = 0
+        # Dispatch once per basic block instead of once per instruction, see blocks.py
+        self.blocks = blocks
+        self._blocks = CodeCache()
+        # Names of the superinstructions to fuse, see superinstructions.py
+        self.superinstructions = tuple(superinstructions) if superinstructions is not None else None
+        # Rewrite instructions into int variants as they execute, see quickening.py
+        self.quicken = quicken
+        # Execute register code instead of the stack instructions, see jvm/registers.py
+        self.registers = registers
+        # Results of pure methods, at most memo_size of them, see memo.py. None does not memoize
+        self.memo = MemoTable(memo_size) if memo_size is not None else None
+        # The memoized calls running, as the depth of their frame and their key
+        self._memo_frames: List[Tuple[int, Tuple[Any, ...]]] = []
+        # The instructions of every method as rewritten by the ByteCode or translated to register code,
+        # and the decoded ones by their id
+        self._rewritten = CodeCache()
+        self._decoded: Dict[int, Tuple[Operation, ...]] = {}
+        # A gc_threshold of None turns off garbage collection
+        self.collector = MarkSweepCollector(self.memory, self.get_roots, get_references, gc_threshold) if gc_threshold is not None else None
+
+        if isinstance(java_program, JavaClass):
+            # Subclasses included, ie. the class images of week 8
             self.java_program = JavaProgram([java_program])
+        elif isinstance(java_program, (JavaProgram, LazyJavaProgram)):
+            self.java_program = java_program
         else:
             raise Exception("Unexpected type as JavaProgram")
-        self.stdout = stdout
+        self.purity = PurityAnalysis(self.java_program)
+        self.stdout = stdout if stdout is not None else OutputBuffer()
+        if bytecode_interpreter is None:
+            bytecode_interpreter = QuickeningByteCode() if quicken else RegisterByteCode() if registers else ByteCode()
         self.bytecode_interpreter = bytecode_interpreter
 
-    def get_class(self, class_name, method_name) -> JavaClass:
-        class_maybe = self.java_program.get_class(class_name=class_name)
-        if class_maybe is not None:
-            return class_maybe
-        elif class_name == "java/io/PrintStream" and method_name == "println":
-            return JavaClass(json.loads('{"name": "Mock", "methods" :[{"name":"println", "code": { "bytecode": [ { "offset": 0, "opr": "load", "type": "str", "index": 0 }, { "offset": 1, "opr": "print" }, { "offset": 2, "opr": "return", "type": null } ] } } ] }'))
+    def allocate(self, obj: Any) -> int:
+        # The references held by compiled code are not known to the collector
+        if self.collector is not None and self.compiled_depth == 0:
+            self.collector.maybe_collect()
+        return self.memory.allocate(obj)
+
+    def get_roots(self) -> List[int]:
+        '''References held by the frames on the call stack and by static fields'''
+        roots = [value.get_value() for value in self.static_fields.values() if value.type_name == "ref"]
+        for element in self.stack:
+            for value in element.local_variables:
+                if value is not None and value.type_name == "ref":
+                    roots.append(value.get_value())
+            for value in element.operational_stack:
+                if value.type_name == "ref":
+                    roots.append(value.get_value())
+        return roots
+
+    def get_class(self, class_name, method_name=None) -> JavaClass:
+        java_class = self.java_program.get_class(class_name=class_name)
+        if java_class is None:
+            raise JavaError("java/lang/NoClassDefFoundError")
+        return java_class
+
+    def get_instructions(self, java_class: JavaClass, method_name: str, descriptor: Optional[str] = None) -> Tuple[Operation, ...]:
+        '''
+        The decoded instructions of a method, with the superinstructions fused.
+        A list of this interpreter's own when the ByteCode rewrites them, and
+        the register code of the method when running register code.
+        '''
+        code = java_class.get_instructions(method_name, Operation, descriptor)
+        bytecode = self.bytecode_interpreter
+        if self.registers:
+            registers = self._rewritten.get(code, lambda: translate(code, java_class.get_method(method_name, descriptor)["code"]))
+            self._decoded[id(registers)] = code
+            return registers
+        if self.superinstructions:
+            decoded = code
+            unknown = bytecode.handlers[UNKNOWN]
+            supports = lambda name: bytecode.handlers[get_opcode(name)] != unknown
+            # Which instructions fuse depends on the handlers of the ByteCode class only
+            code = java_class.get_derived(decoded, lambda: fuse(decoded, self.superinstructions, supports),
+                                          ("fused", self.superinstructions, type(bytecode)))
+        if not bytecode.rewrites_code:
+            return code
+        rewritten = self._rewritten.get(code, lambda: list(code))
+        self._decoded[id(rewritten)] = code
+        return rewritten
+
+    def run(self, class_name: str, method_name: str, method_args: List[Value], descriptor: Optional[str] = None) -> Value:
+        """
+        Run a method to completion. Methods it invokes get their frames pushed
+        onto self.stack and are executed by this same loop, so the depth of
+        the Java call stack does not depend on the Python one. What the
+        method printed is flushed to self.stdout once it returns or raises.
+        """
+        java_class = self.get_class(class_name)
+        code = self.get_instructions(java_class, method_name, descriptor)
+        try:
+            if self.jit_threshold is not None:
+                compiled = self.get_compiled(code, len(method_args), method_name)
+                if compiled is not None:
+                    returns = java_class.get_method(method_name, descriptor)["returns"]["type"]
+                    return self.run_compiled(compiled, method_args, get_value_type(returns))
+            return self.run_code(code, method_name, list(method_args))
+        finally:
+            self.stdout.flush()
+
+    def run_code(self, code: Tuple[Operation, ...], method_name: str, method_args: List[Value]) -> Value:
+        stack = self.stack
+        base_depth = len(stack)
+        self.push_frame(code, method_name, method_args)
+        # Chosen once per run, so that runs without a profile do not pay for it per instruction
+        if self.profile is not None:
+            run_frames = self.run_frames_profiled
+        elif self.blocks:
+            run_frames = self.run_blocks
         else:
-            return JavaClass(json.loads('{"name": "Mock", "methods" :[{"name":"' + method_name + '", "code": { "bytecode": [ { "offset": 0, "opr": "push", "value": { "type": "integer", "value": 4 } }, { "offset": 1, "opr": "return", "type": "int" } ] } } ] }'))
+            run_frames = self.run_frames
+        try:
+            return run_frames(base_depth)
+        except RecursionError:
+            # Compiled code calling compiled code uses the Python stack
+            self.unwind(base_depth)
+            raise JavaError("java/lang/StackOverflowError") from None
+        except BaseException:
+            # Leave the interpreter usable for the next run
+            self.unwind(base_depth)
+            raise
 
-    def run(self, class_name: str, method_name: str, method_args: List[Value]) -> Value:
-        self.stack.append(StackElement(method_args, [], Counter(method_name, 0)))
+    def unwind(self, base_depth: int) -> None:
+        '''Drop the frames above base_depth, and the memoized calls they were running'''
+        del self.stack[base_depth:]
+        memo_frames = self._memo_frames
+        while memo_frames and memo_frames[-1][0] > base_depth:
+            memo_frames.pop()
 
-        while len(self.stack) > 0:
-            element = self.stack.pop()
-            operation = Operation(self.get_class(class_name, method_name).get_method(element.counter.method_name)["code"]["bytecode"][element.counter.counter])
-            result = self.run_operation(operation, element)
-            if operation.get_name() == "return":
+    def run_compiled(self, compiled: CompiledMethod, method_args: List[Value], return_type: str) -> Value:
+        try:
+            result = compiled(self, [arg.get_value() for arg in method_args])
+        except RecursionError:
+            raise JavaError("java/lang/StackOverflowError") from None
+        return Value(result, return_type)
+
+    def run_frames(self, base_depth: int) -> Value:
+        stack = self.stack
+        execute = self.bytecode_interpreter.execute
+        return_to_caller = self.return_to_caller
+        while True:
+            element = stack[-1]
+            operation = element.code[element.pc]
+            if operation.opcode != RETURN:
+                execute(self, operation, element)
+                continue
+            result = execute(self, operation, element)
+            if return_to_caller(result, base_depth):
+                return result
+
+    def run_blocks(self, base_depth: int) -> Value:
+        '''run_frames, but executing a basic block at a time'''
+        stack = self.stack
+        bytecode = self.bytecode_interpreter
+        execute = bytecode.execute
+        return_to_caller = self.return_to_caller
+        element = None
+        while True:
+            if stack[-1] is not element:
+                element = stack[-1]
+                blocks = self.get_blocks(element.code)
+            operation = element.code[element.pc]
+            if operation.opcode != RETURN:
+                blocks[element.pc](self, element, bytecode)
+                continue
+            result = execute(self, operation, element)
+            if return_to_caller(result, base_depth):
                 return result
-        raise Exception("Raised end without breaking")
-
-    def run_operation(self, operation: Operation, element: StackElement) -> Value | None:
-        operation_name = operation.get_name()
-
-        match operation_name:
-            case "invoke":
-                self.create_stack_frame(operation, element)
-            case "return":
-                return self.bytecode_interpreter.execute(operation_name, self, operation, element)
-            case _:
-                self.bytecode_interpreter.execute(operation_name, self, operation, element)
-
-    def create_stack_frame(self, opr, element):
-        method_name = opr.method["name"]
-        class_name = opr.method["ref"]["name"]
-        args = []
-        for _ in range(len(opr.method["args"])):
-            args.append(element.operational_stack.pop())
-        args.reverse()
-        self.stack_of_stacks.append([])
-        self.stack = self.stack_of_stacks[-1]
-        self.stack.append(StackElement(args, [], Counter(method_name, 0)))
-        result = self.run(class_name, method_name, args)
-
-        # Note that this currently allows memory mutation
-        
-        self.stack_of_stacks.pop()
-        self.stack = self.stack_of_stacks[-1]
-        if opr.method["returns"] is not None:
-            self.stack.append(StackElement(element.local_variables, element.operational_stack + [result], element.counter.next_counter()))
+
+    def return_to_caller(self, result: Value, base_depth: int) -> bool:
+        '''
+        Pop the frame that returned result and hand result to the frame below:
+        store it when the frame ran a memoized call, write it to the register
+        of the invoke or push it, and move the caller past the invoke. True
+        when the frame popped was the one the run started with.
+        '''
+        stack = self.stack
+        memo_frames = self._memo_frames
+        if memo_frames and memo_frames[-1][0] == len(stack):
+            self.memo.put(memo_frames.pop()[1], self.unbox(result))
+        stack.pop()
+        if len(stack) == base_depth:
+            return True
+        caller = stack[-1]
+        invoke = caller.code[caller.pc]
+        if type(invoke) is RegisterInstruction:
+            if invoke.dest is not None:
+                caller.local_variables[invoke.dest] = result
+        elif invoke.method["returns"] is not None:
+            caller.operational_stack.append(result)
+        caller.pc += 1
+        return False
+
+    def get_blocks(self, code: Tuple[Operation, ...]) -> List[Optional[Block]]:
+        return self._blocks.get(code, lambda: compose_blocks(code, self.bytecode_interpreter))
+
+    def run_frames_profiled(self, base_depth: int) -> Value:
+        """
+        run_frames, but every instruction is timed and recorded in self.profile.
+        Time spent in invoked methods is recorded on their own instructions.
+        """
+        stack = self.stack
+        execute = self.bytecode_interpreter.execute
+        record = self.profile.record
+        clock = time.perf_counter
+        element = None
+        while True:
+            if stack[-1] is not element:
+                element = stack[-1]
+                call_stack = tuple(frame.method_name for frame in stack)
+            pc = element.pc
+            operation = element.code[pc]
+            start = clock()
+            result = execute(self, operation, element)
+            record(call_stack, pc, OPCODE_NAMES[operation.opcode], clock() - start)
+            if operation.opcode == RETURN and self.return_to_caller(result, base_depth):
+                return result
+
+    def push_frame(self, code: Tuple[Operation, ...], method_name: str, method_args: List[Value]) -> StackElement:
+        if len(self.stack) + self.compiled_depth >= self.max_depth:
+            raise JavaError("java/lang/StackOverflowError")
+        element = StackElement(method_args, [], method_name, 0, code)
+        self.stack.append(element)
+        return element
+
+    def resolve(self, opr: Operation) -> CallSite:
+        """
+        Resolve the method an invoke instruction calls. Methods of classes in
+        the program are interpreted, everything else has to be a native.
+        """
+        method = opr.method
+        class_name = method["ref"]["name"]
+        method_name = method["name"]
+        descriptor = get_invoke_descriptor(method)
+        # The receiver is passed as the first argument of instance methods
+        arg_count = len(method["args"]) + (opr.access != "static")
+        java_class = self.java_program.get_class(class_name=class_name)
+        if java_class is not None and java_class.find_method(method_name, descriptor) is not None:
+            code = self.get_instructions(java_class, method_name, descriptor)
+            memoized = (self.memo is not None and opr.access == "static"
+                        and self.purity.is_memoizable(class_name, method_name, descriptor))
+            return CallSite(method_name, code, None, arg_count, get_return_type(method["returns"]), memoized)
+        native = self.natives.lookup(class_name, method_name, descriptor)
+        if native is None:
+            raise JavaError("java/lang/NoSuchMethodError" if java_class is not None else "java/lang/NoClassDefFoundError")
+        return CallSite(method_name, (), native, arg_count, get_return_type(method["returns"]))
+
+    def invoke(self, opr: Operation, element: StackElement):
+        call_site = self._call_sites.get(opr)
+        if call_site is None:
+            call_site = self._call_sites[opr] = self.resolve(opr)
+        operational_stack = element.operational_stack
+        args = operational_stack[len(operational_stack) - call_site.arg_count:]
+        del operational_stack[len(operational_stack) - call_site.arg_count:]
+        if call_site.memoized:
+            key = self.get_memo_key(call_site, args)
+            result = self.memo.get(key)
+            if result is not None:
+                operational_stack.append(self.box_result(call_site, result))
+                element.pc += 1
+                return
+        if call_site.native is None and (self.jit_threshold is None or not self.jit(call_site)):
+            # The caller continues once the callee returns, see run
+            self.push_frame(call_site.code, call_site.method_name, args)
+            if call_site.memoized:
+                self._memo_frames.append((len(self.stack), key))
+            return
+        self.call_native(call_site, args, operational_stack)
+        if call_site.memoized:
+            self.memo.put(key, self.unbox(operational_stack[-1]))
+        element.pc += 1
+
+    def invoke_registers(self, opr: RegisterInstruction, element: StackElement):
+        '''invoke, with the arguments and the result in registers'''
+        call_site = self._call_sites.get(opr)
+        if call_site is None:
+            call_site = self._call_sites[opr] = self.resolve(opr)
+        registers = element.local_variables
+        args = [registers[source] for source in opr.sources]
+        if call_site.memoized:
+            key = self.get_memo_key(call_site, args)
+            result = self.memo.get(key)
+            if result is not None:
+                registers[opr.dest] = Value(result, call_site.return_type)
+                element.pc += 1
+                return
+        if call_site.native is None and (self.jit_threshold is None or not self.jit(call_site)):
+            self.push_frame(call_site.code, call_site.method_name, args)
+            if call_site.memoized:
+                self._memo_frames.append((len(self.stack), key))
+            return
+        result = call_site.native(self, [arg.get_value() for arg in args])
+        if call_site.memoized:
+            self.memo.put(key, result)
+        if opr.dest is not None:
+            registers[opr.dest] = Value(result, call_site.return_type)
+        element.pc += 1
+
+    def call(self, opr: Operation, args: List[Any]) -> Any:
+        '''Invoke from compiled code, the arguments and the result are plain values'''
+        call_site = self._call_sites.get(opr)
+        if call_site is None:
+            call_site = self._call_sites[opr] = self.resolve(opr)
+        if call_site.memoized:
+            key = (id(call_site.code),) + tuple(args)
+            result = self.memo.get(key)
+            if result is not None:
+                return result
+        if call_site.native is None and (self.jit_threshold is None or not self.jit(call_site)):
+            result = self.run_code(call_site.code, call_site.method_name, self.box_args(opr, args)).get_value()
         else:
-            self.stack.append(StackElement(element.local_variables, element.operational_stack, element.counter.next_counter()))
+            result = call_site.native(self, args)
+        if call_site.memoized:
+            self.memo.put(key, result)
+        return result
+
+    def get_memo_key(self, call_site: CallSite, args: List[Value]) -> Tuple[Any, ...]:
+        '''The key of a memoized call, the method and the plain values of the arguments'''
+        return (id(call_site.code),) + tuple(arg.get_value() for arg in args)
+
+    def unbox(self, value: Value) -> Any:
+        '''The plain value the memo stores for a result'''
+        return value.get_value()
+
+    def box_result(self, call_site: CallSite, result: Any) -> Value:
+        return Value(result, call_site.return_type)
+
+    def box_args(self, opr: Operation, args: List[Any]) -> List[Value]:
+        types = (["ref"] if opr.access != "static" else []) + [get_return_type(arg) for arg in opr.method["args"]]
+        return [Value(arg, type_name) for arg, type_name in zip(args, types)]
+
+    def jit(self, call_site: CallSite) -> bool:
+        '''Count an invocation of interpreted code, True once the call site calls compiled code'''
+        compiled = self.get_compiled(call_site.code, call_site.arg_count, call_site.method_name)
+        if compiled is None:
+            return False
+        call_site.native = compiled
+        return True
+
+    def get_compiled(self, code: Tuple[Operation, ...], arg_count: int, method_name: str) -> Optional[CompiledMethod]:
+        '''
+        Count an invocation of a method and compile it once it is hot. None
+        while it should be interpreted, and for methods that can not be compiled.
+        '''
+        compiled = self._compiled.find(code, default=False)
+        if compiled is not False:
+            return compiled
+        key = id(code)
+        invocations = self._invocations.get(key, 0) + 1
+        self._invocations[key] = invocations
+        if invocations <= self.jit_threshold:
+            return None
+        try:
+            # Compiled from the instructions as decoded, not as rewritten since
+            compiled = compile_method(self._decoded.get(key, code), arg_count, method_name)
+        except NotImplementedError:
+            compiled = None
+        return self._compiled.get(code, lambda: compiled)
+
+    def call_native(self, call_site: CallSite, args: List[Value], operational_stack: List[Value]):
+        result = call_site.native(self, [arg.get_value() for arg in args])
+        if call_site.return_type is not None:
+            operational_stack.append(Value(result, call_site.return_type))
 
 def run_method_analysis(java_class: JavaClass,
                         method_name: str,
@@ -98,7 +484,18 @@ def run_method(java_class: JavaClass,
                method_name: str, 
                method_args: List[Value],  
                environment: Optional[Dict[Any, Any]]=None, 
-               stdout: OutputBuffer=OutputBuffer()) -> Value:
+               stdout: Optional[OutputSink]=None,
+               max_depth: int=DEFAULT_MAX_DEPTH,
+               natives: Optional[NativeRegistry]=None,
+               gc_threshold: Optional[int]=DEFAULT_THRESHOLD,
+               unboxed: bool=False,
+               profile: Optional[Profile]=None,
+               jit_threshold: Optional[int]=None,
+               blocks: bool=False,
+               superinstructions: Optional[Iterable[str]]=None,
+               quicken: bool=False,
+               registers: bool=False,
+               memo_size: Optional[int]=None) -> Value:
     # This is the entry point, this function should create an
     # Interpreter instance, and then run it with the given
     # properties. It should raise an error
@@ -108,16 +505,28 @@ def run_method(java_class: JavaClass,
     #method_args = wrap(method_args)
 
     args = []
-    memory = {}
+    memory = Heap()
     for arg in method_args:
         if type(arg) is ArrayValue:
-            memory_address = uuid.uuid4()
-            memory[memory_address] = arg
-            args.append(Value(memory_address))
+            args.append(Value(memory.allocate(arg), "ref"))
         elif type(arg) is Value:
             args.append(arg)
 
-    interpreter = Interpreter(java_program=java_class, 
+    interpreter_type = Interpreter
+    if unboxed:
+        from .unboxed import UnboxedInterpreter
+        interpreter_type = UnboxedInterpreter
+    interpreter = interpreter_type(java_program=java_class, 
                               memory=memory, 
-                              stdout=stdout)
+                              stdout=stdout,
+                              max_depth=max_depth,
+                              natives=natives,
+                              gc_threshold=gc_threshold,
+                              profile=profile,
+                              jit_threshold=jit_threshold,
+                              blocks=blocks,
+                              superinstructions=superinstructions,
+                              quicken=quicken,
+                              registers=registers,
+                              memo_size=memo_size)
     return interpreter.run(java_class.name, method_name, args)
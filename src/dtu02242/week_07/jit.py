@@ -0,0 +1,384 @@
+"""
+Compiling methods to Python functions.
+
+compile_method translates the decoded instructions of a method into the
+source of a Python function and compiles it with exec. The function works on
+plain values like the unboxed interpreter: Java locals become the Python
+locals l0, l1, .. and the operand stack the Python locals s0, s1, .., the
+stack depth before every instruction is the same on every path reaching it,
+so it is known when the method is compiled. Within a basic block the stack
+is not even stored, push, load and arithmetic instructions build one Python
+expression that is only assigned to a stack local when a block ends or the
+value is needed twice. Every basic block is an if on a pc local, methods with
+backward branches wrap the blocks in a while loop.
+
+A compiled method has the signature of a native, it is called with the
+runner and the plain values of its arguments and returns the plain value of
+its result, so the interpreters call it through the call site like any other
+native. Instructions and invokes in the method keep the semantics of the
+ByteCode handlers, ints are not wrapped. Methods with instructions ByteCode
+has no handler for raise NotImplementedError and stay interpreted.
+
+Compiled code does not hold on to an interpreter, it reaches the call stack
+depth, the heap and invoked methods through the runner. Every interpreter
+keeps the methods it compiled. The references held
+in Python locals are invisible to the garbage collector, so the interpreters
+do not collect while compiled code runs.
+"""
+from typing import Any, Callable, Dict, List, Tuple
+import re
+
+from .data_structures import Value, ArrayValue, IndexOutOfBounds, JavaError, PrimitiveArrayValue, PRIMITIVE_ARRAY_KINDS
+from .bytecode import Operation
+from dtu02242.jvm.natives import get_return_type
+from dtu02242.jvm.superinstructions import unfuse
+
+CompiledMethod = Callable[[Any, List[Any]], Any]
+
+# Stack depth change of the instructions that do not branch, invoke or leave the method
+STACK_EFFECTS = {
+    "push": 1, "load": 1, "store": -1, "dup": 1, "incr": 0,
+    "binary-add": -1, "binary-sub": -1, "binary-mul": -1,
+    "newarray": 0, "array_store": -3, "array_load": -1, "arraylength": 0,
+    "get": 1, "new": 1, "goto": 0,
+}
+
+BINARY_OPERATORS = {"binary-add": "+", "binary-sub": "-", "binary-mul": "*"}
+
+# The branches of ByteCode, comparing two values or one value to zero
+BRANCH_OPERATORS = {
+    "if-lt": "<", "if-le": "<=", "if-gt": ">", "if-ge": ">=",
+    "ifz-le": "<=", "ifz-ne": "!=",
+}
+
+ZERO = Value(0)
+
+
+def array_load(memory: Any, ref: int, index: int) -> Any:
+    arr: ArrayValue = memory[ref]
+    if index < 0 or arr.get_length() <= index:
+        raise IndexOutOfBounds()
+    if type(arr) is PrimitiveArrayValue:
+        return arr.get_value()[index]
+    return arr[index].get_value()
+
+
+def array_store(memory: Any, ref: int, index: int, value: Any, type_name: str):
+    arr: ArrayValue = memory[ref]
+    if index < 0 or arr.get_length() <= index:
+        raise IndexOutOfBounds()
+    if type(arr) is PrimitiveArrayValue:
+        # Let the array truncate it
+        arr[index] = Value(value)
+    else:
+        arr[index] = Value(value, type_name)
+
+
+def new_array(size: int, kind: Any) -> ArrayValue:
+    if type(kind) is str and kind in PRIMITIVE_ARRAY_KINDS:
+        return PrimitiveArrayValue(size, kind)
+    return ArrayValue(size, ZERO)
+
+
+def enter(runner: Any):
+    '''Account for a compiled frame, like push_frame does for interpreted ones'''
+    runner.compiled_depth += 1
+    if len(runner.stack) + runner.compiled_depth > runner.max_depth:
+        runner.compiled_depth -= 1
+        raise JavaError("java/lang/StackOverflowError")
+
+
+class MethodCompiler:
+    '''Translates the instructions of one method, see the module documentation'''
+    code: Tuple[Operation, ...]
+    arg_count: int
+    lines: List[str]
+    constants: Dict[str, Any]
+    # Python expressions of the operand stack of the instruction being translated
+    stack: List[str]
+
+    def __init__(self, code: Tuple[Operation, ...], arg_count: int, name: str = "compiled"):
+        # Superinstructions are compiled from the instructions they fuse
+        self.code = unfuse(code)
+        self.arg_count = arg_count
+        self.name = re.sub(r"\W", "_", name)
+        self.lines = []
+        self.constants = {}
+        self.stack = []
+        self.indent = ""
+        self.method_mapper: Dict[str, Callable[[Operation, int], bool]] = {
+            "push": self.translate_push,
+            "load": self.translate_load,
+            "store": self.translate_store,
+            "dup": self.translate_dup,
+            "incr": self.translate_increment,
+            **{name: self.translate_binary for name in BINARY_OPERATORS},
+            **{name: self.translate_branch for name in BRANCH_OPERATORS},
+            "goto": self.translate_goto,
+            "newarray": self.translate_new_array,
+            "array_store": self.translate_array_store,
+            "array_load": self.translate_array_load,
+            "arraylength": self.translate_array_length,
+            "get": self.translate_get,
+            "new": self.translate_new,
+            "invoke": self.translate_invoke,
+            "throw": self.translate_throw,
+            "return": self.translate_return,
+        }
+        for opr in self.code:
+            if opr.get_name() not in self.method_mapper:
+                raise NotImplementedError(f"{opr.get_name()} can not be compiled")
+        self.depths = self.compute_depths()
+
+    def compute_depths(self) -> List[int]:
+        '''Operand stack depth before every instruction, -1 for unreachable ones'''
+        depths = [-1] * len(self.code)
+        pending = [(0, 0)]
+        while pending:
+            pc, depth = pending.pop()
+            if depths[pc] >= 0:
+                continue
+            depths[pc] = depth
+            opr = self.code[pc]
+            name = opr.get_name()
+            if name in ("return", "throw"):
+                continue
+            if name == "invoke":
+                arg_count = len(opr.method["args"]) + (opr.access != "static")
+                pending.append((pc + 1, depth - arg_count + (opr.method["returns"] is not None)))
+            elif name in BRANCH_OPERATORS:
+                depth -= 2 if opr.opr == "if" else 1
+                pending.append((pc + 1, depth))
+                pending.append((opr.target, depth))
+            elif name == "goto":
+                pending.append((opr.target, depth))
+            else:
+                pending.append((pc + 1, depth + STACK_EFFECTS[name]))
+        return depths
+
+    def get_leaders(self) -> List[int]:
+        '''First instructions of the basic blocks'''
+        leaders = {0}
+        for pc, opr in enumerate(self.code):
+            if opr.target is not None:
+                leaders.add(opr.target)
+            if opr.target is not None or opr.opr in ("return", "throw"):
+                leaders.add(pc + 1)
+        return sorted(pc for pc in leaders if pc < len(self.code) and self.depths[pc] >= 0)
+
+    def constant(self, value: Any) -> str:
+        '''Name of a global holding value, for values without a literal'''
+        name = f"c{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def emit(self, line: str):
+        self.lines.append(self.indent + line)
+
+    # Operand stack
+
+    def push(self, expression: str):
+        self.stack.append(expression)
+
+    def pop(self) -> str:
+        return self.stack.pop()
+
+    def spill(self, name: str, keep: int = -1):
+        '''Store the pending expressions using the local name before it is assigned'''
+        pattern = re.compile(rf"\b{name}\b")
+        for position, expression in enumerate(self.stack):
+            if position != keep and expression != f"s{position}" and pattern.search(expression):
+                self.materialize(position)
+
+    def materialize(self, position: int):
+        '''Assign the expression at position of the stack to its stack local'''
+        name = f"s{position}"
+        expression = self.stack[position]
+        if expression == name:
+            return
+        self.spill(name, keep=position)
+        self.emit(f"{name} = {expression}")
+        self.stack[position] = name
+
+    def assign(self, expression: str) -> str:
+        '''Assign the result of an instruction with side effects to the next stack local and push it'''
+        name = f"s{len(self.stack)}"
+        self.spill(name)
+        self.emit(f"{name} = {expression}")
+        self.push(name)
+        return name
+
+    def flush(self):
+        for position in range(len(self.stack)):
+            self.materialize(position)
+
+    def jump(self, pc: int, target: int):
+        self.emit(f"pc = {target}")
+        if target <= pc:
+            self.emit("continue")
+
+    # Instructions, they return whether the block continues after them
+
+    def translate_push(self, opr: Operation, pc: int) -> bool:
+        value = opr.value.get_value()
+        self.push(repr(value) if type(value) in (int, bool) or value is None else self.constant(value))
+        return True
+
+    def translate_load(self, opr: Operation, pc: int) -> bool:
+        self.push(f"l{opr.index}")
+        return True
+
+    def translate_store(self, opr: Operation, pc: int) -> bool:
+        value = self.pop()
+        self.spill(f"l{opr.index}")
+        self.emit(f"l{opr.index} = {value}")
+        return True
+
+    def translate_increment(self, opr: Operation, pc: int) -> bool:
+        self.spill(f"l{opr.index}")
+        self.emit(f"l{opr.index} += {opr.amount}")
+        return True
+
+    def translate_dup(self, opr: Operation, pc: int) -> bool:
+        self.materialize(len(self.stack) - 1)
+        self.push(self.stack[-1])
+        return True
+
+    def translate_binary(self, opr: Operation, pc: int) -> bool:
+        second = self.pop()
+        first = self.pop()
+        self.push(f"({first} {BINARY_OPERATORS[opr.get_name()]} {second})")
+        return True
+
+    def translate_branch(self, opr: Operation, pc: int) -> bool:
+        second = self.pop() if opr.opr == "if" else "0"
+        first = self.pop()
+        self.flush()
+        self.emit(f"if {first} {BRANCH_OPERATORS[opr.get_name()]} {second}:")
+        self.indent += "    "
+        self.jump(pc, opr.target)
+        self.indent = self.indent[:-4]
+        self.emit("else:")
+        self.emit(f"    pc = {pc + 1}")
+        return False
+
+    def translate_goto(self, opr: Operation, pc: int) -> bool:
+        self.flush()
+        self.jump(pc, opr.target)
+        return False
+
+    def translate_new_array(self, opr: Operation, pc: int) -> bool:
+        size = self.pop()
+        self.assign(f"runner.allocate(new_array({size}, {self.constant(opr.type)}))")
+        return True
+
+    def translate_array_store(self, opr: Operation, pc: int) -> bool:
+        value = self.pop()
+        index = self.pop()
+        ref = self.pop()
+        self.emit(f"array_store(runner.memory, {ref}, {index}, {value}, {self.constant(get_return_type(opr.type))})")
+        return True
+
+    def translate_array_load(self, opr: Operation, pc: int) -> bool:
+        index = self.pop()
+        ref = self.pop()
+        self.assign(f"array_load(runner.memory, {ref}, {index})")
+        return True
+
+    def translate_array_length(self, opr: Operation, pc: int) -> bool:
+        ref = self.pop()
+        self.assign(f"runner.memory[{ref}].get_length()")
+        return True
+
+    def translate_get(self, opr: Operation, pc: int) -> bool:
+        # Same placeholder as the handler
+        self.push("0")
+        return True
+
+    def translate_new(self, opr: Operation, pc: int) -> bool:
+        self.assign(f"runner.allocate({self.constant(opr.class_)})")
+        return True
+
+    def translate_invoke(self, opr: Operation, pc: int) -> bool:
+        arg_count = len(opr.method["args"]) + (opr.access != "static")
+        args = self.stack[len(self.stack) - arg_count:]
+        del self.stack[len(self.stack) - arg_count:]
+        call = f"runner.call({self.constant(opr)}, [{', '.join(args)}])"
+        if opr.method["returns"] is None:
+            self.emit(call)
+        else:
+            self.assign(call)
+        return True
+
+    def translate_throw(self, opr: Operation, pc: int) -> bool:
+        self.emit(f"raise JavaError(runner.memory[{self.pop()}])")
+        return False
+
+    def translate_return(self, opr: Operation, pc: int) -> bool:
+        self.emit("return None" if opr.type is None else f"return {self.pop()}")
+        return False
+
+    def translate(self) -> str:
+        '''The source of the compiled function'''
+        leaders = self.get_leaders()
+        looping = any(opr.target is not None and opr.target <= pc for pc, opr in enumerate(self.code))
+        max_locals = max([opr.index + 1 for opr in self.code if opr.index is not None] + [self.arg_count])
+        self.lines = [f"def {self.name}(runner, args):"]
+        self.indent = "    "
+        if self.arg_count > 0:
+            self.emit(f"{''.join(f'l{index}, ' for index in range(self.arg_count))}= args")
+        if max_locals > self.arg_count:
+            self.emit(f"{' = '.join(f'l{index}' for index in range(self.arg_count, max_locals))} = None")
+        self.emit("enter(runner)")
+        self.emit("try:")
+        self.indent += "    "
+        if len(leaders) > 1:
+            self.emit("pc = 0")
+        if looping:
+            self.emit("while True:")
+            self.indent += "    "
+        block_indent = self.indent
+        for block, start in enumerate(leaders):
+            end = leaders[block + 1] if block + 1 < len(leaders) else len(self.code)
+            self.indent = block_indent
+            if len(leaders) > 1:
+                self.emit(f"if pc == {start}:")
+                self.indent += "    "
+            self.stack = [f"s{position}" for position in range(self.depths[start])]
+            falls_through = True
+            for pc in range(start, end):
+                opr = self.code[pc]
+                falls_through = self.method_mapper[opr.get_name()](opr, pc)
+                if not falls_through:
+                    break
+            if falls_through:
+                self.flush()
+                self.emit(f"pc = {end}")
+        self.indent = "    "
+        self.emit("finally:")
+        self.emit("    runner.compiled_depth -= 1")
+        return "\n".join(self.lines) + "\n"
+
+    def compile(self) -> CompiledMethod:
+        source = self.translate()
+        namespace: Dict[str, Any] = {
+            "JavaError": JavaError,
+            "array_load": array_load,
+            "array_store": array_store,
+            "new_array": new_array,
+            "enter": enter,
+            **self.constants,
+        }
+        exec(compile(source, f"<compiled {self.name}>", "exec"), namespace)
+        compiled = namespace[self.name]
+        compiled.source = source
+        return compiled
+
+
+def compile_method(code: Tuple[Operation, ...], arg_count: int, name: str = "compiled") -> CompiledMethod:
+    '''
+    Compile the instructions of a method taking arg_count arguments, the
+    receiver included. Raises NotImplementedError when the method has
+    instructions that can not be compiled.
+    '''
+    return MethodCompiler(code, arg_count, name).compile()
@@ -0,0 +1,145 @@
+"""
+Memoization of pure methods.
+
+A method is pure when running it twice on the same arguments gives the same
+result and changes nothing, so a call can be answered with the result of an
+earlier one. PurityAnalysis decides it from the bytecode of the method and of
+every method it invokes: none of them may write a field or an array, allocate,
+read a static field or invoke anything but static methods of the program,
+which leaves out the natives that print. The methods worth memoizing are the
+pure ones taking and returning primitives only, references could point at
+arrays that changed in between.
+
+The interpreter keeps the results in a MemoTable by method and arguments. It
+holds at most max_size results and evicts the least recently used one past
+that, hits and misses are counted. An invoke of a memoized method that misses
+pushes the frame of the method as usual and the result is stored once that
+frame returns, see Interpreter.return_to_caller.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .parser import JavaProgram, get_invoke_descriptor
+
+# Instructions that write to the heap or allocate
+IMPURE_OPRS = ("put", "array_store", "new", "newarray", "monitorenter", "monitorexit", "throw")
+
+# Static fields that never change once the class is loaded
+CONSTANT_FIELDS = ("$assertionsDisabled",)
+
+MethodKey = Tuple[str, str, Optional[str]]
+
+
+def is_primitive(java_type: Any) -> bool:
+    return java_type is not None and "base" in java_type
+
+
+class PurityAnalysis:
+    '''Which methods of a program are pure, computed once per method'''
+    java_program: JavaProgram
+    _pure: Dict[MethodKey, bool]
+
+    def __init__(self, java_program: JavaProgram):
+        self.java_program = java_program
+        self._pure = {}
+
+    def get_callees(self, class_name: str, method_name: str, descriptor: Optional[str]) -> Optional[List[MethodKey]]:
+        '''The methods a method invokes, None when the method itself is impure or not in the program'''
+        java_class = self.java_program.get_class(class_name=class_name)
+        method = java_class.find_method(method_name, descriptor) if java_class is not None else None
+        if method is None or not method.get("code"):
+            return None
+        callees = []
+        for bytecode in method["code"]["bytecode"]:
+            opr = bytecode["opr"]
+            if opr in IMPURE_OPRS:
+                return None
+            if opr == "get" and not (bytecode.get("static") and bytecode["field"]["name"] in CONSTANT_FIELDS):
+                return None
+            if opr == "invoke":
+                if bytecode.get("access") != "static":
+                    return None
+                method_ref = bytecode["method"]
+                callees.append((method_ref["ref"]["name"], method_ref["name"], get_invoke_descriptor(method_ref)))
+        return callees
+
+    def is_pure(self, class_name: str, method_name: str, descriptor: Optional[str] = None) -> bool:
+        key = (class_name, method_name, descriptor)
+        if key in self._pure:
+            return self._pure[key]
+        # Pure when every method reachable through invokes is, recursive calls included
+        seen = {key}
+        work = [key]
+        pure = True
+        while work and pure:
+            current = work.pop()
+            known = self._pure.get(current)
+            if known is not None:
+                pure = known
+                continue
+            callees = self.get_callees(*current)
+            if callees is None:
+                pure = False
+                continue
+            for callee in callees:
+                if callee not in seen:
+                    seen.add(callee)
+                    work.append(callee)
+        if pure:
+            for method_key in seen:
+                self._pure[method_key] = True
+        else:
+            self._pure[key] = False
+        return pure
+
+    def is_memoizable(self, class_name: str, method_name: str, descriptor: Optional[str] = None) -> bool:
+        '''Whether a method is pure and takes and returns primitives only'''
+        java_class = self.java_program.get_class(class_name=class_name)
+        method = java_class.find_method(method_name, descriptor) if java_class is not None else None
+        if method is None:
+            return False
+        return (is_primitive(method["returns"]["type"])
+                and all(is_primitive(param["type"]) for param in method["params"])
+                and self.is_pure(class_name, method_name, descriptor))
+
+
+class MemoTable:
+    '''The results of memoized calls, the least recently used are evicted past max_size'''
+    results: 'OrderedDict[Hashable, Any]'
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, max_size: int):
+        if max_size <= 0:
+            raise Exception(f"A memo table needs room for at least one result, not {max_size}")
+        self.results = OrderedDict()
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def get(self, key: Hashable) -> Any:
+        '''The result stored for key, None when there is none'''
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.results.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key: Hashable, result: Any) -> None:
+        self.results[key] = result
+        self.results.move_to_end(key)
+        if len(self.results) > self.max_size:
+            self.results.popitem(last=False)
+            self.evictions += 1
+
+    def hit_rate(self) -> float:
+        calls = self.hits + self.misses
+        return self.hits / calls if calls > 0 else 0.0
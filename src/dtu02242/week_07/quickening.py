@@ -0,0 +1,234 @@
+"""
+Quickening, instructions rewritten into int only variants as they execute.
+
+The generic handlers work on any Value and go through its operators. The
+first time QuickeningByteCode executes an arithmetic instruction, a
+comparison, an incr or an array access on int operands, it replaces the
+instruction in the instructions of the method with a copy whose opcode is an
+int variant, ie. int-add for binary-add. The int variants work on the plain
+ints inside the values and skip the operators.
+
+Every int variant guards the types it was specialised for. When they change,
+the instruction is deoptimized: the generic instruction is put back and
+executes the operands at hand. Instructions are only quickened on their first
+execution, one that was deoptimized or started out on other types stays
+generic.
+
+Quickening rewrites the instructions of a method, so the interpreter gives
+every method a list of its own instead of the decoded tuple shared by all
+interpreters, see Interpreter.get_instructions.
+"""
+from copy import copy
+from typing import Callable, Dict, Set, Tuple
+
+from .bytecode import ByteCode, IInterp, Operation, StackElement
+from .data_structures import IndexOutOfBounds, PrimitiveArrayValue, Value
+from dtu02242.jvm.opcodes import OPCODES, build_dispatch_table, get_opcode
+
+
+def are_ints(element: StackElement, count: int) -> bool:
+    '''Whether the count values on top of the operand stack hold ints'''
+    stack = element.operational_stack
+    return all(type(value._value) is int for value in stack[len(stack) - count:])
+
+
+def is_int_array(arr: object) -> bool:
+    return type(arr) is PrimitiveArrayValue and arr._value.typecode == "i"
+
+
+def refers_to_int_array(runner: IInterp, value: Value) -> bool:
+    return type(value._value) is int and is_int_array(runner.memory[value._value])
+
+
+# Guards deciding whether an instruction is quickened, and the int variant it becomes
+QUICKENINGS: Dict[str, Tuple[str, Callable[[IInterp, Operation, StackElement], bool]]] = {
+    "binary-add": ("int-add", lambda runner, opr, element: are_ints(element, 2)),
+    "binary-sub": ("int-sub", lambda runner, opr, element: are_ints(element, 2)),
+    "binary-mul": ("int-mul", lambda runner, opr, element: are_ints(element, 2)),
+    "if-lt": ("int-if-lt", lambda runner, opr, element: are_ints(element, 2)),
+    "if-le": ("int-if-le", lambda runner, opr, element: are_ints(element, 2)),
+    "if-gt": ("int-if-gt", lambda runner, opr, element: are_ints(element, 2)),
+    "if-ge": ("int-if-ge", lambda runner, opr, element: are_ints(element, 2)),
+    "ifz-le": ("int-ifz-le", lambda runner, opr, element: are_ints(element, 1)),
+    "ifz-ne": ("int-ifz-ne", lambda runner, opr, element: are_ints(element, 1)),
+    "incr": ("int-incr", lambda runner, opr, element: type(element.local_variables[opr.index]._value) is int),
+    "array_load": ("int-array_load", lambda runner, opr, element: refers_to_int_array(runner, element.operational_stack[-2])),
+    "array_store": ("int-array_store", lambda runner, opr, element: refers_to_int_array(runner, element.operational_stack[-3])
+                    and are_ints(element, 1)),
+}
+
+
+class QuickeningByteCode(ByteCode):
+    # Whether the handlers rewrite the instructions they execute
+    rewrites_code = True
+    # Instructions that executed once, they are not quickened anymore
+    settled: Set[Operation]
+    quickened_count: int
+    deoptimized_count: int
+
+    def __init__(self):
+        super().__init__()
+        self.settled = set()
+        self.quickened_count = 0
+        self.deoptimized_count = 0
+        # The generic handlers by opcode, they execute the instruction after trying to quicken it
+        self.generic = self.handlers
+        self.method_mapper.update({name: self.perform_quickening for name in QUICKENINGS})
+        self.method_mapper.update({
+            "int-add": self.perform_int_add,
+            "int-sub": self.perform_int_sub,
+            "int-mul": self.perform_int_multiplication,
+            "int-if-lt": self.perform_int_strictly_less,
+            "int-if-le": self.perform_int_less_or_equal,
+            "int-if-gt": self.perform_int_strictly_greater,
+            "int-if-ge": self.perform_int_greater_or_equal,
+            "int-ifz-le": self.perform_int_less_than_or_equal_zero,
+            "int-ifz-ne": self.perform_int_not_equal_zero,
+            "int-incr": self.perform_int_increment,
+            "int-array_load": self.perform_int_array_load,
+            "int-array_store": self.perform_int_array_store,
+        })
+        self.handlers = build_dispatch_table(self.method_mapper, self.perform_unknown)
+
+    def perform_quickening(self, runner: IInterp, opr: Operation, element: StackElement):
+        if opr not in self.settled:
+            self.settled.add(opr)
+            quickened, guard = QUICKENINGS[opr.get_name()]
+            code = element.code
+            # Parts of superinstructions are not in the instructions dispatched on
+            if type(code) is list and code[element.pc] is opr and guard(runner, opr, element):
+                quick = copy(opr)
+                quick.opcode = OPCODES[quickened]
+                code[element.pc] = quick
+                self.quickened_count += 1
+        self.generic[opr.opcode](runner, opr, element)
+
+    def deoptimize(self, runner: IInterp, opr: Operation, element: StackElement):
+        '''The guard of a quickened instruction failed, put the generic one back and execute it'''
+        self.deoptimized_count += 1
+        generic = copy(opr)
+        generic.opcode = get_opcode(opr.get_name())
+        self.settled.add(generic)
+        element.code[element.pc] = generic
+        self.generic[generic.opcode](runner, generic, element)
+
+    def perform_int_add(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        first = stack[-2]
+        second = stack[-1]
+        if type(first._value) is not int or type(second._value) is not int:
+            return self.deoptimize(runner, opr, element)
+        del stack[-1]
+        stack[-1] = Value(first._value + second._value, first.type_name)
+        element.pc += 1
+
+    def perform_int_sub(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        first = stack[-2]
+        second = stack[-1]
+        if type(first._value) is not int or type(second._value) is not int:
+            return self.deoptimize(runner, opr, element)
+        del stack[-1]
+        stack[-1] = Value(first._value - second._value, first.type_name)
+        element.pc += 1
+
+    def perform_int_multiplication(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        first = stack[-2]
+        second = stack[-1]
+        if type(first._value) is not int or type(second._value) is not int:
+            return self.deoptimize(runner, opr, element)
+        del stack[-1]
+        stack[-1] = Value(first._value * second._value, first.type_name)
+        element.pc += 1
+
+    def perform_int_strictly_less(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        first = stack[-2]._value
+        second = stack[-1]._value
+        if type(first) is not int or type(second) is not int:
+            return self.deoptimize(runner, opr, element)
+        del stack[-2:]
+        element.pc = opr.target if first < second else element.pc + 1
+
+    def perform_int_less_or_equal(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        first = stack[-2]._value
+        second = stack[-1]._value
+        if type(first) is not int or type(second) is not int:
+            return self.deoptimize(runner, opr, element)
+        del stack[-2:]
+        element.pc = opr.target if first <= second else element.pc + 1
+
+    def perform_int_strictly_greater(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        first = stack[-2]._value
+        second = stack[-1]._value
+        if type(first) is not int or type(second) is not int:
+            return self.deoptimize(runner, opr, element)
+        del stack[-2:]
+        element.pc = opr.target if first > second else element.pc + 1
+
+    def perform_int_greater_or_equal(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        first = stack[-2]._value
+        second = stack[-1]._value
+        if type(first) is not int or type(second) is not int:
+            return self.deoptimize(runner, opr, element)
+        del stack[-2:]
+        element.pc = opr.target if first >= second else element.pc + 1
+
+    def perform_int_less_than_or_equal_zero(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        first = stack[-1]._value
+        if type(first) is not int:
+            return self.deoptimize(runner, opr, element)
+        del stack[-1]
+        element.pc = opr.target if first <= 0 else element.pc + 1
+
+    def perform_int_not_equal_zero(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        first = stack[-1]._value
+        if type(first) is not int:
+            return self.deoptimize(runner, opr, element)
+        del stack[-1]
+        element.pc = opr.target if first != 0 else element.pc + 1
+
+    def perform_int_increment(self, runner: IInterp, opr: Operation, element: StackElement):
+        local_vars = element.local_variables
+        local = local_vars[opr.index]
+        if type(local._value) is not int:
+            return self.deoptimize(runner, opr, element)
+        local_vars[opr.index] = Value(local._value + opr.amount, local.type_name)
+        element.pc += 1
+
+    def perform_int_array_load(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        index = stack[-1].get_value()
+        arr = runner.memory[stack[-2].get_value()]
+        if not is_int_array(arr):
+            return self.deoptimize(runner, opr, element)
+        raw = arr._value
+        if index < 0 or len(raw) <= index:
+            raise IndexOutOfBounds()
+        del stack[-1]
+        stack[-1] = Value(raw[index], arr._element_type)
+        element.pc += 1
+
+    def perform_int_array_store(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        value = stack[-1]
+        index = stack[-2].get_value()
+        arr = runner.memory[stack[-3].get_value()]
+        if not is_int_array(arr) or type(value._value) is not int:
+            return self.deoptimize(runner, opr, element)
+        raw = arr._value
+        if index < 0 or len(raw) <= index:
+            raise IndexOutOfBounds()
+        del stack[-3:]
+        try:
+            raw[index] = value._value
+        except OverflowError:
+            # PrimitiveArrayValue truncates like Java does
+            arr[index] = value
+        element.pc += 1
@@ -0,0 +1,149 @@
+"""
+The interpreter on register code, see jvm/registers.py.
+
+A frame of register code keeps its registers in local_variables, the enter
+instruction pads them to the register count of the method and sets its
+constants. Moves, arithmetic, branches and returns have handlers working on
+the registers directly, invokes go through Interpreter.invoke_registers and
+every other instruction runs the ByteCode handler of its stack instruction
+on the sources pushed onto the operand stack of the frame.
+"""
+from typing import Dict, List, Optional
+
+from .bytecode import ByteCode, IInterp, StackElement, ZERO
+from .data_structures import Value
+from dtu02242.jvm.opcodes import build_dispatch_table
+from dtu02242.jvm.registers import RegisterInstruction
+
+
+class RegisterByteCode(ByteCode):
+    def __init__(self):
+        super().__init__()
+        # The handlers of the stack instructions, by opcode
+        self.stack_handlers = self.handlers
+        self.method_mapper = {name: self.perform_on_stack for name in self.method_mapper}
+        self.method_mapper.update({
+            "enter": self.perform_enter,
+            "move": self.perform_move,
+            "return": self.perform_return,
+            "binary-add": self.perform_add,
+            "binary-sub": self.perform_sub,
+            "binary-mul": self.perform_multiplication,
+            "if-lt": self.perform_strictly_less,
+            "if-le": self.perform_less_or_equal,
+            "if-gt": self.perform_strictly_greater,
+            "if-ge": self.perform_greater_or_equal,
+            "ifz-le": self.perform_less_than_or_equal_zero,
+            "ifz-ne": self.perform_not_equal_zero,
+            "incr": self.perform_increment,
+            "goto": self.perform_goto,
+            "invoke": self.perform_invoke,
+        })
+        self.handlers = build_dispatch_table(self.method_mapper, self.perform_unknown)
+        # The registers a frame starts with past its arguments, by enter instruction
+        self.templates: Dict[RegisterInstruction, List[Optional[Value]]] = {}
+
+    def perform_on_stack(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        registers = element.local_variables
+        stack = element.operational_stack
+        stack.extend([registers[source] for source in opr.sources])
+        self.stack_handlers[opr.opcode](runner, opr, element)
+        if opr.dest is not None:
+            registers[opr.dest] = stack.pop()
+        # Handlers that ignore some of their operands, like get on an instance field
+        if stack:
+            stack.clear()
+
+    def perform_enter(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        template = self.templates.get(opr)
+        if template is None:
+            template = self.templates[opr] = [None] * opr.register_count
+            for register, push in opr.constants:
+                template[register] = push.value
+        registers = element.local_variables
+        # The arguments only fill locals, the constants come after those
+        registers.extend(template[len(registers):])
+        element.pc += 1
+
+    def perform_move(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        registers = element.local_variables
+        registers[opr.dest] = registers[opr.sources[0]]
+        element.pc += 1
+
+    def perform_return(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        if not opr.sources:
+            return Value(None)
+        return element.local_variables[opr.sources[0]]
+
+    def perform_add(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        registers = element.local_variables
+        first, second = opr.sources
+        registers[opr.dest] = registers[first] + registers[second]
+        element.pc += 1
+
+    def perform_sub(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        registers = element.local_variables
+        first, second = opr.sources
+        registers[opr.dest] = registers[first] - registers[second]
+        element.pc += 1
+
+    def perform_multiplication(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        registers = element.local_variables
+        first, second = opr.sources
+        registers[opr.dest] = registers[first] * registers[second]
+        element.pc += 1
+
+    def perform_strictly_less(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        registers = element.local_variables
+        first, second = opr.sources
+        if registers[first] < registers[second]:
+            element.pc = opr.target
+        else:
+            element.pc += 1
+
+    def perform_less_or_equal(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        registers = element.local_variables
+        first, second = opr.sources
+        if registers[first] <= registers[second]:
+            element.pc = opr.target
+        else:
+            element.pc += 1
+
+    def perform_strictly_greater(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        registers = element.local_variables
+        first, second = opr.sources
+        if registers[first] > registers[second]:
+            element.pc = opr.target
+        else:
+            element.pc += 1
+
+    def perform_greater_or_equal(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        registers = element.local_variables
+        first, second = opr.sources
+        if registers[first] >= registers[second]:
+            element.pc = opr.target
+        else:
+            element.pc += 1
+
+    def perform_less_than_or_equal_zero(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        if element.local_variables[opr.sources[0]] <= ZERO:
+            element.pc = opr.target
+        else:
+            element.pc += 1
+
+    def perform_not_equal_zero(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        if element.local_variables[opr.sources[0]] != ZERO:
+            element.pc = opr.target
+        else:
+            element.pc += 1
+
+    def perform_increment(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        registers = element.local_variables
+        registers[opr.dest] = registers[opr.dest] + Value(opr.instruction.amount)
+        element.pc += 1
+
+    def perform_goto(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        element.pc = opr.target
+
+    def perform_invoke(self, runner: IInterp, opr: RegisterInstruction, element: StackElement):
+        runner.invoke_registers(opr, element)
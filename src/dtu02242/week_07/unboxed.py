@@ -0,0 +1,300 @@
+"""
+Unboxed execution, the operand stacks and locals hold plain Python values.
+
+The boxed handlers in bytecode.py wrap every intermediate result in a Value,
+so an arithmetic heavy method allocates a Value per instruction. Here ints,
+booleans and references live on the stack as Python ints and floats, and the
+type tags are taken from the decoded instructions where they are needed: a
+store into a boxed array tags the element with the type of the array_store,
+and the result of a method with its declared return type. Values are only
+created at the boundary, when the arguments of run are unwrapped and when its
+result is wrapped again.
+
+Plain ints do not tell the collector which of them are references, so the
+slots of a frame are tagged instead: get_slot_tags follows the types of the
+instructions of a method through it, for the locals and the stack before
+every instruction, and only slots tagged as references are roots. Slots the
+tags do not know, like locals a merge gives two types and the whole frame of
+methods with instructions the tags can not follow, are scanned
+conservatively, every int in them that is a live reference is a root.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .data_structures import Value, ArrayValue, IndexOutOfBounds, JavaError, PrimitiveArrayValue, PRIMITIVE_ARRAY_KINDS
+from .bytecode import ByteCode, IInterp, Operation, StackElement
+from .interpreter import Interpreter, CallSite
+from .parser import JavaClass, JsonDict
+from dtu02242.jvm.codecache import CodeCache
+from dtu02242.jvm.natives import RETURN_TYPES, get_class_type, get_value_type
+from dtu02242.jvm.registers import NO_FALL_THROUGH, get_stack_effect
+
+# Whether a slot holds a reference, None when it is not known
+SlotTags = Tuple[Optional[bool], ...]
+
+# Pushed values that are not references
+PRIMITIVE_PUSHES = ("integer", "long", "float", "double", "boolean", "char", "byte", "short")
+
+
+def get_array_store_type(type_name: str) -> str:
+    '''Type name of a value stored by an array_store of the given type'''
+    return RETURN_TYPES.get(type_name, type_name)
+
+
+def is_reference(java_type: Any) -> Optional[bool]:
+    '''Whether a jvm2json type is a reference, the type of an instruction or of a declaration'''
+    if java_type is None:
+        return None
+    if type(java_type) is str:
+        return java_type == "ref"
+    return "base" not in java_type and get_class_type(java_type) == "ref"
+
+
+def merge_tags(first: SlotTags, second: SlotTags) -> SlotTags:
+    width = max(len(first), len(second))
+    first, second = first + (None,) * (width - len(first)), second + (None,) * (width - len(second))
+    return tuple(tag if tag == other else None for tag, other in zip(first, second))
+
+
+def get_slot_tags(method: JsonDict) -> Optional[List[Optional[Tuple[SlotTags, SlotTags]]]]:
+    '''
+    The tags of the locals and of the stack before every instruction of a
+    method, None for instructions that are never reached. None for methods
+    with instructions the tags can not follow.
+    '''
+    bytecode = method["code"]["bytecode"]
+    receiver = (True,) if "static" not in method["access"] else ()
+    tags: List[Optional[Tuple[SlotTags, SlotTags]]] = [None] * len(bytecode)
+    tags[0] = (receiver + tuple(is_reference(param["type"]) for param in method["params"]), ())
+    work = [0]
+    while work:
+        pc = work.pop()
+        instruction = bytecode[pc]
+        opr = instruction["opr"]
+        local_tags, stack_tags = tags[pc]
+        try:
+            pops, pushes = get_stack_effect(instruction)
+        except NotImplementedError:
+            return None
+        if pops > len(stack_tags):
+            return None
+        stack = list(stack_tags[:len(stack_tags) - pops])
+        if opr == "dup":
+            stack += [stack_tags[-1]] * 2
+        elif opr == "push":
+            value = instruction["value"]
+            stack.append(value is None or value["type"] not in PRIMITIVE_PUSHES)
+        elif opr in ("load", "array_load"):
+            stack.append(is_reference(instruction["type"]))
+        elif opr in ("new", "newarray", "checkcast"):
+            stack.append(True)
+        elif opr == "get":
+            stack.append(is_reference(instruction["field"]["type"]))
+        elif opr == "invoke":
+            stack += [is_reference(instruction["method"]["returns"])] * pushes
+        else:
+            stack += [False] * pushes
+        if opr == "store":
+            index = instruction["index"]
+            local_tags = local_tags + (None,) * (index + 1 - len(local_tags))
+            # The stored value keeps its tag, a boxed integer is stored as a ref
+            stored = stack_tags[-1] if stack_tags[-1] is not None else is_reference(instruction["type"])
+            local_tags = local_tags[:index] + (stored,) + local_tags[index + 1:]
+        successors = []
+        if "target" in instruction:
+            successors.append(instruction["target"])
+        if opr not in NO_FALL_THROUGH and pc + 1 < len(bytecode):
+            successors.append(pc + 1)
+        state = (local_tags, tuple(stack))
+        for successor in successors:
+            known = tags[successor]
+            merged = state
+            if known is not None:
+                if len(known[1]) != len(state[1]):
+                    return None
+                merged = (merge_tags(known[0], state[0]), merge_tags(known[1], state[1]))
+                if merged == known:
+                    continue
+            tags[successor] = merged
+            work.append(successor)
+    return tags
+
+
+def add_roots(values: Sequence[Any], tags: SlotTags, memory: Any, roots: List[int]) -> None:
+    '''Add the references among values to roots, the values tagged as not being one are skipped'''
+    for slot, value in enumerate(values):
+        if type(value) is int and (tags[slot] if slot < len(tags) else None) is not False and value in memory:
+            roots.append(value)
+
+
+class UnboxedByteCode(ByteCode):
+    '''The ByteCode handlers on plain values, every handler not overridden here is value agnostic'''
+
+    def perform_return(self, runner: IInterp, opr: Operation, element: StackElement):
+        if opr.type is None:
+            return None
+        return element.operational_stack.pop()
+
+    def perform_push(self, runner: IInterp, opr: Operation, element: StackElement):
+        element.operational_stack.append(opr.value.get_value())
+        element.pc += 1
+
+    def perform_less_than_or_equal_zero(self, runner: IInterp, opr: Operation, element: StackElement):
+        if element.operational_stack.pop() <= 0:
+            element.pc = opr.target
+        else:
+            element.pc += 1
+
+    def perform_not_equal_zero(self, runner: IInterp, opr: Operation, element: StackElement):
+        if element.operational_stack.pop() != 0:
+            element.pc = opr.target
+        else:
+            element.pc += 1
+
+    def perform_increment(self, runner: IInterp, opr: Operation, element: StackElement):
+        element.local_variables[opr.index] += opr.amount
+        element.pc += 1
+
+    def perform_new_array(self, runner: IInterp, opr: Operation, element: StackElement):
+        size = element.operational_stack.pop()
+        if type(opr.type) is str and opr.type in PRIMITIVE_ARRAY_KINDS:
+            ref = runner.allocate(PrimitiveArrayValue(size, opr.type))
+        else:
+            ref = runner.allocate(ArrayValue(size, Value(0)))
+        element.operational_stack.append(ref)
+        element.pc += 1
+
+    def perform_array_store(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        value_to_store = stack.pop()
+        index = stack.pop()
+        arr: ArrayValue = runner.memory[stack.pop()]
+        if index < 0 or arr.get_length() <= index:
+            raise IndexOutOfBounds()
+        if type(arr) is PrimitiveArrayValue:
+            try:
+                arr.get_value()[index] = value_to_store
+            except OverflowError:
+                # Let the array truncate it
+                arr[index] = Value(value_to_store)
+        else:
+            arr[index] = Value(value_to_store, get_array_store_type(opr.type))
+        element.pc += 1
+
+    def perform_array_load(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        index = stack.pop()
+        arr: ArrayValue = runner.memory[stack.pop()]
+        if index < 0 or arr.get_length() <= index:
+            raise IndexOutOfBounds()
+        if type(arr) is PrimitiveArrayValue:
+            stack.append(arr.get_value()[index])
+        else:
+            stack.append(arr[index].get_value())
+        element.pc += 1
+
+    def perform_get(self, runner: IInterp, opr: Operation, element: StackElement):
+        # Same placeholder as the boxed handler
+        element.operational_stack.append(0)
+        element.pc += 1
+
+    def perform_array_length(self, runner: IInterp, opr: Operation, element: StackElement):
+        stack = element.operational_stack
+        stack.append(runner.memory[stack.pop()].get_length())
+        element.pc += 1
+
+    def perform_new(self, runner: IInterp, opr: Operation, element: StackElement):
+        element.operational_stack.append(runner.allocate(opr.class_))
+        element.pc += 1
+
+    def peform_throw(self, runner: IInterp, opr: Operation, element: StackElement):
+        raise JavaError(runner.memory[element.operational_stack.pop()])
+
+    def perform_load_push_binary(self, runner: IInterp, opr: Operation, element: StackElement):
+        index, value, arithmetic = opr.operands
+        element.operational_stack.append(arithmetic(element.local_variables[index], value.get_value()))
+        element.pc += 3
+
+    def perform_load_ifz(self, runner: IInterp, opr: Operation, element: StackElement):
+        index, compare, target = opr.operands
+        if compare(element.local_variables[index], 0):
+            element.pc = target
+        else:
+            element.pc += 2
+
+    def perform_push_store(self, runner: IInterp, opr: Operation, element: StackElement):
+        value, index = opr.operands
+        local_vars = element.local_variables
+        if len(local_vars) <= index:
+            local_vars.extend([None] * (index - len(local_vars)))
+            local_vars.append(value.get_value())
+        else:
+            local_vars[index] = value.get_value()
+        element.pc += 2
+
+    def perform_dup_push_push_array_store(self, runner: IInterp, opr: Operation, element: StackElement):
+        index, value = opr.operands
+        index = index.get_value()
+        arr: ArrayValue = runner.memory[element.operational_stack[-1]]
+        if index < 0 or arr.get_length() <= index:
+            raise IndexOutOfBounds()
+        if type(arr) is PrimitiveArrayValue:
+            arr[index] = value
+        else:
+            arr[index] = Value(value.get_value(), get_array_store_type(opr.parts[-1].type))
+        element.pc += 4
+
+
+class UnboxedInterpreter(Interpreter):
+    '''An Interpreter running on UnboxedByteCode, it takes and returns Values like the boxed one'''
+
+    def __init__(self, java_program, bytecode_interpreter: Optional[ByteCode] = None, **kwargs):
+        super().__init__(java_program,
+                         bytecode_interpreter=bytecode_interpreter if bytecode_interpreter is not None else UnboxedByteCode(),
+                         **kwargs)
+        # The slot tags of every method by the instructions it runs, see get_slot_tags
+        self._slot_tags = CodeCache()
+
+    def get_instructions(self, java_class: JavaClass, method_name: str, descriptor: Optional[str] = None) -> Tuple[Operation, ...]:
+        code = super().get_instructions(java_class, method_name, descriptor)
+        if self.collector is not None:
+            self._slot_tags.get(code, lambda: get_slot_tags(java_class.get_method(method_name, descriptor)))
+        return code
+
+    def run(self, class_name: str, method_name: str, method_args: List[Value], descriptor: Optional[str] = None) -> Value:
+        result = super().run(class_name, method_name, [arg.get_value() for arg in method_args], descriptor)
+        method = self.get_class(class_name).get_method(method_name, descriptor)
+        return Value(result, get_value_type(method["returns"]["type"]))
+
+    def run_compiled(self, compiled, method_args: List[Any], return_type: str) -> Any:
+        try:
+            return compiled(self, method_args)
+        except RecursionError:
+            raise JavaError("java/lang/StackOverflowError") from None
+
+    def box_args(self, opr: Operation, args: List[Any]) -> List[Any]:
+        return args
+
+    def get_memo_key(self, call_site: CallSite, args: List[Any]) -> Tuple[Any, ...]:
+        return (id(call_site.code),) + tuple(args)
+
+    def unbox(self, value: Any) -> Any:
+        return value
+
+    def box_result(self, call_site: CallSite, result: Any) -> Any:
+        return result
+
+    def call_native(self, call_site: CallSite, args: List[Any], operational_stack: List[Any]):
+        result = call_site.native(self, args)
+        if call_site.return_type is not None:
+            operational_stack.append(result)
+
+    def get_roots(self) -> List[int]:
+        memory = self.memory
+        roots = [value.get_value() for value in self.static_fields.values() if value.type_name == "ref"]
+        for element in self.stack:
+            tags = self._slot_tags.find(element.code)
+            frame_tags = tags[element.pc] if tags is not None else None
+            local_tags, stack_tags = frame_tags if frame_tags is not None else ((), ())
+            add_roots(element.local_variables, local_tags, memory, roots)
+            add_roots(element.operational_stack, stack_tags, memory, roots)
+        return roots
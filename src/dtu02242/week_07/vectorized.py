@@ -0,0 +1,308 @@
+"""
+A lane parallel interpreter, running one method for N inputs in lockstep.
+
+Every local and every operand stack slot is a NumPy array with one lane per
+input, so an arithmetic instruction is a single NumPy operation for all the
+lanes that execute it. The stack depth before an instruction is the same on
+every path reaching it, so it is computed once from the bytecode and the
+handlers know which slots they work on without a per lane stack pointer.
+
+Lanes have their own pc. In every step the lowest pc of the running lanes is
+executed for the lanes that are at it, the others wait. Lanes that took
+different sides of an if therefore run one side after the other and are
+executed together again from the first instruction both sides reach, and
+lanes that leave a loop early wait at its exit for the rest.
+
+Only integer kernels are supported, ie. int, long, boolean, byte, short and
+char locals with the instructions in method_mapper. Ints wrap at 32 bits
+like in Java. The assert pattern (new AssertionError, <init>, throw) works,
+anything else that leaves the method raises NotImplementedError when the
+method is decoded. Requires NumPy.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import array
+import time
+
+import numpy as np
+
+from .bytecode import Operation
+from .batch import BatchResult
+from .parser import JavaClass, JsonDict
+from .unboxed import get_value_type
+from dtu02242.jvm.opcodes import build_dispatch_table
+from dtu02242.jvm.natives import DEFAULT_NATIVES
+
+INTEGRAL_TYPES = ("int", "long", "boolean", "byte", "short", "char")
+
+# Stack depth change of the instructions that do not branch or leave the method
+STACK_EFFECTS = {
+    "push": 1, "load": 1, "store": -1, "dup": 1, "pop": -1, "incr": 0, "negate": 0,
+    "binary-add": -1, "binary-sub": -1, "binary-mul": -1, "binary-div": -1, "binary-rem": -1,
+    "bitopr-and": -1, "bitopr-or": -1, "bitopr-xor": -1, "bitopr-shl": -1, "bitopr-shr": -1,
+    "new": 1, "get": 1, "goto": 0,
+}
+
+BRANCH_CONDITIONS = {
+    "eq": np.equal, "ne": np.not_equal, "lt": np.less,
+    "le": np.less_equal, "gt": np.greater, "ge": np.greater_equal,
+}
+
+NO_ERROR = -1
+
+
+def _wrap(values: np.ndarray, type_name: str) -> np.ndarray:
+    if type_name == "int":
+        return values.astype(np.int32).astype(np.int64)
+    return values
+
+
+class VectorizedInterpreter:
+    '''Runs one method of a class over many inputs, see the module documentation'''
+    java_class: JavaClass
+    method_name: str
+    code: Tuple[Operation, ...]
+    depths: List[int]
+
+    def __init__(self, java_class: JavaClass, method_name: str, descriptor: Optional[str] = None):
+        self.java_class = java_class
+        self.method_name = method_name
+        self.method: JsonDict = java_class.get_method(method_name, descriptor)
+        for param in self.method["params"]:
+            if param["type"].get("base") not in INTEGRAL_TYPES:
+                raise NotImplementedError(f"Only integral parameters are supported, not {param['type']}")
+        self.code = java_class.get_instructions(method_name, Operation, descriptor)
+        self.method_mapper: Dict[str, Callable[[Operation, Any, int, int], None]] = {
+            "push": self.perform_push,
+            "load": self.perform_load,
+            "store": self.perform_store,
+            "dup": self.perform_dup,
+            "pop": self.perform_pop,
+            "incr": self.perform_increment,
+            "negate": self.perform_negate,
+            "binary-add": self.perform_binary,
+            "binary-sub": self.perform_binary,
+            "binary-mul": self.perform_binary,
+            "binary-div": self.perform_division,
+            "binary-rem": self.perform_division,
+            "bitopr-and": self.perform_binary,
+            "bitopr-or": self.perform_binary,
+            "bitopr-xor": self.perform_binary,
+            "bitopr-shl": self.perform_binary,
+            "bitopr-shr": self.perform_binary,
+            **{f"if-{condition}": self.perform_if for condition in BRANCH_CONDITIONS},
+            **{f"ifz-{condition}": self.perform_ifz for condition in BRANCH_CONDITIONS},
+            "goto": self.perform_goto,
+            "get": self.perform_get,
+            "new": self.perform_new,
+            "invoke": self.perform_invoke,
+            "throw": self.perform_throw,
+            "return": self.perform_return,
+        }
+        self.handlers = build_dispatch_table(self.method_mapper, self.perform_unknown)
+        self.depths = self.compute_depths()
+        self.max_stack = max([depth + 1 for depth in self.depths if depth >= 0], default=1)
+        self.max_locals = max([opr.index + 1 for opr in self.code if opr.index is not None] + [len(self.method["params"])])
+        # Class names of the objects created by new, lanes hold an index into it
+        self.classes: List[str] = []
+
+    def compute_depths(self) -> List[int]:
+        '''Operand stack depth before every instruction, -1 for unreachable ones'''
+        depths = [-1] * len(self.code)
+        pending = [(0, 0)]
+        while pending:
+            pc, depth = pending.pop()
+            if depths[pc] >= 0:
+                continue
+            depths[pc] = depth
+            opr = self.code[pc]
+            name = opr.get_name()
+            if self.handlers[opr.opcode] == self.perform_unknown:
+                raise NotImplementedError(f"{name} is not supported by the vectorized interpreter")
+            if name in ("return", "throw"):
+                continue
+            if name == "get":
+                self.check_get(pc)
+            if name == "invoke":
+                self.check_invoke(opr)
+                pending.append((pc + 1, depth - len(opr.method["args"]) - 1))
+            elif opr.opr == "if":
+                pending.append((pc + 1, depth - 2))
+                pending.append((opr.target, depth - 2))
+            elif opr.opr == "ifz":
+                pending.append((pc + 1, depth - 1))
+                pending.append((opr.target, depth - 1))
+            elif name == "goto":
+                pending.append((opr.target, depth))
+            else:
+                pending.append((pc + 1, depth + STACK_EFFECTS[name]))
+        return depths
+
+    def check_invoke(self, opr: Operation):
+        method = opr.method
+        if not (method["name"] == "<init>" and method["returns"] is None and not method["args"]
+                and DEFAULT_NATIVES.lookup(method["ref"]["name"], "<init>") is not None):
+            raise NotImplementedError(f"Invoking {method['ref']['name']}.{method['name']} is not supported by the vectorized interpreter")
+
+    def check_get(self, pc: int):
+        # Operations do not keep the field, it is in the bytecode they were decoded from
+        bytecode = self.method["code"]["bytecode"][pc]
+        field = bytecode["field"]
+        if not (bytecode.get("static") and field["name"] == "$assertionsDisabled"):
+            raise NotImplementedError(f"Reading {field['class']}.{field['name']} is not supported by the vectorized interpreter")
+
+    def run(self, inputs: Any, max_steps: int = 1_000_000) -> BatchResult:
+        '''
+        Run the method for every row of inputs, a sequence of argument tuples
+        or a 2d array with one column per parameter.
+        '''
+        inputs = np.asarray(inputs, dtype=np.int64)
+        if inputs.ndim == 1 and len(self.method["params"]) > 0:
+            inputs = inputs.reshape(-1, len(self.method["params"]))
+        lanes = len(inputs)
+        self.locals = np.zeros((self.max_locals, lanes), dtype=np.int64)
+        self.locals[:inputs.shape[1]] = inputs.T
+        self.stack = np.zeros((self.max_stack, lanes), dtype=np.int64)
+        self.pc = np.zeros(lanes, dtype=np.int64)
+        self.active = np.ones(lanes, dtype=bool)
+        self.result = np.zeros(lanes, dtype=np.int64)
+        self.error = np.full(lanes, NO_ERROR, dtype=np.int64)
+        self.error_names: List[str] = []
+
+        start = time.perf_counter()
+        code, depths, handlers = self.code, self.depths, self.handlers
+        for _ in range(max_steps):
+            if not self.active.any():
+                break
+            pc = int(self.pc[self.active].min())
+            at_pc = self.active & (self.pc == pc)
+            # All lanes together is the common case, a slice is cheaper than an index array
+            lanes_at_pc = slice(None) if at_pc.all() else np.flatnonzero(at_pc)
+            opr = code[pc]
+            handlers[opr.opcode](opr, lanes_at_pc, pc, depths[pc])
+        else:
+            self.fail(np.flatnonzero(self.active), "Timeout")
+
+        type_name = get_value_type(self.method["returns"]["type"])
+        errors = {int(lane): self.error_names[self.error[lane]] for lane in np.flatnonzero(self.error != NO_ERROR)}
+        if type_name == "void":
+            values: Any = [None] * lanes
+        else:
+            values = array.array("q", self.result.tobytes())
+        return BatchResult(type_name, values, errors, time.perf_counter() - start)
+
+    def fail(self, lanes: Any, name: str):
+        if name not in self.error_names:
+            self.error_names.append(name)
+        self.error[lanes] = self.error_names.index(name)
+        self.active[lanes] = False
+
+    def perform_unknown(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        raise NotImplementedError(opr.get_name())
+
+    def perform_push(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        self.stack[depth, lanes] = opr.value.get_value()
+        self.pc[lanes] = pc + 1
+
+    def perform_load(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        self.stack[depth, lanes] = self.locals[opr.index, lanes]
+        self.pc[lanes] = pc + 1
+
+    def perform_store(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        self.locals[opr.index, lanes] = self.stack[depth - 1, lanes]
+        self.pc[lanes] = pc + 1
+
+    def perform_dup(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        self.stack[depth, lanes] = self.stack[depth - 1, lanes]
+        self.pc[lanes] = pc + 1
+
+    def perform_pop(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        self.pc[lanes] = pc + 1
+
+    def perform_increment(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        self.locals[opr.index, lanes] = _wrap(self.locals[opr.index, lanes] + opr.amount, "int")
+        self.pc[lanes] = pc + 1
+
+    def perform_negate(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        self.stack[depth - 1, lanes] = _wrap(-self.stack[depth - 1, lanes], opr.type)
+        self.pc[lanes] = pc + 1
+
+    def perform_binary(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        first = self.stack[depth - 2, lanes]
+        second = self.stack[depth - 1, lanes]
+        operant = opr.operant
+        if operant == "add":
+            result = first + second
+        elif operant == "sub":
+            result = first - second
+        elif operant == "mul":
+            result = first * second
+        elif operant == "and":
+            result = first & second
+        elif operant == "or":
+            result = first | second
+        elif operant == "xor":
+            result = first ^ second
+        elif operant == "shl":
+            result = first << (second & (31 if opr.type == "int" else 63))
+        else:
+            result = first >> (second & (31 if opr.type == "int" else 63))
+        self.stack[depth - 2, lanes] = _wrap(result, opr.type)
+        self.pc[lanes] = pc + 1
+
+    def perform_division(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        lane_indices = np.arange(len(self.pc))[lanes]
+        first = self.stack[depth - 2, lanes]
+        second = self.stack[depth - 1, lanes]
+        by_zero = second == 0
+        if by_zero.any():
+            self.fail(lane_indices[by_zero], "java/lang/ArithmeticException")
+        divisor = np.where(by_zero, 1, second)
+        # Java rounds towards zero, NumPy towards negative infinity
+        quotient = np.abs(first) // np.abs(divisor)
+        quotient = np.where((first < 0) != (divisor < 0), -quotient, quotient)
+        result = quotient if opr.operant == "div" else first - quotient * divisor
+        self.stack[depth - 2, lanes] = _wrap(result, opr.type)
+        self.pc[lane_indices[~by_zero]] = pc + 1
+
+    def perform_if(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        taken = BRANCH_CONDITIONS[opr.condition](self.stack[depth - 2, lanes], self.stack[depth - 1, lanes])
+        self.pc[lanes] = np.where(taken, opr.target, pc + 1)
+
+    def perform_ifz(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        taken = BRANCH_CONDITIONS[opr.condition](self.stack[depth - 1, lanes], 0)
+        self.pc[lanes] = np.where(taken, opr.target, pc + 1)
+
+    def perform_goto(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        self.pc[lanes] = opr.target
+
+    def perform_get(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        # check_get lets only $assertionsDisabled through, assertions are enabled
+        self.stack[depth, lanes] = 0
+        self.pc[lanes] = pc + 1
+
+    def perform_new(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        if opr.class_ not in self.classes:
+            self.classes.append(opr.class_)
+        self.stack[depth, lanes] = self.classes.index(opr.class_)
+        self.pc[lanes] = pc + 1
+
+    def perform_invoke(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        # Only constructors without effects get past check_invoke
+        self.pc[lanes] = pc + 1
+
+    def perform_throw(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        lane_indices = np.arange(len(self.pc))[lanes]
+        thrown = self.stack[depth - 1, lanes]
+        for index, class_name in enumerate(self.classes):
+            self.fail(lane_indices[thrown == index], class_name)
+
+    def perform_return(self, opr: Operation, lanes: Any, pc: int, depth: int):
+        if opr.type is not None:
+            self.result[lanes] = self.stack[depth - 1, lanes]
+        self.active[lanes] = False
+
+
+def run_vectorized(java_class: JavaClass, method_name: str, inputs: Any,
+                   descriptor: Optional[str] = None, max_steps: int = 1_000_000) -> BatchResult:
+    '''Run a method over every row of inputs in lockstep, see VectorizedInterpreter'''
+    return VectorizedInterpreter(java_class, method_name, descriptor).run(inputs, max_steps)
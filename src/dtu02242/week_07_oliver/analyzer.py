@@ -1,9 +1,15 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, List, Any, Optional, Sequence
 from .parser import JavaClass, JavaProgram, JsonDict
+from dtu02242.jvm.opcodes import OPCODE_NAMES, build_dispatch_table, get_instruction_name, get_opcode
+from dtu02242.jvm.profiler import Profile
+from dtu02242.jvm.program import LazyJavaProgram
+from dtu02242.jvm.registers import RegisterInstruction, translate
+from dtu02242.jvm.superinstructions import SUPERINSTRUCTIONS, fuse
+import time
 import uuid
 import json
 from enum import Enum
-from copy import deepcopy
+from copy import copy, deepcopy
 
 
 class Counter:
@@ -44,13 +50,10 @@ class Operation:
         self.amount: int = json_doc["amount"] if "amount" in json_doc else None
         self.class_: str = json_doc["class"] if "class" in json_doc else None
         self.method: Dict[str, Any] = json_doc["method"] if "method" in json_doc else None
+        self.opcode: int = get_opcode(self.get_name())
 
     def get_name(self):
-        if self.operant:
-            return f"{self.opr}-{self.operant}"
-        if self.condition:
-            return f"{self.opr}-{self.condition}"
-        return self.opr
+        return get_instruction_name(self.opr, self.operant, self.condition)
 
 class MinusZeroPlusValue:
     def __init__(self, number=None, reference=None):
@@ -89,17 +92,26 @@ class Analyzer():
     def __init__(self, 
                  java_program: JavaProgram | JavaClass, 
                  memory: Dict[uuid.UUID, Any] = {},
-                 abstraction: Any = None):
+                 abstraction: Any = None,
+                 profile: Optional[Profile] = None,
+                 superinstructions: Optional[Iterable[str]] = None,
+                 registers: bool = False):
         self.memory = memory
+        self.profile = profile
+        self.superinstructions = tuple(superinstructions) if superinstructions is not None else None
+        if registers and self.superinstructions:
+            raise Exception("Superinstructions fuse stack instructions, they do not apply to register code")
+        self.registers = registers
         self.stack: List[StackElement] = []
         self.abstraction = abstraction
         self.exceptions = []
         self.seen_states = set()
 
-        if type(java_program) is JavaProgram:
-            self.java_program = java_program
-        elif type(java_program) is JavaClass:
+        if isinstance(java_program, JavaClass):
+            # Subclasses included, ie. the class images of week 8
             self.java_program = JavaProgram([java_program])
+        elif isinstance(java_program, (JavaProgram, LazyJavaProgram)):
+            self.java_program = java_program
         else:
             raise Exception("Unexpected type as JavaProgram")
 
@@ -112,17 +124,27 @@ class Analyzer():
 
     def run(self, class_name: str, method_name: str, method_args: List[Any]) -> Any:
         self.stack.append(StackElement(method_args, [], Counter(method_name, 0)))
+        java_class = self.get_class(class_name, method_name)
+        code = java_class.get_instructions(method_name, Operation)
+        if self.registers:
+            code = translate(code, java_class.get_method(method_name)["code"])
+        if self.superinstructions:
+            code = fuse(code, self.superinstructions, self.abstraction.supports)
         saw_fixed_point = False
+        call_stack = (method_name,)
         while len(self.stack) > 0:
             element = self.stack.pop()
-            state_description = element.to_state_description()
-            if state_description in self.seen_states:
+            if self.profile is None:
+                operation = self.step(code, element)
+            else:
+                pc = element.counter.counter
+                start = time.perf_counter()
+                operation = self.step(code, element)
+                if operation is not None:
+                    self.profile.record(call_stack, pc, OPCODE_NAMES[operation.opcode], time.perf_counter() - start)
+            if operation is None:
                 saw_fixed_point = True
-                continue
-            self.seen_states.add(state_description)
-            operation = Operation(self.get_class(class_name, method_name).get_method(element.counter.method_name)["code"]["bytecode"][element.counter.counter])
-            self.run_operation(operation, element)
-            if AnalysisResult.ArithmeticException in self.exceptions:
+            elif AnalysisResult.ArithmeticException in self.exceptions:
                 return self.exceptions
         if self.exceptions:
             return self.exceptions
@@ -130,14 +152,18 @@ class Analyzer():
             return [AnalysisResult.Maybe]
         return [AnalysisResult.No] 
 
-    def run_operation(self, operation: Operation, element: StackElement) -> Any | None:
-        operation_name = operation.get_name()
+    def step(self, code: Sequence[Operation], element: StackElement) -> Optional[Operation]:
+        '''Run the operation of an abstract state, returns it, or None if the state was seen before'''
+        state_description = element.to_state_description()
+        if state_description in self.seen_states:
+            return None
+        self.seen_states.add(state_description)
+        operation = code[element.counter.counter]
+        self.run_operation(operation, element)
+        return operation
 
-        match operation_name:
-            case "return":
-                return self.abstraction.execute(operation_name, self, operation, element)
-            case _:
-                self.abstraction.execute(operation_name, self, operation, element)
+    def run_operation(self, operation: Operation, element: StackElement) -> Any | None:
+        return self.abstraction.execute(self, operation, element)
 
 class MinusZeroPlus:
 
@@ -164,10 +190,32 @@ class MinusZeroPlus:
         "push": self.perform_push,
         "return": self.perform_return,
         "store": self.perform_store,
+        **{name: self.perform_parts for name in SUPERINSTRUCTIONS},
     }
-
-    def execute(self, operation_name: str, analyzer: Analyzer, operation: Operation, element: StackElement):
-        return self.method_mapper[operation_name](analyzer, operation, element)
+        self.handlers = build_dispatch_table(self.method_mapper, self.perform_unknown)
+
+    def execute(self, analyzer: Analyzer, operation: Operation, element: StackElement):
+        return self.handlers[operation.opcode](analyzer, operation, element)
+
+    def supports(self, name: str) -> bool:
+        return name in self.method_mapper
+
+    def perform_parts(self, runner: Analyzer, opr: Any, element: StackElement):
+        # The parts of a superinstruction, each on the states the one before produced.
+        # Only the first can be jumped to, so the states in between need no fixed point check
+        elements = [element]
+        for part in opr.parts:
+            next_elements = []
+            for current in elements:
+                depth = len(runner.stack)
+                self.execute(runner, part, current)
+                next_elements.extend(runner.stack[depth:])
+                del runner.stack[depth:]
+            elements = next_elements
+        runner.stack.extend(elements)
+
+    def perform_unknown(self, runner: Analyzer, opr: Operation, element: StackElement):
+        raise NotImplementedError(f"Unsupported instruction {opr.get_name()}")
     
     def create_next_element(self, element: StackElement, new_locals: List[Any], new_operation_stack_elements: List[Any]) -> StackElement:
         locals = deepcopy(element.local_variables) + new_locals
@@ -192,7 +240,8 @@ class MinusZeroPlus:
             raise Exception("Unhandled type for new keyword")
 
     def perform_push(self, runner: Analyzer, opr: Operation, element: StackElement):
-        v = opr.value
+        # Operations are shared between runs and values get their reference set later on
+        v = deepcopy(opr.value)
         runner.stack.append(self.create_next_element(element, [], [v]))
     
     def assertion_was_true(self, runner: Analyzer, opr: Operation, element: StackElement, first: MinusZeroPlusValue, value: int):
@@ -491,8 +540,61 @@ class MinusZeroPlus:
         return value
 
 
+class RegisterMinusZeroPlus(MinusZeroPlus):
+    '''
+    MinusZeroPlus on register code, see jvm/registers.py. The registers are
+    the locals of the states, an instruction runs the handler of its stack
+    instruction on its sources pushed with the register they came from as
+    reference, so branches refine the registers they compared.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        # The handlers of the stack instructions, by opcode
+        self.stack_handlers = self.handlers
+        self.method_mapper = {name: self.perform_on_stack for name in self.method_mapper}
+        self.method_mapper.update({
+            "enter": self.perform_enter,
+            "move": self.perform_move,
+            "incr": self.perform_increment,
+        })
+        self.handlers = build_dispatch_table(self.method_mapper, self.perform_unknown)
+
+    def perform_on_stack(self, runner: Analyzer, opr: RegisterInstruction, element: StackElement):
+        for source in opr.sources:
+            value = copy(element.local_variables[source])
+            value.reference = source
+            element.operational_stack.append(value)
+        depth = len(runner.stack)
+        result = self.stack_handlers[opr.opcode](runner, opr, element)
+        for next_element in runner.stack[depth:]:
+            if opr.dest is not None:
+                # Handlers may push a register itself, the dest gets a value of its own
+                value = copy(next_element.operational_stack.pop())
+                value.reference = None
+                next_element.local_variables[opr.dest] = value
+            next_element.operational_stack.clear()
+        return result
+
+    def perform_enter(self, runner: Analyzer, opr: RegisterInstruction, element: StackElement):
+        next_element = self.create_next_element(element, [], [])
+        registers = next_element.local_variables
+        registers.extend(MinusZeroPlusValue() for _ in range(opr.register_count - len(registers)))
+        for register, push in opr.constants:
+            registers[register] = deepcopy(push.value)
+        runner.stack.append(next_element)
+
+    def perform_move(self, runner: Analyzer, opr: RegisterInstruction, element: StackElement):
+        next_element = self.create_next_element(element, [], [])
+        next_element.local_variables[opr.dest] = copy(next_element.local_variables[opr.sources[0]])
+        runner.stack.append(next_element)
+
+
 def run_method_analysis(java_class: JavaClass,
-                        method_name: str) -> AnalysisResult:
+                        method_name: str,
+                        profile: Optional[Profile] = None,
+                        superinstructions: Optional[Iterable[str]] = None,
+                        registers: bool = False) -> AnalysisResult:
     
     args = []
     memory = {}
@@ -506,5 +608,8 @@ def run_method_analysis(java_class: JavaClass,
 
     interpreter = Analyzer(java_program=java_class, 
                               memory=memory,
-                              abstraction=MinusZeroPlus())
+                              abstraction=RegisterMinusZeroPlus() if registers else MinusZeroPlus(),
+                              profile=profile,
+                              superinstructions=superinstructions,
+                              registers=registers)
     return interpreter.run(java_class.name, method_name, args)
\ No newline at end of file
@@ -1,27 +1,41 @@
 from pathlib import Path
-from typing import List, Dict, Any, Iterable, Optional, Type
+from typing import List, Dict, Any, Iterable, Optional, Type, Tuple, Callable, TypeVar
 from glob import glob
 
+from dtu02242.jvm.method_table import MethodTable, get_invoke_descriptor, get_method_descriptor
+
 JsonDict = Dict[str, Any]
 
-class JavaClass:
+Instruction = TypeVar("Instruction")
+
+class JavaClass(MethodTable):
     name: str
     json_dict: JsonDict
+    _instructions: Dict[Tuple[Any, ...], Tuple[Any, ...]]
 
     def __init__(self, json_dict: JsonDict) -> None:
         self.name = json_dict['name']
         self.json_dict = json_dict
+        self._instructions = {}
 
     def get_methods(self) -> List[JsonDict]:
         methods: List[JsonDict] = self.json_dict["methods"]
         return methods
-    
-    def get_method(self, name: str) -> JsonDict:
-        methods = self.get_methods()
-        for method in methods:
-            if method["name"] == name:
-                return method
-        raise Exception("Method {name} not found in {self}")
+
+    def get_instructions(self, name: str, decoder: Callable[[JsonDict], Instruction], descriptor: Optional[str] = None) -> Tuple[Instruction, ...]:
+        '''Decode the bytecode of a method once, and return the cached instruction array after that'''
+        key = (name, descriptor, decoder)
+        instructions = self._instructions.get(key)
+        if instructions is None:
+            method = self.get_method(name, descriptor)
+            # Lookups with and without a descriptor share the array of the method they resolve to
+            method_key = (id(method), decoder)
+            instructions = self._instructions.get(method_key)
+            if instructions is None:
+                instructions = tuple(decoder(json_doc) for json_doc in method["code"]["bytecode"])
+                self._instructions[method_key] = instructions
+            self._instructions[key] = instructions
+        return instructions
     
     def __str__(self) -> str:
         return self.json_dict["name"]
@@ -0,0 +1,112 @@
+"""
+Class archives, every class of a decompiled tree packed into one file.
+
+The archive starts with a header index mapping each class name to the
+offset of its class image (see class_image.py), followed by the images
+themselves. Every image carries its own index of method name and
+descriptor to method offset, so opening an archive only reads the header,
+getting a class reads that class's index, and a method body is only decoded
+when it is looked up.
+
+Archives are opened with a read-only mmap, so worker processes that open
+the same archive share its pages through the page cache instead of each
+holding their own copy of the corpus.
+"""
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+import hashlib
+import marshal
+import mmap
+import json
+import struct
+import sys
+import os
+
+if __name__ == "__main__":
+    from parser import JavaProgram, index_class_files
+    from class_image import ImageJavaClass, build_class_image, read_class_image
+else:
+    from dtu02242.week_08.parser import JavaProgram, index_class_files
+    from dtu02242.week_08.class_image import ImageJavaClass, build_class_image, read_class_image
+
+ARCHIVE_MAGIC = b"JCA1"
+ARCHIVE_HEADER = struct.Struct("<4sI")
+
+
+def write_archive(root_dir: Path, archive_path: Path) -> int:
+    '''Pack every jvm2json file under root_dir into a single archive, returns the number of classes'''
+    class_offsets: Dict[str, Tuple[int, int]] = {}
+    images: List[bytes] = []
+    offset = 0
+    for class_name, json_path in sorted(index_class_files(Path(root_dir)).items()):
+        with open(json_path, "rb") as fp:
+            content = fp.read()
+        stat = os.stat(json_path)
+        source = (stat.st_mtime_ns, stat.st_size, hashlib.sha1(content).digest())
+        image = build_class_image(json.loads(content), source)
+        class_offsets[sys.intern(class_name)] = (offset, len(image))
+        images.append(image)
+        offset += len(image)
+    index = marshal.dumps(class_offsets)
+
+    archive_path = Path(archive_path)
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = archive_path.with_name(f"{archive_path.name}.{os.getpid()}.tmp")
+    with open(temporary_path, "wb") as fp:
+        fp.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, len(index)))
+        fp.write(index)
+        for image in images:
+            fp.write(image)
+    os.replace(temporary_path, archive_path)
+    return len(class_offsets)
+
+
+class ArchiveJavaProgram(JavaProgram):
+    '''A JavaProgram reading its classes out of a memory mapped class archive'''
+    _java_classes: Dict[str, ImageJavaClass]
+    _class_offsets: Dict[str, Tuple[int, int]]
+
+    def __init__(self, archive_path: Path, entry_point: Optional[str]=None) -> None:
+        self._archive_path = Path(archive_path)
+        self._entry_point = entry_point
+        with open(self._archive_path, "rb") as fp:
+            self._buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_length = ARCHIVE_HEADER.unpack_from(self._buffer, 0)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError(f"{archive_path} is not a class archive")
+        index_start = ARCHIVE_HEADER.size
+        self._class_offsets = marshal.loads(self._buffer[index_start:index_start + index_length])
+        self._images_base = index_start + index_length
+        self._java_classes = {}
+
+    def get_class(self, class_name: str) -> ImageJavaClass | None:
+        java_class = self._java_classes.get(class_name)
+        if java_class is None:
+            entry = self._class_offsets.get(class_name)
+            if entry is None:
+                return None
+            java_class = read_class_image(self._buffer, self._images_base + entry[0])
+            self._java_classes[class_name] = java_class
+        return java_class
+
+    def get_class_names(self) -> List[str]:
+        return list(self._class_offsets)
+
+    def __contains__(self, class_name: str) -> bool:
+        return class_name in self._class_offsets
+
+    def __len__(self) -> int:
+        return len(self._class_offsets)
+
+    def __reduce__(self):
+        # mmaps cannot be pickled, worker processes map the archive again instead
+        return (ArchiveJavaProgram, (self._archive_path, self._entry_point))
+
+    def __str__(self) -> str:
+        return f"ArchiveJavaProgram({self._archive_path}, {len(self._java_classes)}/{len(self._class_offsets)} loaded)"
+
+
+if __name__ == "__main__":
+    root = Path(sys.argv[1] if len(sys.argv) > 1 else "course-02242-examples/decompiled")
+    output = Path(sys.argv[2] if len(sys.argv) > 2 else "classes.jca")
+    print(f"{write_archive(root, output)} classes written to {output}")
@@ -0,0 +1,211 @@
+"""
+Binary class images, a cache for jvm2json output that skips JSON parsing.
+
+An image is stored in a __classcache__ directory next to the .json file it
+was built from and has the following layout:
+
+    header   magic, source mtime, source size, source sha1, index length
+    index    marshal of the class without its methods, and for every method
+             its name, descriptor and the position of its body
+    methods  one marshal blob per method
+
+All strings are interned before they are written, so repeated names like
+"load" or "int" are stored once per blob and are shared again after loading.
+Images are opened with mmap, the header and index are read straight away and
+a method body is only unmarshalled when it is looked up.
+"""
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple, Type
+import hashlib
+import marshal
+import mmap
+import json
+import struct
+import sys
+import os
+
+if __name__ == "__main__":
+    from parser import JsonDict, JavaClass, get_method_descriptor, index_class_files
+else:
+    from dtu02242.week_08.parser import JsonDict, JavaClass, get_method_descriptor, index_class_files
+
+MAGIC = b"JCI1"
+HEADER = struct.Struct("<4sqq20sI")
+CACHE_DIR = "__classcache__"
+IMAGE_SUFFIX = ".jci"
+
+# name, descriptor, offset and length of a method body
+MethodEntry = Tuple[str, Optional[str], int, int]
+# mtime in nanoseconds, size and sha1 digest of the file an image was built from
+SourceInfo = Tuple[int, int, bytes]
+
+
+class ClassImage:
+    '''
+    Mixin backing a JavaClass by a class image, method bodies are decoded on
+    first use. It goes in front of the JavaClass of a week, see get_image_class.
+    '''
+    source: SourceInfo
+    _method_index: List[MethodEntry]
+    _methods: List[Optional[JsonDict]]
+
+    def __init__(self, json_dict: JsonDict, buffer: Any, methods_base: int,
+                 method_index: List[MethodEntry], source: SourceInfo) -> None:
+        super().__init__(json_dict)
+        self.source = source
+        self._buffer = buffer
+        self._methods_base = methods_base
+        self._method_index = method_index
+        self._methods = [None] * len(method_index)
+
+    def _load_method(self, position: int) -> JsonDict:
+        method = self._methods[position]
+        if method is None:
+            _, _, offset, length = self._method_index[position]
+            start = self._methods_base + offset
+            method = marshal.loads(self._buffer[start:start + length])
+            self._methods[position] = method
+        return method
+
+    def get_methods(self) -> List[JsonDict]:
+        return [self._load_method(position) for position in range(len(self._method_index))]
+
+    def get_method_signatures(self) -> List[Tuple[str, Optional[str]]]:
+        # From the image index, so that no method body has to be decoded to find another one
+        return [(name, descriptor) for name, descriptor, _, _ in self._method_index]
+
+    def load_method(self, position: int) -> JsonDict:
+        return self._load_method(position)
+
+
+class ImageJavaClass(ClassImage, JavaClass):
+    '''A week 8 JavaClass backed by a class image'''
+
+
+_image_classes: Dict[type, type] = {JavaClass: ImageJavaClass}
+
+
+def get_image_class(java_class_type: Type[Any]) -> Type[Any]:
+    '''The class of the images of a JavaClass type, ClassImage in front of it'''
+    image_class = _image_classes.get(java_class_type)
+    if image_class is None:
+        image_class = type(f"Image{java_class_type.__name__}", (ClassImage, java_class_type),
+                           {"__doc__": f"A {java_class_type.__module__} JavaClass backed by a class image"})
+        _image_classes[java_class_type] = image_class
+    return image_class
+
+
+def _intern(json_object: Any) -> Any:
+    if type(json_object) is str:
+        return sys.intern(json_object)
+    if type(json_object) is dict:
+        return {sys.intern(key): _intern(value) for key, value in json_object.items()}
+    if type(json_object) is list:
+        return [_intern(value) for value in json_object]
+    return json_object
+
+
+def build_class_image(json_dict: JsonDict, source: SourceInfo) -> bytes:
+    '''Serialize a jvm2json class into a class image'''
+    json_dict = _intern(json_dict)
+    class_dict = {key: value for key, value in json_dict.items() if key != "methods"}
+    method_index: List[MethodEntry] = []
+    blobs: List[bytes] = []
+    offset = 0
+    for method in json_dict["methods"]:
+        blob = marshal.dumps(method)
+        method_index.append((method["name"], get_method_descriptor(method), offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+    index = marshal.dumps({"class": class_dict, "methods": method_index})
+    mtime, size, digest = source
+    header = HEADER.pack(MAGIC, mtime, size, digest, len(index))
+    return b"".join([header, index, *blobs])
+
+
+def read_image_source(buffer: Any, base: int = 0) -> SourceInfo:
+    '''Read the source information from the header of the image starting at base'''
+    magic, mtime, size, digest, _ = HEADER.unpack_from(buffer, base)
+    if magic != MAGIC:
+        raise ValueError("Not a class image")
+    return mtime, size, digest
+
+
+def read_class_image(buffer: Any, base: int = 0, java_class_type: Type[Any] = JavaClass) -> ClassImage:
+    '''Read the class image starting at base in a bytes like object, as an image of java_class_type'''
+    magic, mtime, size, digest, index_length = HEADER.unpack_from(buffer, base)
+    if magic != MAGIC:
+        raise ValueError("Not a class image")
+    index_start = base + HEADER.size
+    index = marshal.loads(buffer[index_start:index_start + index_length])
+    return get_image_class(java_class_type)(index["class"], buffer, index_start + index_length,
+                                            index["methods"], (mtime, size, digest))
+
+
+def open_class_image(image_path: Path, java_class_type: Type[Any] = JavaClass) -> ClassImage:
+    '''Memory map a class image file'''
+    with open(image_path, "rb") as fp:
+        buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    return read_class_image(buffer, java_class_type=java_class_type)
+
+
+def get_image_path(json_path: Path) -> Path:
+    '''Get the path of the class image belonging to a jvm2json file'''
+    json_path = Path(json_path)
+    return json_path.parent / CACHE_DIR / (json_path.stem + IMAGE_SUFFIX)
+
+
+def _write_file(path: Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(temporary_path, "wb") as fp:
+        fp.write(content)
+    os.replace(temporary_path, path)
+
+
+def load_class_image(json_path: Path, java_class_type: Type[Any] = JavaClass) -> ClassImage:
+    '''
+    Load a jvm2json file through its class image, as an image of
+    java_class_type. The image is used as long as the modification time and
+    size of the file did not change, or the content hash is still the same.
+    Otherwise the image is rebuilt from the JSON.
+    '''
+    json_path = Path(json_path)
+    image_path = get_image_path(json_path)
+    stat = os.stat(json_path)
+    try:
+        image: Optional[ClassImage] = open_class_image(image_path, java_class_type)
+    except (OSError, ValueError, struct.error):
+        image = None
+
+    if image is not None and image.source[:2] == (stat.st_mtime_ns, stat.st_size):
+        return image
+
+    with open(json_path, "rb") as fp:
+        content = fp.read()
+    digest = hashlib.sha1(content).digest()
+    source = (stat.st_mtime_ns, stat.st_size, digest)
+
+    if image is not None and image.source[2] == digest:
+        # Touched but unchanged, only the header needs to be refreshed
+        with open(image_path, "r+b") as fp:
+            fp.write(HEADER.pack(MAGIC, *source, HEADER.unpack_from(image._buffer)[4]))
+        image.source = source
+        return image
+
+    image_bytes = build_class_image(json.loads(content), source)
+    _write_file(image_path, image_bytes)
+    return read_class_image(image_bytes, java_class_type=java_class_type)
+
+
+def write_class_images(root_dir: Path) -> int:
+    '''Build or refresh the class image of every jvm2json file under root_dir'''
+    class_paths = index_class_files(Path(root_dir))
+    for json_path in class_paths.values():
+        load_class_image(json_path)
+    return len(class_paths)
+
+
+if __name__ == "__main__":
+    count = write_class_images(Path(sys.argv[1] if len(sys.argv) > 1 else "course-02242-examples/decompiled"))
+    print(f"{count} class images up to date")
@@ -1,5 +1,4 @@
 import z3
-import random
 from typing import Dict, Any, List
 # from dtu02242.week_08.parser import JsonDict, JavaClass
 from dataclasses import dataclass
@@ -9,6 +8,8 @@ if __name__ == "__main__":
     from parser import JsonDict, JavaClass
 else:
     from dtu02242.week_08.parser import JsonDict, JavaClass
+from dtu02242.jvm.heap import Heap
+from dtu02242.jvm.registers import get_stack_effect, translate
 
 class AnalysisResultValue(Enum):
     No = 0
@@ -181,10 +182,17 @@ class Bytecode:
         )
 
 
-def concolic(program: JavaClass, method_name: str, max_depth=1000, debug_print=False):
-    random.seed(1)
+# Register instructions that work on the locals themselves, the others run on their sources pushed onto the stack
+NATIVE_REGISTER_OPRS = ("enter", "move", "incr")
+
+
+def concolic(program: JavaClass, method_name: str, max_depth=1000, debug_print=False, registers=False):
+    """
+    Explore the paths of a method, one concrete input at a time
+    @param registers: run on the register code of the method, see jvm/registers.py
+    @return: AnalysisResult
+    """
     method = program.get_method(method_name)
-    memory: Dict[int, ConcolicList] = {}
 
     solver = z3.Solver()
 
@@ -200,7 +208,9 @@ def concolic(program: JavaClass, method_name: str, max_depth=1000, debug_print=F
             params.append(z3.Bool(f"a_b{i}"))
         else:
             raise Exception(f"Unknown parameter type: {_type}")
-    bytecode = [Bytecode(b) for b in method["code"]["bytecode"]]
+    bytecode = tuple(Bytecode(b) for b in method["code"]["bytecode"])
+    if registers:
+        bytecode = translate(bytecode, method["code"])
 
     terminations: List[AnalysisResultValue, z3.ExprRef] = []
 
@@ -208,6 +218,9 @@ def concolic(program: JavaClass, method_name: str, max_depth=1000, debug_print=F
     while solver.check() == z3.sat:
         model = solver.model()
 
+        # Every path runs on a fresh heap, so its references only depend on the path
+        memory = Heap()
+
         # Create input state
         inputs = [model.eval(p, model_completion=True).as_long() for p in params]
         state = State({}, [])
@@ -216,14 +229,12 @@ def concolic(program: JavaClass, method_name: str, max_depth=1000, debug_print=F
             if str(symb).startswith("p"):
                 state.locals[idx] = ConcolicValue(conc, symb)
             elif str(symb).startswith("a_i"):
-                memory_address = random.randint(0, 2**128)
                 array = ConcolicList.from_conconic(ConcolicValue(conc, symb), "int")
-                memory[memory_address] = array
+                memory_address = memory.allocate(array)
                 state.locals[idx] = ConcolicValue.from_const(memory_address)
             elif str(symb).startswith("a_b"):
-                memory_address = random.randint(0, 2**128)
                 array = ConcolicList.from_conconic(ConcolicValue(conc, symb), "bool")
-                memory[memory_address] = array
+                memory_address = memory.allocate(array)
                 state.locals[idx] = ConcolicValue.from_const(memory_address)
 
         pc = 0
@@ -240,11 +251,18 @@ def concolic(program: JavaClass, method_name: str, max_depth=1000, debug_print=F
                 print(path)
                 print(bc)
 
+            if registers:
+                state.stack.clear()
+                if bc.opr not in NATIVE_REGISTER_OPRS:
+                    for source in bc.sources:
+                        state.load(source)
+
             if bc.opr == "get":
                 if bc.field["name"] == "$assertionsDisabled":
                     state.push(ConcolicValue.from_const(False))
                 elif bc.field["type"]["name"] == "java/io/PrintStream":
-                    continue
+                    # The stream is not modelled, this stands in for it
+                    state.push(ConcolicValue.from_const(0))
 
             # branching operations
             elif bc.opr == "ifz":
@@ -294,9 +312,8 @@ def concolic(program: JavaClass, method_name: str, max_depth=1000, debug_print=F
             # array operations
             elif bc.opr == "newarray":
                 size = state.pop()
-                memory_address = random.randint(0, 2**128)
                 array = ConcolicList.from_conconic(size, bc.type)
-                memory[memory_address] = array
+                memory_address = memory.allocate(array)
                 state.push(ConcolicValue.from_const(memory_address))
             elif bc.opr == "array_store":
                 value_to_store = state.pop()
@@ -352,8 +369,13 @@ def concolic(program: JavaClass, method_name: str, max_depth=1000, debug_print=F
                     result = AnalysisResultValue.No
                 break
             elif bc.opr == "invoke":
-                # We do nothing for now
-                pass
+                # Calls are not followed, they take their receiver and arguments
+                # and return 0, the same on every path
+                pops, pushes = get_stack_effect(bc.dictionary)
+                for _ in range(pops):
+                    state.pop()
+                if pushes:
+                    state.push(ConcolicValue.from_const(0))
 
             # stack and local operations
             elif bc.opr == "load":
@@ -362,8 +384,18 @@ def concolic(program: JavaClass, method_name: str, max_depth=1000, debug_print=F
                 state.store(bc.index)
             elif bc.opr == "push":
                 state.push(ConcolicValue.from_const(bc.value["value"]))
+
+            # register operations
+            elif bc.opr == "enter":
+                for register, push in bc.constants:
+                    state.locals[register] = ConcolicValue.from_const(push.value["value"])
+            elif bc.opr == "move":
+                state.locals[bc.dest] = state.locals[bc.sources[0]]
             else:
                 raise NotImplementedError(f"Unsupported bytecode: {bc}")
+
+            if registers and bc.dest is not None and bc.opr not in NATIVE_REGISTER_OPRS:
+                state.store(bc.dest)
         else:  # The incredibly rare for-else statement!
             result = AnalysisResultValue.Maybe
 
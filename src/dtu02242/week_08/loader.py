@@ -0,0 +1,98 @@
+"""
+Bulk loading of decompiled trees over a process pool.
+
+Reading and decoding the files is fanned out over worker processes in
+batches, and the classes are handed back one by one as their batch
+completes, so the caller can start using the first classes while the rest
+of the tree is still loading. The workers send class images back (see
+class_image.py), the parent only decodes the index of every class and
+leaves the method bodies until they are used.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Iterable, Iterator, Optional, Tuple, Type
+import hashlib
+import json
+import os
+import sys
+import time
+
+if __name__ == "__main__":
+    from parser import JsonDict, JavaClass, JavaProgram, index_class_files
+    from class_image import build_class_image, read_class_image
+else:
+    from dtu02242.week_08.parser import JsonDict, JavaClass, JavaProgram, index_class_files
+    from dtu02242.week_08.class_image import build_class_image, read_class_image
+
+
+@dataclass
+class LoadStats:
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    def files_per_second(self) -> float:
+        return self.files / self.seconds if self.seconds > 0 else 0.0
+
+    def megabytes_per_second(self) -> float:
+        return self.bytes / 1e6 / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.files} files ({self.bytes / 1e6:.1f} MB) in {self.seconds:.2f}s, "
+                f"{self.files_per_second():.0f} files/s, {self.megabytes_per_second():.1f} MB/s")
+
+
+def _load_batch(file_names: List[str]) -> List[Tuple[bytes, int]]:
+    # Runs in the worker processes. Classes are sent back as class images, so
+    # the parent only decodes the index of a class and not all of its methods
+    results = []
+    for file_name in file_names:
+        with open(file_name, "rb") as fp:
+            content = fp.read()
+        stat = os.stat(file_name)
+        source = (stat.st_mtime_ns, stat.st_size, hashlib.sha1(content).digest())
+        results.append((build_class_image(json.loads(content), source), len(content)))
+    return results
+
+
+def load_classes_parallel(file_names: Iterable[str],
+                          max_workers: Optional[int]=None,
+                          batch_size: int=32,
+                          java_class_type: Type[JavaClass]=JavaClass,
+                          stats: Optional[LoadStats]=None) -> Iterator[JavaClass]:
+    '''
+    Load jvm2json files over a process pool and yield the classes as they
+    complete, in no particular order. The classes are class images of
+    java_class_type, only their indices are decoded here and method bodies
+    are decoded on first use. Throughput is accumulated into stats if given.
+    '''
+    stats = stats if stats is not None else LoadStats()
+    file_names = [str(file_name) for file_name in file_names]
+    batches = [file_names[i:i + batch_size] for i in range(0, len(file_names), batch_size)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_load_batch, batch) for batch in batches]
+        for future in as_completed(futures):
+            for image_bytes, size in future.result():
+                stats.files += 1
+                stats.bytes += size
+                stats.seconds = time.perf_counter() - start
+                yield read_class_image(image_bytes, java_class_type=java_class_type)
+
+
+def load_program_parallel(root_dir: Path,
+                          max_workers: Optional[int]=None,
+                          java_class_type: Type[JavaClass]=JavaClass,
+                          stats: Optional[LoadStats]=None) -> JavaProgram:
+    '''Load every class under a decompiled root directory into a JavaProgram'''
+    file_names = index_class_files(Path(root_dir)).values()
+    return JavaProgram(load_classes_parallel(file_names, max_workers,
+                                             java_class_type=java_class_type,
+                                             stats=stats))
+
+
+if __name__ == "__main__":
+    stats = LoadStats()
+    load_program_parallel(Path(sys.argv[1] if len(sys.argv) > 1 else "course-02242-examples/decompiled"), stats=stats)
+    print(stats)
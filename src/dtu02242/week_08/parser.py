@@ -1,29 +1,45 @@
 from pathlib import Path
-from typing import List, Dict, Any, Iterable, Optional, Type
+from typing import List, Dict, Any, Iterable, Optional, Type, Tuple, Callable, TypeVar
 from glob import glob
 
+from dtu02242.jvm.method_table import MethodTable, get_invoke_descriptor, get_method_descriptor
+from dtu02242.jvm.program import index_class_files
+from dtu02242.jvm import program
+
 
 JsonTypes = str | bool | float | List['JsonTypes']
 JsonDict = Dict[str, 'JsonDict | JsonTypes' ]
 
-class JavaClass:
+Instruction = TypeVar("Instruction")
+
+class JavaClass(MethodTable):
     name: str
     json_dict: JsonDict
+    _instructions: Dict[Tuple[Any, ...], Tuple[Any, ...]]
 
     def __init__(self, json_dict: JsonDict) -> None:
         self.name = json_dict['name']
         self.json_dict = json_dict
+        self._instructions = {}
 
     def get_methods(self) -> List[JsonDict]:
         methods: List[JsonDict] = self.json_dict["methods"]
         return methods
-    
-    def get_method(self, name: str) -> JsonDict:
-        methods = self.get_methods()
-        for method in methods:
-            if method["name"] == name:
-                return method
-        raise Exception("Method {name} not found in {self}")
+
+    def get_instructions(self, name: str, decoder: Callable[[JsonDict], Instruction], descriptor: Optional[str] = None) -> Tuple[Instruction, ...]:
+        '''Decode the bytecode of a method once, and return the cached instruction array after that'''
+        key = (name, descriptor, decoder)
+        instructions = self._instructions.get(key)
+        if instructions is None:
+            method = self.get_method(name, descriptor)
+            # Lookups with and without a descriptor share the array of the method they resolve to
+            method_key = (id(method), decoder)
+            instructions = self._instructions.get(method_key)
+            if instructions is None:
+                instructions = tuple(decoder(json_doc) for json_doc in method["code"]["bytecode"])
+                self._instructions[method_key] = instructions
+            self._instructions[key] = instructions
+        return instructions
     
     def __str__(self) -> str:
         return f"{self.name}"
@@ -44,6 +60,27 @@ class JavaProgram:
     def __str__(self) -> str:
         return str(self._java_classes)
 
+class LazyJavaProgram(program.LazyJavaProgram):
+    '''
+    The LazyJavaProgram of jvm/program.py, parsing week 8 classes unless told
+    otherwise. With use_images, classes are read through their binary class
+    images (see class_image.py) instead of being parsed from JSON.
+    '''
+
+    def __init__(self,
+                 root_dir: Path,
+                 max_classes: int=1024,
+                 java_class_type: Type[JavaClass]=JavaClass,
+                 use_images: bool=False) -> None:
+        super().__init__(root_dir, java_class_type, max_classes)
+        self._use_images = use_images
+
+    def load_class(self, path: Path) -> JavaClass:
+        if self._use_images:
+            from .class_image import load_class_image
+            return load_class_image(path, self._java_class_type)
+        return super().load_class(path)
+
 def find_files_by_type(root_dir: Path, file_type: str) -> List[str]:
     '''Get the str path of all files in a given root directory of a given file type'''
     file_names = glob(f"{root_dir}/**/*.{file_type}", recursive=True)